@@ -20,6 +20,7 @@ import {
   CarIcon,
   ShoppingBagIcon,
 } from 'lucide-react';
+import { authHeaders } from '../api/auth';
 
 ChartJS.register(
   CategoryScale,
@@ -95,7 +96,9 @@ export default function DashboardPage() {
         console.log('Fetching activities for logged-in user:', userId); // Debug log
         
         const API_BASE = 'https://green-nexus-1.onrender.com/';
-        const response = await fetch(`${API_BASE}/api/activities/${userId}`);
+        const response = await fetch(`${API_BASE}/api/activities/${userId}`, {
+          headers: authHeaders(),
+        });
         
         if (!response.ok) {
           throw new Error(`HTTP error! status: ${response.status}`);
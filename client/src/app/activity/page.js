@@ -10,6 +10,7 @@ import {
 } from 'lucide-react';
 import Card from '../components/common/Card';
 import { useAuth } from '../../context/AuthContext'; // Import useAuth hook
+import { authHeaders, rememberWrite } from '../api/auth';
 
 const ActivityPage = () => {
   const [sidebarOpen, setSidebarOpen] = useState(false);
@@ -125,7 +126,9 @@ const ActivityPage = () => {
 
     try {
       setLoading(true);
-      const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/activities/${userId}?limit=10`);
+      const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/activities/${userId}?limit=10`, {
+        headers: authHeaders(),
+      });
       if (!response.ok) throw new Error('Failed to fetch activities');
       
       const data = await response.json();
@@ -160,7 +163,9 @@ const ActivityPage = () => {
       return;
     }
     try {
-      const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/activities/weekly-stats/${userId}`);
+      const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/activities/weekly-stats/${userId}`, {
+        headers: authHeaders(),
+      });
       if (!response.ok) throw new Error('Failed to fetch weekly stats');
       
       const data = await response.json();
@@ -239,9 +244,9 @@ const ActivityPage = () => {
 
       const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/activities/log`, {
         method: 'POST',
-        headers: {
+        headers: authHeaders({
           'Content-Type': 'application/json',
-        },
+        }),
         body: JSON.stringify({
           user_id: userId,
           activity_type: activityType,
@@ -251,6 +256,7 @@ const ActivityPage = () => {
           notes,
         }),
       });
+      rememberWrite(response);
 
       const data = await response.json();
 
@@ -338,9 +344,9 @@ const ActivityPage = () => {
 
       const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/activities/${userId}/${editingActivityId}`, {
         method: 'PUT',
-        headers: {
+        headers: authHeaders({
           'Content-Type': 'application/json',
-        },
+        }),
         body: JSON.stringify({
           activity_type: editActivityType,
           quantity: parseFloat(editQuantity),
@@ -348,6 +354,7 @@ const ActivityPage = () => {
           notes: editNotes,
         }),
       });
+      rememberWrite(response);
 
       const data = await response.json();
 
@@ -389,7 +396,9 @@ const ActivityPage = () => {
       setLoading(true);
       const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/activities/${userId}/${activityId}`, {
         method: 'DELETE',
+        headers: authHeaders(),
       });
+      rememberWrite(response);
 
       if (!response.ok) throw new Error('Failed to delete activity');
 
@@ -0,0 +1,21 @@
+// client/src/app/api/auth.js
+// Read-your-writes: after a write the API names the time until which this client's reads must go to the primary database
+const PRIMARY_UNTIL = 'X-Read-Primary-Until';
+
+// Headers for requests to the Flask API, with the bearer token saved at login
+export function authHeaders(headers = {}) {
+  if (typeof window === 'undefined') return headers;
+  const result = { ...headers };
+  const token = localStorage.getItem('access_token');
+  if (token) result.Authorization = `Bearer ${token}`;
+  const primaryUntil = sessionStorage.getItem(PRIMARY_UNTIL);
+  if (primaryUntil) result[PRIMARY_UNTIL] = primaryUntil;
+  return result;
+}
+
+// Keep the API's read-your-writes deadline from a write's response, for the next requests
+export function rememberWrite(response) {
+  const primaryUntil = response.headers.get(PRIMARY_UNTIL);
+  if (primaryUntil && typeof window !== 'undefined') sessionStorage.setItem(PRIMARY_UNTIL, primaryUntil);
+  return response;
+}
@@ -10,12 +10,14 @@ import {
 } from 'lucide-react';
 import Card from '../components/common/Card';
 import Button from '../components/common/Button';
+import { authHeaders, rememberWrite } from '../api/auth';
 
 const WasteScannerPage = () => {
   const [image, setImage] = useState(null);
   const [isDragging, setIsDragging] = useState(false);
   const [isAnalyzing, setIsAnalyzing] = useState(false);
   const [results, setResults] = useState(null);
+  const [delayedMessage, setDelayedMessage] = useState(null); // analysis queued for a retry by the backend
   const [originalFile, setOriginalFile] = useState(null); // Added to store the original file
   const [recentlyScanned, setRecentlyScanned] = useState([]);
   const [recentlyScannedLoading, setRecentlyScannedLoading] = useState(false);
@@ -30,9 +32,9 @@ const WasteScannerPage = () => {
       // Use the environment variable for the backend URL
       const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/waste-scanner/recent`, {
         method: 'GET',
-        headers: {
+        headers: authHeaders({
           'Content-Type': 'application/json',
-        },
+        }),
       });
 
       if (!response.ok) {
@@ -101,6 +103,7 @@ const WasteScannerPage = () => {
       if (ev.target?.result) {
         setImage(ev.target.result);
         setResults(null);
+        setDelayedMessage(null);
         setOriginalFile(file); // Store the original file
       }
     };
@@ -120,8 +123,10 @@ const WasteScannerPage = () => {
       // Use the environment variable for the backend URL
       const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/waste-scanner/upload`, {
         method: 'POST',
+        headers: authHeaders(),
         body: formData,
       });
+      rememberWrite(response);
 
       if (!response.ok) {
         const errorData = await response.json().catch(() => ({})); // Handle potential JSON parse errors
@@ -130,6 +135,13 @@ const WasteScannerPage = () => {
 
       const data = await response.json();
 
+      // 202: the image was saved but its analysis failed; the backend retries it and it shows up in the scan history
+      if (data.queued) {
+        setDelayedMessage(data.message || 'Image analysis is delayed; it will be retried automatically');
+        return;
+      }
+      setDelayedMessage(null);
+
       // Transform the backend response to match your frontend format
       // The backend returns fields like waste_type, recyclability, recycling_instructions, etc.
       const transformedResults = {
@@ -161,6 +173,7 @@ const WasteScannerPage = () => {
   const handleReset = () => {
     setImage(null);
     setResults(null);
+    setDelayedMessage(null);
     setOriginalFile(null); // Reset the original file state
     if (fileInputRef.current) {
       fileInputRef.current.value = '';
@@ -359,12 +372,14 @@ const WasteScannerPage = () => {
                 <AlertTriangleIcon size={32} className="text-gray-400" />
               </div>
 
-              <h3 className="text-lg font-medium text-gray-700 mb-2">No Analysis Yet</h3>
+              <h3 className="text-lg font-medium text-gray-700 mb-2">{delayedMessage ? 'Analysis Delayed' : 'No Analysis Yet'}</h3>
               <p className="text-gray-600 text-center max-w-xs mb-6">
-                Upload an image and click &quot;Analyze&quot; to get recycling information and disposal tips.
+                {delayedMessage
+                  ? `${delayedMessage}. The result will appear in your recently scanned items.`
+                  : <>Upload an image and click &quot;Analyze&quot; to get recycling information and disposal tips.</>}
               </p>
 
-              {image && (
+              {image && !delayedMessage && (
                 <Button onClick={handleAnalyze} disabled={isAnalyzing}>
                   {isAnalyzing ? 'Analyzing...' : 'Analyze Image'}
                 </Button>
@@ -412,19 +427,20 @@ const WasteScannerPage = () => {
                 const recyclabilityInfo = getRecyclabilityInfo(item.recyclability); // Now handles string values like "Recyclable", "Non-recyclable"
                 return (
                   <div key={item.id || index} className="border border-neutral-gray rounded-lg p-4 hover:shadow-md transition-shadow">
-                    {/* Image - Currently, the backend doesn't return the full image URL */}
+                    {/* Image - small cached thumbnail served by the backend */}
                     <div className="mb-3">
-                      {/* The backend returns 'filepath' which is server-side. You might need to serve these images via a static route. */}
-                      {/* For now, show a placeholder */}
-                      <div className="w-full h-32 flex items-center justify-center bg-gray-100 rounded-md">
-                        <ImageIcon size={32} className="text-gray-400" />
-                      </div>
-                      {/* Optional: If you serve images via a route like http://localhost:5000/uploads/<filename>, you could use: */}
-                      {/* <img
-                        src={`http://localhost:5000/uploads/${item.filename}`} // Adjust base URL and path as needed
-                        alt={`Scanned item ${index + 1}`}
-                        className="w-full h-32 object-cover rounded-md"
-                      /> */}
+                      {item.thumbnail_url ? (
+                        <img
+                          src={`${process.env.NEXT_PUBLIC_API_URL}${item.thumbnail_url}`}
+                          alt={`Scanned item ${index + 1}`}
+                          loading="lazy"
+                          className="w-full h-32 object-cover rounded-md"
+                        />
+                      ) : (
+                        <div className="w-full h-32 flex items-center justify-center bg-gray-100 rounded-md">
+                          <ImageIcon size={32} className="text-gray-400" />
+                        </div>
+                      )}
                     </div>
 
                     {/* Waste Type */}
@@ -1,16 +1,20 @@
+import logging
 import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-from flask_migrate import Migrate
+
+from app.utils.database import RoutingSession
+
+logger = logging.getLogger(__name__)
 
 # ----------------------------------------------------------------------
 # Extensions (global)
 # ----------------------------------------------------------------------
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})  # routes GET reads to the replica, if any
 jwt = JWTManager()
-migrate = Migrate()  # ✅ define migrate globally for flask db commands
+migrate = None  # Flask-Migrate, set up by create_app for `flask` CLI invocations only
 
 # ----------------------------------------------------------------------
 # Import models (SQLAlchemy must see them)
@@ -21,15 +25,28 @@ from app.models.activity import Activity
 # from app.models.product import Product
 
 
+def _init_migrate(app):
+    global migrate
+    from flask_migrate import Migrate
+
+    if migrate is None:
+        migrate = Migrate()
+    migrate.init_app(app, db)
+
+
 def create_app(config_name='development'):
     app = Flask(__name__)
 
     # -------------------------- CONFIG --------------------------
     try:
-        from config import Config
-        app.config.from_object(Config)
+        from config import config_by_name
+        config_class = config_by_name.get(config_name)
+        if config_class is None:
+            logger.warning("Unknown config %r, using production settings", config_name)
+            config_class = config_by_name['production']
+        app.config.from_object(config_class)
     except ImportError:
-        print("config.py not found! Using fallback.")
+        logger.warning("config.py not found! Using fallback.")
 
         class FallbackConfig:
             SECRET_KEY = os.getenv('SECRET_KEY') or 'fallback-secret'
@@ -49,14 +66,40 @@ def create_app(config_name='development'):
             SQLALCHEMY_DATABASE_URI = db_url
             UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
             os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+            MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+            MAX_CONTENT_LENGTH = MAX_UPLOAD_BYTES + 64 * 1024
 
         app.config.from_object(FallbackConfig)
 
+    # -------------------------- LOGGING --------------------------
+    from app.utils.log import configure_logging, init_request_logging
+    configure_logging(app.config)
+    init_request_logging(app)
+
+    # -------------------------- PROXY --------------------------
+    # remote_addr = the address the trusted proxies saw, not a client-supplied X-Forwarded-For entry
+    if app.config.get('PROXY_FIX_X_FOR'):
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+
     # -------------------------- EXTENSIONS --------------------------
     db.init_app(app)
-    migrate.init_app(app, db)  # ✅ initialize globally defined migrate here
+
+    from app.utils.database import configure_engines, init_read_replica
+    configure_engines(app)
+
+    from app.utils.metrics import init_metrics
+    init_metrics(app)  # request, SQL and pool-wait metrics at GET /metrics
+    init_read_replica(app)  # before authentication, so identity lookups can read from the replica
+
+    # Flask-Migrate imports Alembic (~130 ms of a cold start); only `flask db ...` needs it
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        _init_migrate(app)
     jwt.init_app(app)
 
+    from app.utils.auth import init_auth
+    init_auth(app)
+
     # -------------------------- CORS --------------------------
     CORS(
         app,
@@ -70,52 +113,67 @@ def create_app(config_name='development'):
                 "*"
             ],
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"],
+            "allow_headers": ["Content-Type", "Authorization", "X-Read-Primary-Until"],
+            "expose_headers": ["X-Read-Primary-Until"],
             "supports_credentials": True,
             "max_age": 3600
         }}
     )
 
     # -------------------------- BLUEPRINTS --------------------------
-    print("\nRegistering API Blueprints...")
+    logger.info("Registering API blueprints")
 
     def _register(bp, prefix, name):
         try:
             app.register_blueprint(bp, url_prefix=prefix)
-            print(f"{name} API → {prefix}")
-        except Exception as e:
-            print(f"{name} failed: {e}")
+            logger.info("%s API → %s", name, prefix)
+        except Exception:
+            logger.exception("%s blueprint registration failed", name)
 
     # Auth
     try:
         from app.routes.auth import auth_bp
         _register(auth_bp, '/api/auth', 'Auth')
-    except ImportError as e:
-        print(f"Auth import failed: {e}")
+    except ImportError:
+        logger.exception("Auth import failed")
 
     # Activities
     try:
         from app.routes.activities import activities_bp
         _register(activities_bp, '/api/activities', 'Activities')
-    except ImportError as e:
-        print(f"Activities import failed: {e}")
+    except ImportError:
+        logger.exception("Activities import failed")
+
+    # Dashboard (all sections of the dashboard page in one request)
+    try:
+        from app.routes.dashboard import dashboard_bp
+        _register(dashboard_bp, '/api/dashboard', 'Dashboard')
+    except ImportError:
+        logger.exception("Dashboard import failed")
 
     # Waste Scanner
     try:
         from app.routes.waste_scanner import waste_scanner_bp
         _register(waste_scanner_bp, '/api/waste-scanner', 'Waste Scanner')
     except ImportError:
-        print("Waste Scanner not configured")
+        logger.warning("Waste Scanner not configured")
 
     # Marketplace
     try:
         from app.routes.marketplace import marketplace_bp
         app.register_blueprint(marketplace_bp)
-        print("Marketplace API registered")
-    except ImportError as e:
-        print(f"Marketplace missing: {e}")
+        logger.info("Marketplace API registered")
+    except ImportError:
+        logger.exception("Marketplace import failed")
+
+    # Admin (failed-scan queue)
+    try:
+        from app.routes.admin import admin_bp
+        _register(admin_bp, '/api/admin', 'Admin')
+    except ImportError:
+        logger.exception("Admin import failed")
 
-    print("Blueprint registration complete!\n")
+    logger.info("Blueprint registration complete")
 
     # -------------------------- ERROR HANDLERS --------------------------
     @app.errorhandler(400)
@@ -138,16 +196,36 @@ def create_app(config_name='development'):
     def method_not_allowed(error):
         return {"error": "Method not allowed", "message": str(error)}, 405
 
+    @app.errorhandler(413)
+    def payload_too_large(error):
+        return {"error": "Payload too large", "message": str(error)}, 413
+
     @app.errorhandler(500)
     def internal_server_error(error):
-        app.logger.error(f"Internal server error: {str(error)}")
+        logger.error("Internal server error: %s", error)
         return {"error": "Internal server error", "message": "An unexpected error occurred. Please try again later."}, 500
 
     @app.errorhandler(Exception)
     def handle_exception(error):
-        app.logger.error(f"Unhandled exception: {str(error)}", exc_info=True)
+        logger.error("Unhandled exception: %s", error, exc_info=True)
         return {"error": "Internal server error", "message": "An unexpected error occurred. Please try again later."}, 500
 
+    # -------------------------- CLI & BACKGROUND JOBS --------------------------
+    from app.cli import register_commands
+    register_commands(app)
+
+    from app.services.upload_sweeper import start_background_sweeper
+    start_background_sweeper(app)
+
+    from app.services.scan_retry_service import start_background_retry_worker
+    start_background_retry_worker(app)
+
+    from app.services.rate_limiter import init_rate_limiter
+    init_rate_limiter(app)
+
+    from app.services.ai_usage import init_usage_accounting
+    init_usage_accounting(app)
+
     # -------------------------- ROOT ROUTE --------------------------
     @app.route('/')
     def welcome():
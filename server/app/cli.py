@@ -0,0 +1,111 @@
+# server/app/cli.py
+"""Maintenance commands, available as ``flask <command>`` (or ``python manage.py <command>``)."""
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+def register_commands(app):
+    app.cli.add_command(sweep_uploads)
+    app.cli.add_command(search_reindex)
+    app.cli.add_command(retry_failed_scans)
+    app.cli.add_command(load_catalog)
+    app.cli.add_command(rollup_ai_usage)
+    app.cli.add_command(provision_users)
+
+
+@click.command('sweep-uploads')
+@click.option('--batches', type=int, default=None, help='Stop after this many batches (default: one full pass).')
+@click.option('--batch-size', type=int, default=None, help='Files examined per batch.')
+@click.option('--retention-days', type=int, default=None, help='Delete images not scanned for this long (0 = keep).')
+@click.option('--thumbnail-after-days', type=int, default=None,
+              help='Replace originals not scanned for this long with a thumbnail (0 = never).')
+@click.option('--dry-run', is_flag=True, help='Report what would be removed without deleting anything.')
+@with_appcontext
+def sweep_uploads(batches, batch_size, retention_days, thumbnail_after_days, dry_run):
+    """Delete orphaned and expired uploads, and downsize old originals."""
+    from app.services.upload_sweeper import UploadSweeper
+
+    sweeper = UploadSweeper.from_config(
+        current_app,
+        batch_size=batch_size,
+        retention_days=retention_days,
+        thumbnail_after_days=thumbnail_after_days,
+        dry_run=dry_run,
+    )
+    stats = sweeper.sweep_all(max_batches=batches)
+    for name, value in stats.to_dict().items():
+        click.echo(f"{name}: {value}")
+
+
+@click.command('search-reindex')
+@with_appcontext
+def search_reindex():
+    """Create the waste-scan full-text index if missing and re-index all rows."""
+    from app.services.search_service import rebuild_search_index
+
+    rebuild_search_index()
+    click.echo("Search index rebuilt.")
+
+
+@click.command('retry-failed-scans')
+@click.option('--batch-size', type=int, default=None, help='Scans retried in this run.')
+@click.option('--all', 'retry_all', is_flag=True, help='Keep going until no scan is due.')
+@with_appcontext
+def retry_failed_scans(batch_size, retry_all):
+    """Retry failed scans whose backoff has elapsed."""
+    from app.services.scan_retry_service import process_due_scans
+
+    batch_size = batch_size or current_app.config.get('SCAN_RETRY_BATCH_SIZE', 5)
+    while True:
+        summary = process_due_scans(batch_size)
+        click.echo(', '.join(f"{name}: {value}" for name, value in summary.items()))
+        if not retry_all or summary['skipped'] or not summary['claimed']:
+            break
+
+
+@click.command('load-catalog')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--replace', is_flag=True, help='Delete products that are not in the file.')
+@with_appcontext
+def load_catalog(path, replace):
+    """Bulk insert/update marketplace products from a JSON or CSV file."""
+    from app.services.marketplace_service import load_catalog as load, parse_catalog
+
+    with open(path, encoding='utf-8') as fh:
+        records = parse_catalog(fh.read(), filename=path)
+    try:
+        summary = load(records, replace=replace)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(', '.join(f"{name}: {value}" for name, value in summary.items()))
+
+
+@click.command('rollup-ai-usage')
+@with_appcontext
+def rollup_ai_usage():
+    """Fold AI usage events of past days into the daily rollup table."""
+    from app.services.ai_usage import UsageRecorder
+
+    click.echo(f"rolled_up: {UsageRecorder().rollup()}")
+
+
+@click.command('provision-users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@with_appcontext
+def provision_users(path):
+    """Create the users in a JSON or CSV file (name,email[,password]) in one transaction."""
+    from app.services.auth_service import ProvisioningError, parse_user_records, provision_users as provision
+
+    with open(path, encoding='utf-8') as fh:
+        records = parse_user_records(fh.read(), filename=path)
+    try:
+        created = provision(records)
+    except ProvisioningError as e:
+        raise click.ClickException('No users were created:\n' + '\n'.join(e.errors))
+    for user in created:
+        line = f"{user['id']}\t{user['username']}\t{user['email']}"
+        if 'temporary_password' in user:
+            line += f"\t{user['temporary_password']}"
+        click.echo(line)
+    click.echo(f"created: {len(created)}")
@@ -1,22 +1,51 @@
 # server/app/models/__init__.py
 # Import all models here so db.create_all() finds them
+import logging
+
 from .user import User
 from .activity import Activity
 
+logger = logging.getLogger(__name__)
+
 # Try to import optional models
 try:
     from .products import Product
 except ImportError:
-    print("⚠️  Product model not found, skipping...")
+    logger.warning("Product model not found, skipping...")
     Product = None
 
 try:
     from .waste_item import WasteItem
 except ImportError:
-    print("⚠️  WasteItem model not found, skipping...")
+    logger.warning("WasteItem model not found, skipping...")
     WasteItem = None
 
+try:
+    from .failed_scan import FailedScan, DeadLetterScan
+except ImportError:
+    logger.warning("FailedScan model not found, skipping...")
+    FailedScan = DeadLetterScan = None
+
+try:
+    from .chat_cache import ChatCacheEntry
+except ImportError:
+    logger.warning("ChatCacheEntry model not found, skipping...")
+    ChatCacheEntry = None
+
+try:
+    from .usage_counter import UsageCounter
+except ImportError:
+    logger.warning("UsageCounter model not found, skipping...")
+    UsageCounter = None
+
+try:
+    from .ai_usage import AIUsageEvent, AIUsageDaily
+except ImportError:
+    logger.warning("AIUsage models not found, skipping...")
+    AIUsageEvent = AIUsageDaily = None
+
 # If you add more models later, import them here too
 # from .other_model import OtherModel
 
-__all__ = ['User', 'Activity', 'Product', 'WasteItem']
\ No newline at end of file
+__all__ = ['User', 'Activity', 'Product', 'WasteItem', 'FailedScan', 'DeadLetterScan', 'ChatCacheEntry', 'UsageCounter',
+           'AIUsageEvent', 'AIUsageDaily']
\ No newline at end of file
@@ -0,0 +1,42 @@
+from app import db
+from datetime import datetime
+
+class AIUsageEvent(db.Model):
+    """One OpenAI call. Append-only; rolled up into ai_usage_daily once its day is over"""
+    __tablename__ = 'ai_usage_events'
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    endpoint = db.Column(db.String(30), nullable=False)  # "chat", "upload", "scan_retry"
+    model = db.Column(db.String(50))
+    subject = db.Column(db.String(100))  # "user:42", "ip:203.0.113.7"
+    prompt_tokens = db.Column(db.Integer, nullable=False, default=0)
+    completion_tokens = db.Column(db.Integer, nullable=False, default=0)
+    latency_ms = db.Column(db.Integer, nullable=False, default=0)
+    outcome = db.Column(db.String(40), nullable=False, default='ok')  # "ok", "cancelled" or an error class
+    cost_usd = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<AIUsageEvent {self.endpoint} {self.model} {self.outcome}>'
+
+
+class AIUsageDaily(db.Model):
+    """AI usage of one day, per endpoint, model and client"""
+    __tablename__ = 'ai_usage_daily'
+    __table_args__ = (db.UniqueConstraint('day', 'endpoint', 'model', 'subject', name='uq_ai_usage_daily'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)  # UTC
+    endpoint = db.Column(db.String(30), nullable=False)
+    model = db.Column(db.String(50))
+    subject = db.Column(db.String(100))
+    calls = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Integer, nullable=False, default=0)
+    prompt_tokens = db.Column(db.BigInteger, nullable=False, default=0)
+    completion_tokens = db.Column(db.BigInteger, nullable=False, default=0)
+    cost_usd = db.Column(db.Float, nullable=False, default=0.0)
+    latency_counts = db.Column(db.JSON, nullable=False)  # LatencyHistogram bucket counts
+    latency_sum = db.Column(db.Float, nullable=False, default=0.0)  # seconds
+
+    def __repr__(self):
+        return f'<AIUsageDaily {self.day} {self.endpoint} {self.model}>'
@@ -0,0 +1,15 @@
+from app import db
+from datetime import datetime
+
+class ChatCacheEntry(db.Model):
+    """A cached marketplace chat answer, keyed by the normalized query"""
+    __tablename__ = 'chat_cache_entries'
+
+    key_hash = db.Column(db.String(64), primary_key=True)  # SHA-256 of the normalized key
+    normalized_key = db.Column(db.String(500), nullable=False)  # e.g. "kw:bottle eco water"
+    response = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<ChatCacheEntry {self.normalized_key}>'
@@ -0,0 +1,77 @@
+from app import db
+from datetime import datetime
+from sqlalchemy.orm import declared_attr
+
+class _ScanFailureMixin:
+    """Columns shared by the retry queue and the dead-letter table"""
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    filepath = db.Column(db.String(500), nullable=False)
+    original_name = db.Column(db.String(255))
+    storage_key = db.Column(db.String(255), index=True)
+    content_hash = db.Column(db.String(64))
+
+    @declared_attr
+    def user_id(cls):
+        return db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+
+    error_class = db.Column(db.String(100), nullable=False)  # e.g. APITimeoutError, RateLimitError
+    error_message = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def upload_fields(self):
+        """The fields needed to re-run the analysis"""
+        return {
+            'filename': self.filename,
+            'filepath': self.filepath,
+            'original_name': self.original_name,
+            'storage_key': self.storage_key,
+            'content_hash': self.content_hash,
+            'user_id': self.user_id,
+        }
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'original_name': self.original_name,
+            'content_hash': self.content_hash,
+            'user_id': self.user_id,
+            'error_class': self.error_class,
+            'error_message': self.error_message,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+        }
+
+
+class FailedScan(_ScanFailureMixin, db.Model):
+    """A scan whose AI analysis failed and is waiting to be retried"""
+    __tablename__ = 'failed_scans'
+
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    last_attempt_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<FailedScan {self.id}: {self.error_class} x{self.attempts}>'
+
+    def to_dict(self):
+        data = super().to_dict()
+        data['next_attempt_at'] = self.next_attempt_at.isoformat() if self.next_attempt_at else None
+        data['last_attempt_at'] = self.last_attempt_at.isoformat() if self.last_attempt_at else None
+        return data
+
+
+class DeadLetterScan(_ScanFailureMixin, db.Model):
+    """A scan that exhausted its retries (or failed permanently) and needs a human"""
+    __tablename__ = 'dead_letter_scans'
+
+    dead_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<DeadLetterScan {self.id}: {self.error_class}>'
+
+    def to_dict(self):
+        data = super().to_dict()
+        data['dead_at'] = self.dead_at.isoformat() if self.dead_at else None
+        return data
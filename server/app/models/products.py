@@ -0,0 +1,38 @@
+# server/app/models/products.py
+from app import db
+from datetime import datetime
+
+class Product(db.Model):
+    """An eco-friendly product in the marketplace catalog"""
+    __tablename__ = 'products'
+
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(120), unique=True, nullable=False)  # stable key for catalog imports
+    name = db.Column(db.String(200), nullable=False)
+    category = db.Column(db.String(100), nullable=False, index=True)  # e.g. water bottles, solar lighting
+    description = db.Column(db.Text)
+    eco_score = db.Column(db.Float)  # 0-10
+    price_min_ksh = db.Column(db.Integer)
+    price_max_ksh = db.Column(db.Integer)
+    retailers = db.Column(db.JSON, nullable=False, default=list)  # e.g. ["Jumia", "Carrefour"]
+    certifications = db.Column(db.JSON, nullable=False, default=list)  # e.g. ["Fair Trade", "B Corp"]
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<Product {self.slug}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'slug': self.slug,
+            'name': self.name,
+            'category': self.category,
+            'description': self.description,
+            'eco_score': self.eco_score,
+            'price_min_ksh': self.price_min_ksh,
+            'price_max_ksh': self.price_max_ksh,
+            'retailers': list(self.retailers or []),
+            'certifications': list(self.certifications or []),
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+        }
@@ -0,0 +1,29 @@
+from app import db
+from datetime import datetime
+
+class UsageCounter(db.Model):
+    """Daily AI usage of one client on one endpoint, summed over all workers"""
+    __tablename__ = 'ai_usage_counters'
+    __table_args__ = (db.UniqueConstraint('subject', 'endpoint', 'day', name='uq_ai_usage_counter'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(100), nullable=False)  # "user:42" or "ip:203.0.113.7"
+    endpoint = db.Column(db.String(50), nullable=False)  # "chat", "upload"
+    day = db.Column(db.Date, nullable=False, index=True)  # UTC
+    requests = db.Column(db.Integer, nullable=False, default=0)
+    tokens = db.Column(db.Integer, nullable=False, default=0)
+    cost_usd = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'subject': self.subject,
+            'endpoint': self.endpoint,
+            'day': self.day.isoformat(),
+            'requests': self.requests,
+            'tokens': self.tokens,
+            'cost_usd': round(self.cost_usd, 6)
+        }
+
+    def __repr__(self):
+        return f'<UsageCounter {self.subject} {self.endpoint} {self.day}>'
@@ -1,6 +1,6 @@
 # server/app/models/user.py
 from app import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.utils.passwords import get_password_hasher
 from datetime import datetime
 
 class User(db.Model):
@@ -24,15 +24,21 @@ class User(db.Model):
 
     def set_password(self, password):
         """
-        Hashes the password and stores the hash.
+        Hashes the password with the configured method and stores the hash.
         """
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = get_password_hasher().hash(password)
 
     def check_password(self, password):
         """
         Checks if the provided password matches the stored hash.
         """
-        return check_password_hash(self.password_hash, password)
+        return get_password_hasher().verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        """
+        True when the stored hash was made with other settings than the configured ones.
+        """
+        return get_password_hasher().needs_rehash(self.password_hash)
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -1,13 +1,26 @@
 from app import db
 from datetime import datetime
+from flask import current_app
+from sqlalchemy import event
+import hashlib
+import hmac
 
 class WasteItem(db.Model):
     __tablename__ = 'waste_items'
+    __table_args__ = (
+        # Keyset pagination walks (created_at, id) newest-first, optionally per user/filter
+        db.Index('ix_waste_items_created_at_id', 'created_at', 'id'),
+        db.Index('ix_waste_items_user_created_at', 'user_id', 'created_at', 'id'),
+        db.Index('ix_waste_items_waste_type_created_at', 'waste_type', 'created_at'),
+        db.Index('ix_waste_items_recyclability_created_at', 'recyclability', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)  # Original filename
     filepath = db.Column(db.String(500), nullable=False)  # Path to stored image
     original_name = db.Column(db.String(255))  # User's original filename
+    storage_key = db.Column(db.String(255))  # Key in the upload store (content-addressed)
+    content_hash = db.Column(db.String(64))  # SHA-256 of the uploaded image
     
     # AI Analysis Results
     waste_type = db.Column(db.String(100))  # e.g., plastic, paper, glass, metal, organic
@@ -23,12 +36,26 @@ class WasteItem(db.Model):
     def __repr__(self):
         return f'<WasteItem {self.filename}>'
     
+    def image_signature(self):
+        """HMAC of the item id: only URLs handed out by the API open the image (ids are sequential)"""
+        key = current_app.config['SECRET_KEY'].encode()
+        return hmac.new(key, f'waste-image:{self.id}'.encode(), hashlib.sha256).hexdigest()[:32]
+
+    def image_url(self, size='original'):
+        """Signed URL of the scanned image (the server-side filepath is never exposed)"""
+        if self.id is None:
+            return None
+        if size == 'original':
+            return f'/api/waste-scanner/images/{self.id}?sig={self.image_signature()}'
+        return f'/api/waste-scanner/images/{self.id}/{size}?sig={self.image_signature()}'
+    
     def to_dict(self):
         """Convert the WasteItem object to a dictionary for JSON serialization"""
         return {
             'id': self.id,
             'filename': self.filename,
-            'filepath': self.filepath,
+            'image_url': self.image_url('original'),
+            'thumbnail_url': self.image_url('thumb'),
             'original_name': self.original_name,
             'waste_type': self.waste_type,
             'recyclability': self.recyclability,
@@ -37,4 +64,11 @@ class WasteItem(db.Model):
             'material_composition': self.material_composition,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'user_id': self.user_id
-        }
\ No newline at end of file
+        }
+
+
+@event.listens_for(WasteItem.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    """Full-text index (FTS5 on SQLite, tsvector + GIN on PostgreSQL), kept in sync by the database"""
+    from app.services.search_service import create_search_index
+    create_search_index(connection)
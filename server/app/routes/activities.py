@@ -1,18 +1,21 @@
 # server/app/routes/activities.py
+import logging
 from flask import Blueprint, request, jsonify
 from app import db
-from app.models.user import User
-from app.models.activity import Activity
 from app.services.activity_service import ActivityService
+from app.utils.auth import current_user_id
+from app.utils.helpers import user_required
 from app.constants import ACTIVITY_CONVERSIONS  # ONLY THIS
 
 # ONE BLUEPRINT ONLY
 activities_bp = Blueprint('activities', __name__)
+logger = logging.getLogger(__name__)
 
 # ----------------------------------------------------------------------
 #  PUT /api/activities/<user_id>/<activity_id>
 # ----------------------------------------------------------------------
 @activities_bp.route('/<int:user_id>/<int:activity_id>', methods=['PUT'])
+@user_required
 def update_activity(user_id, activity_id):
     """Update an activity."""
     try:
@@ -34,20 +37,11 @@ def update_activity(user_id, activity_id):
         result, status = ActivityService.update_activity(
             user_id, activity_id, activity_type, quantity, unit, notes
         )
-        if status != 200:
-            return jsonify(result), status
-
-        # Update user stats
-        user = User.query.get(user_id)
-        if user:
-            db.session.commit()
-
-        return jsonify(result), 200
+        return jsonify(result), status
 
     except Exception as e:
         db.session.rollback()
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in update_activity")
         return jsonify({'error': str(e)}), 500
 
 
@@ -61,8 +55,7 @@ def get_activity_types():
         result, status = ActivityService.get_activity_types()
         return jsonify(result), status
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in get_activity_types")
         return jsonify({'error': str(e)}), 500
 
 
@@ -70,6 +63,7 @@ def get_activity_types():
 #  POST /api/activities/log
 # ----------------------------------------------------------------------
 @activities_bp.route('/log', methods=['POST'])
+@user_required
 def log_activity():
     """Log a new activity."""
     try:
@@ -77,30 +71,20 @@ def log_activity():
             return jsonify({'error': 'Request must be JSON'}), 400
 
         data = request.get_json()
-        required = ['user_id', 'activity_type', 'quantity', 'unit', 'category']
+        required = ['activity_type', 'quantity', 'unit', 'category']
         missing = [f for f in required if f not in data]
+        user_id = current_user_id()  # the caller's, or the body's user_id for requests without a token
+        if user_id is None:
+            missing.insert(0, 'user_id')
         if missing:
             return jsonify({'error': f'Missing: {", ".join(missing)}'}), 400
 
-        user_id = data['user_id']
         activity_type = data['activity_type']
         quantity = float(data.get('quantity', 0))
         unit = data['unit']
         category = data['category']
         notes = data.get('notes', '')
 
-        # Auto-create test user
-        user = User.query.get(user_id)
-        if not user:
-            user = User(
-                id=user_id,
-                username=f'user_{user_id}',
-                email=f'user{user_id}@example.com',
-                password='temp'
-            )
-            db.session.add(user)
-            db.session.commit()
-
         # Log via service
         result, status = ActivityService.log_activity(
             user_id, activity_type, quantity, unit, category, notes
@@ -108,17 +92,14 @@ def log_activity():
         if status != 201:
             return jsonify(result), status
 
-        # Update user stats
-        user.total_carbon_saved += result['carbon_saved']
-        user.green_score = min(100, user.total_carbon_saved * 5)
-        db.session.commit()
+        # Update user stats (one UPDATE, without loading the user)
+        ActivityService.add_carbon_saved(user_id, result['carbon_saved'])
 
         return jsonify(result), 201
 
     except Exception as e:
         db.session.rollback()
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in log_activity")
         return jsonify({'error': str(e)}), 500
 
 
@@ -126,6 +107,7 @@ def log_activity():
 #  GET /api/activities/<user_id>
 # ----------------------------------------------------------------------
 @activities_bp.route('/<int:user_id>', methods=['GET'])
+@user_required
 def get_activities(user_id):
     """Get recent activities for a user."""
     try:
@@ -134,8 +116,7 @@ def get_activities(user_id):
         result, status = ActivityService.get_user_activities(user_id, limit, category)
         return jsonify(result), status
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in get_activities")
         return jsonify({'error': str(e)}), 500
 
 
@@ -143,14 +124,14 @@ def get_activities(user_id):
 #  GET /api/activities/weekly-stats/<user_id>
 # ----------------------------------------------------------------------
 @activities_bp.route('/weekly-stats/<int:user_id>', methods=['GET'])
+@user_required
 def get_weekly_stats(user_id):
     """Get weekly stats."""
     try:
         result, status = ActivityService.get_weekly_stats(user_id)
         return jsonify(result), status
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in get_weekly_stats")
         return jsonify({'error': str(e)}), 500
 
 
@@ -158,6 +139,7 @@ def get_weekly_stats(user_id):
 #  DELETE /api/activities/<user_id>/<activity_id>
 # ----------------------------------------------------------------------
 @activities_bp.route('/<int:user_id>/<int:activity_id>', methods=['DELETE'])
+@user_required
 def delete_activity(user_id, activity_id):
     """Delete an activity."""
     try:
@@ -165,19 +147,12 @@ def delete_activity(user_id, activity_id):
         if status != 200:
             return jsonify(result), status
 
-        user = User.query.get(user_id)
-        if user:
-            act = Activity.query.get(activity_id)
-            if act:
-                user.total_carbon_saved = max(0, user.total_carbon_saved - act.carbon_saved)
-                user.green_score = max(0, user.green_score - 5)
-                db.session.commit()
+        ActivityService.remove_carbon_saved(user_id, result['carbon_saved'])
 
         return jsonify(result), 200
     except Exception as e:
         db.session.rollback()
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in delete_activity")
         return jsonify({'error': str(e)}), 500
 
 
@@ -0,0 +1,137 @@
+# server/app/routes/admin.py
+import logging
+from flask import Blueprint, current_app, request, jsonify
+from app.models.failed_scan import FailedScan, DeadLetterScan
+from app.services.ai_usage import get_usage_recorder, usage_report
+from app.services.auth_service import provision_users, ProvisioningError
+from app.services.marketplace_service import load_catalog
+from app.services.scan_retry_service import redrive_dead_letter, retry_scan
+from app.utils.database import reads_primary
+from app.utils.helpers import admin_required
+
+admin_bp = Blueprint('admin', __name__)
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def _page(query, order_column):
+    limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    error_class = request.args.get('error_class')
+    if error_class:
+        query = query.filter_by(error_class=error_class)
+    total = query.count()
+    items = query.order_by(order_column.desc()).offset(offset).limit(limit).all()
+    return [item.to_dict() for item in items], total
+
+@admin_bp.route('/failed-scans', methods=['GET'])
+@reads_primary  # operators act on what they see
+@admin_required
+def list_failed_scans():
+    """Scans waiting to be retried, most recently failed first"""
+    try:
+        items, total = _page(FailedScan.query, FailedScan.id)
+        return jsonify({'success': True, 'data': items, 'total': total}), 200
+    except Exception as e:
+        logger.exception("Error in list_failed_scans")
+        return jsonify({'error': f'Failed to list failed scans: {str(e)}'}), 500
+
+@admin_bp.route('/failed-scans/<int:scan_id>/retry', methods=['POST'])
+@admin_required
+def retry_failed_scan(scan_id):
+    """Retry one queued scan right away instead of waiting for its backoff"""
+    try:
+        scan = FailedScan.query.get(scan_id)
+        if not scan:
+            return jsonify({'error': 'Failed scan not found'}), 404
+        outcome = retry_scan(scan)
+        return jsonify({'success': outcome == 'succeeded', 'outcome': outcome}), 200
+    except Exception as e:
+        logger.exception("Error in retry_failed_scan")
+        return jsonify({'error': f'Retry failed: {str(e)}'}), 500
+
+@admin_bp.route('/dead-letters', methods=['GET'])
+@reads_primary  # operators act on what they see
+@admin_required
+def list_dead_letters():
+    """Scans that exhausted their retries or failed permanently"""
+    try:
+        items, total = _page(DeadLetterScan.query, DeadLetterScan.dead_at)
+        return jsonify({'success': True, 'data': items, 'total': total}), 200
+    except Exception as e:
+        logger.exception("Error in list_dead_letters")
+        return jsonify({'error': f'Failed to list dead letters: {str(e)}'}), 500
+
+@admin_bp.route('/dead-letters/<int:dead_letter_id>/redrive', methods=['POST'])
+@admin_required
+def redrive(dead_letter_id):
+    """Put a dead-lettered scan back on the retry queue, due immediately"""
+    try:
+        scan = redrive_dead_letter(dead_letter_id)
+        if not scan:
+            return jsonify({'error': 'Dead letter not found'}), 404
+        return jsonify({'success': True, 'data': scan.to_dict()}), 200
+    except Exception as e:
+        logger.exception("Error in redrive")
+        return jsonify({'error': f'Re-drive failed: {str(e)}'}), 500
+
+@admin_bp.route('/products/bulk', methods=['POST'])
+@admin_required
+def bulk_load_products():
+    """Insert or update catalog products by slug: {"products": [...], "replace": false}"""
+    try:
+        data = request.get_json(silent=True) or {}
+        products = data.get('products')
+        if not isinstance(products, list):
+            return jsonify({'error': "Expected a 'products' list"}), 400
+        try:
+            summary = load_catalog(products, replace=bool(data.get('replace')))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'success': True, **summary}), 200
+    except Exception as e:
+        logger.exception("Error in bulk_load_products")
+        return jsonify({'error': f'Catalog load failed: {str(e)}'}), 500
+
+@admin_bp.route('/ai-usage', methods=['GET'])
+@reads_primary  # operators act on what they see
+@admin_required
+def ai_usage():
+    """Tokens, estimated cost and latency percentiles of AI calls, per endpoint, model and user"""
+    try:
+        days = min(max(request.args.get('days', 7, type=int), 1), 366)
+        user_limit = min(max(request.args.get('users', 20, type=int), 1), MAX_PAGE_SIZE)
+        recorder = get_usage_recorder()
+        if recorder:
+            recorder.flush()  # include this worker's latest calls
+        report = usage_report(days=days, user_limit=user_limit)
+        report['recorder'] = recorder.describe() if recorder else None
+        return jsonify({'success': True, 'data': report}), 200
+    except Exception as e:
+        logger.exception("Error in ai_usage")
+        return jsonify({'error': f'Failed to build AI usage report: {str(e)}'}), 500
+
+@admin_bp.route('/users/bulk', methods=['POST'])
+@admin_required
+def bulk_provision_users():
+    """Create many users in one transaction: {"users": [{"name", "email", "password"?}, ...]}"""
+    try:
+        data = request.get_json(silent=True) or {}
+        users = data.get('users')
+        if not isinstance(users, list) or not users:
+            return jsonify({'error': "Expected a non-empty 'users' list"}), 400
+        max_batch = current_app.config.get('ADMIN_PROVISION_MAX_BATCH', 100)
+        if len(users) > max_batch:
+            # Hashing thousands of passwords would outlast the worker timeout
+            return jsonify({
+                'error': f'At most {max_batch} users per request; use `flask provision-users <file>` for larger batches'
+            }), 413
+        try:
+            created = provision_users(users)
+        except ProvisioningError as e:
+            return jsonify({'error': 'No users were created', 'details': e.errors}), 400
+        return jsonify({'success': True, 'created': len(created), 'users': created}), 201
+    except Exception:
+        logger.exception("Error in bulk_provision_users")
+        return jsonify({'error': 'User provisioning failed'}), 500
@@ -1,9 +1,11 @@
+import logging
 from flask import Blueprint, request, jsonify
 from app.services.auth_service import register_user, login_user
 from app import db # Import db to potentially use session management if needed within routes
 
 # Create a Blueprint for authentication routes
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
+logger = logging.getLogger(__name__)
 
 
 @auth_bp.route('/register', methods=['POST'])
@@ -27,7 +29,7 @@ def register():
         return jsonify(response), status_code
     except Exception as e:
         # Log the error and return a JSON response
-        print(f"Registration route error: {str(e)}")
+        logger.exception("Registration route error")
         return jsonify({"error": "An unexpected error occurred during registration.", "details": str(e)}), 500
 
 
@@ -52,5 +54,5 @@ def login():
         return jsonify(response), status_code
     except Exception as e:
         # Log the error and return a JSON response
-        print(f"Login route error: {str(e)}")
+        logger.exception("Login route error")
         return jsonify({"error": "An unexpected error occurred during login.", "details": str(e)}), 500
\ No newline at end of file
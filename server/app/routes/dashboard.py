@@ -0,0 +1,46 @@
+# server/app/routes/dashboard.py
+import logging
+from flask import Blueprint, request, jsonify
+from app.services.dashboard_service import SECTIONS, build_dashboard, parse_fields
+from app.utils.helpers import user_required
+
+dashboard_bp = Blueprint('dashboard', __name__)
+logger = logging.getLogger(__name__)
+
+MAX_ACTIVITIES = 50
+MAX_SCANS = 24
+MAX_DAYS = 365
+
+# ----------------------------------------------------------------------
+#  GET /api/dashboard/<user_id>
+# ----------------------------------------------------------------------
+@dashboard_bp.route('/<int:user_id>', methods=['GET'])
+@user_required(strict=True)
+def get_dashboard(user_id):
+    """
+    All dashboard sections in one response, for the token's caller only
+    (the user section includes the email address, so AUTH_REQUIRED=false
+    doesn't open it).
+
+    Query params: fields (comma-separated sections, default all), limit
+    (recent activities), days (category breakdown window), scans (recent scans).
+    """
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e), 'valid_fields': list(SECTIONS)}), 400
+
+    try:
+        payload = build_dashboard(
+            user_id,
+            fields=fields,
+            limit=min(max(request.args.get('limit', 10, type=int), 1), MAX_ACTIVITIES),
+            days=min(max(request.args.get('days', 30, type=int), 1), MAX_DAYS),
+            scans=min(max(request.args.get('scans', 6, type=int), 1), MAX_SCANS),
+        )
+        if 'user' in payload and payload['user'] is None:
+            return jsonify({'error': 'User not found'}), 404
+        return jsonify(payload), 200
+    except Exception as e:
+        logger.exception("Error in get_dashboard")
+        return jsonify({'error': str(e)}), 500
@@ -1,131 +1,164 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+import hashlib
+import json
+import logging
 import os
-from openai import OpenAI
-import re
+from app.services.ai_gateway import get_gateway, AIGatewayError
+from app.services.chat_cache import get_chat_cache, extract_keywords
+from app.services.marketplace_service import answer_from_catalog, get_product_index
+from app.utils.singleflight import get_flight
+from app.utils.helpers import rate_limited
+from app.services.rate_limiter import get_admission_controller
 
 marketplace_bp = Blueprint('marketplace', __name__, url_prefix='/api')
+logger = logging.getLogger(__name__)
 
-# OpenAI client (uses key from .env)
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+SYSTEM_PROMPT = """You are Green-Nexus AI, an eco-expert assistant based in Kenya specializing in sustainable products available in the Kenyan market.
+
+IMPORTANT: Use PLAIN TEXT ONLY. NO markdown, NO asterisks, NO hashes, NO special formatting symbols.
+
+Format your response exactly like this with line breaks between sections:
+
+Hello! 🌿 [Brief greeting about sustainable products in Kenya]
+
+SUMMARY
+[2-3 sentences explaining the product category and its environmental benefits in the Kenyan context]
+
+TOP 3 RECOMMENDATIONS
+
+1. Product Name
+Key Features: [List 2-3 key features]
+Eco-Score: X/10
+Price Range: Kshs X,XXX - Kshs X,XXX
+Where to Buy: [List 2-3 Kenyan locations/shops]
+
+2. Product Name
+Key Features: [List 2-3 key features]
+Eco-Score: X/10
+Price Range: Kshs X,XXX - Kshs X,XXX
+Where to Buy: [List 2-3 Kenyan locations/shops]
+
+3. Product Name
+Key Features: [List 2-3 key features]
+Eco-Score: X/10
+Price Range: Kshs X,XXX - Kshs X,XXX
+Where to Buy: [List 2-3 Kenyan locations/shops]
+
+PRO TIP
+[1-2 sentences with actionable advice for Kenyans. Mention certifications like Fair Trade, USDA Organic, B Corp. Focus on local and sustainable choices available in Kenya]
+
+Rules:
+- ALWAYS use Kenyan Shilling (Kshs) for prices
+- ALWAYS recommend products available in Kenya (local shops, online stores, markets)
+- Do NOT use asterisks (*) for bold or emphasis
+- Do NOT use hashes (#) for headers
+- Do NOT use underscores (_)
+- Do NOT use backticks (`)
+- Do NOT use any markdown symbols
+- Use plain text only with line breaks for formatting
+- Use emojis sparingly (🌿💚♻️🇰🇪)
+- Keep text clear and readable
+- Suggest Kenyan retailers like Jumia, Carrefour, local eco-shops, markets
+- Consider local context and African alternatives"""
+
+BUSY_RESPONSE = 'AI is taking a green break! Try again in a moment.'
 
 @marketplace_bp.route('/chat', methods=['POST'])
+@rate_limited('chat')
 def ai_chat():
+    # Clients that ask for text/event-stream get the streaming variant
+    best = request.accept_mimetypes.best_match(['application/json', 'text/event-stream'])
+    return _chat(stream=best == 'text/event-stream')
+
+@marketplace_bp.route('/chat/stream', methods=['POST'])
+@rate_limited('chat')
+def ai_chat_stream():
+    """Same as /chat, but relays the answer as Server-Sent Events while it is generated"""
+    return _chat(stream=True)
+
+def _chat(stream):
     try:
-        # Debug: Print request details
-        print("\n" + "="*50)
-        print("🌿 MARKETPLACE CHAT REQUEST")
-        print("="*50)
-        print(f"📍 Request method: {request.method}")
-        print(f"📍 Content-Type: {request.headers.get('Content-Type')}")
+        logger.debug("Marketplace chat request", extra={'content_type': request.headers.get('Content-Type'), 'stream': stream})
         
         # Check if data exists
         if not request.is_json:
-            print("❌ ERROR: Request is not JSON")
+            logger.info("Chat request rejected: not JSON")
             return jsonify({
                 'error': 'Request must be JSON',
                 'response': 'Please send JSON data'
             }), 400
         
         data = request.get_json()
-        print(f"📍 Request data: {data}")
         
         if not data:
-            print("❌ ERROR: No JSON data received")
+            logger.info("Chat request rejected: empty JSON body")
             return jsonify({
                 'error': 'No JSON data',
                 'response': 'Please send a message'
             }), 400
         
         user_message = data.get('message', '').lower().strip()
-        print(f"💬 User message: '{user_message}'")
+        # Only the length: messages are user content and stay out of the logs
+        logger.debug("Chat message received", extra={'message_length': len(user_message)})
         
         if not user_message:
-            print("⚠️  Empty message received")
+            logger.debug("Empty chat message")
             return jsonify({
                 'response': 'Hello! Ask about eco-friendly products. Example: "best sustainable water bottles 2025"'
             }), 200
         
+        # Questions the product catalog can answer never reach the model
+        catalog_answer = None
+        if current_app.config.get('MARKETPLACE_CATALOG_ENABLED', True):
+            catalog_answer = answer_from_catalog(user_message)
+        if catalog_answer is not None:
+            answer, products = catalog_answer
+            logger.info("Chat answered from catalog", extra={'products': len(products)})
+            if stream:
+                return _event_stream(iter([_sse({'delta': answer}), _sse({'cached': False, 'source': 'catalog'}, 'done')]), 'CATALOG')
+            return jsonify({'response': answer, 'source': 'catalog', 'products': products}), 200
+        
+        # Near-duplicate questions are answered from the cache without calling the model
+        cache = get_chat_cache()
+        cached_response = cache.get(user_message) if cache else None
+        if cached_response is not None:
+            logger.info("Chat served from cache")
+            if stream:
+                return _event_stream(iter([_sse({'delta': cached_response}), _sse({'cached': True}, 'done')]), 'HIT')
+            response = jsonify({'response': cached_response})
+            response.headers['X-Cache'] = 'HIT'
+            return response, 200
+        
         # Check if OpenAI API key exists
         api_key = os.getenv('OPENAI_API_KEY')
         if not api_key:
-            print("❌ ERROR: OPENAI_API_KEY not set in environment")
+            logger.error("OPENAI_API_KEY is not set")
             return jsonify({
                 'error': 'API key not configured',
                 'response': 'Server configuration error. Contact admin.'
             }), 500
         
-        print(f"✅ OpenAI API key found: {api_key[:10]}...")
-        
         # Simple keyword extraction for context
-        keywords = re.findall(
-            r'(best|top|recommend)\s+(eco-friendly|sustainable|green|organic)\s+(.+?)(?:\s+2025|$)', 
-            user_message
-        )
+        keywords = extract_keywords(user_message)
         
         context = ""
         if keywords:
-            eco_type, product = keywords[0][1], keywords[0][2]
+            eco_type, product = keywords
             context = f"User is asking for {eco_type} {product} recommendations. Focus on 2025 trends, sustainability certifications (B Corp, Fair Trade), recycled materials, and eco-impact."
-            print(f"🎯 Extracted context: {context[:80]}...")
+            logger.debug("Using keyword context", extra={'eco_type': eco_type, 'product': product})
         else:
             context = "User query about eco-friendly products. Provide 3-5 recommendations with pros/cons, prices, and where to buy. Emphasize sustainability."
-            print(f"📝 Using default context")
+            logger.debug("Using default context")
         
-        print("🚀 Calling OpenAI API (gpt-4o-mini)...")
+        logger.debug("Calling OpenAI", extra={'model': 'gpt-4o-mini', 'stream': stream})
         
-        # OpenAI GPT-4o-mini call with Kenya theme and Kshs pricing
-        response = client.chat.completions.create(
+        # OpenAI GPT-4o-mini call with Kenya theme and Kshs pricing (via the shared gateway)
+        chat_request = dict(
             model="gpt-4o-mini",  # Cheap & fast for this use case
             messages=[
                 {
                     "role": "system",
-                    "content": """You are Green-Nexus AI, an eco-expert assistant based in Kenya specializing in sustainable products available in the Kenyan market.
-
-IMPORTANT: Use PLAIN TEXT ONLY. NO markdown, NO asterisks, NO hashes, NO special formatting symbols.
-
-Format your response exactly like this with line breaks between sections:
-
-Hello! 🌿 [Brief greeting about sustainable products in Kenya]
-
-SUMMARY
-[2-3 sentences explaining the product category and its environmental benefits in the Kenyan context]
-
-TOP 3 RECOMMENDATIONS
-
-1. Product Name
-Key Features: [List 2-3 key features]
-Eco-Score: X/10
-Price Range: Kshs X,XXX - Kshs X,XXX
-Where to Buy: [List 2-3 Kenyan locations/shops]
-
-2. Product Name
-Key Features: [List 2-3 key features]
-Eco-Score: X/10
-Price Range: Kshs X,XXX - Kshs X,XXX
-Where to Buy: [List 2-3 Kenyan locations/shops]
-
-3. Product Name
-Key Features: [List 2-3 key features]
-Eco-Score: X/10
-Price Range: Kshs X,XXX - Kshs X,XXX
-Where to Buy: [List 2-3 Kenyan locations/shops]
-
-PRO TIP
-[1-2 sentences with actionable advice for Kenyans. Mention certifications like Fair Trade, USDA Organic, B Corp. Focus on local and sustainable choices available in Kenya]
-
-Rules:
-- ALWAYS use Kenyan Shilling (Kshs) for prices
-- ALWAYS recommend products available in Kenya (local shops, online stores, markets)
-- Do NOT use asterisks (*) for bold or emphasis
-- Do NOT use hashes (#) for headers
-- Do NOT use underscores (_)
-- Do NOT use backticks (`)
-- Do NOT use any markdown symbols
-- Use plain text only with line breaks for formatting
-- Use emojis sparingly (🌿💚♻️🇰🇪)
-- Keep text clear and readable
-- Suggest Kenyan retailers like Jumia, Carrefour, local eco-shops, markets
-- Consider local context and African alternatives"""
+                    "content": SYSTEM_PROMPT
                 },
                 {
                     "role": "user",
@@ -136,22 +169,38 @@ Rules:
             temperature=0.7  # Balanced creativity
         )
         
-        ai_response = response.choices[0].message.content.strip()
-        print(f"✅ AI Response received: {ai_response[:100]}...")
-        print("="*50)
-        print("✨ REQUEST SUCCESSFUL\n")
+        if stream:
+            return _stream_completion(user_message, chat_request, cache)
+        
+        def call_model():
+            response = get_gateway().chat_completion(**chat_request)
+            return response.choices[0].message.content.strip()
+        
+        # The same question asked by many users at once makes a single model call. Keyed by the exact
+        # request: a fuzzy key would hand one question's answer to a different question
+        flight_key = hashlib.sha256(json.dumps(chat_request, sort_keys=True).encode()).hexdigest()
+        ai_response, coalesced = get_flight('chat').do(flight_key, call_model)
+        logger.info("Chat answered by model", extra={'coalesced': coalesced, 'response_length': len(ai_response)})
+        
+        if cache and not coalesced:
+            cache.set(user_message, ai_response)
         
-        return jsonify({'response': ai_response}), 200
+        response = jsonify({'response': ai_response})
+        response.headers['X-Cache'] = 'MISS'
+        response.headers['X-Coalesced'] = '1' if coalesced else '0'
+        return response, 200
     
+    except AIGatewayError as e:
+        # Circuit open, saturated or deadline exceeded: fail fast with a retryable status
+        logger.warning("AI gateway unavailable: %s: %s", type(e).__name__, e)
+        return jsonify({
+            'error': str(e),
+            'response': BUSY_RESPONSE
+        }), 503
+
     except Exception as e:
         error_msg = str(e)
-        print("\n" + "="*50)
-        print("❌ ERROR OCCURRED")
-        print("="*50)
-        print(f"🔴 Error type: {type(e).__name__}")
-        print(f"🔴 Error message: {error_msg}")
-        print(f"🔴 Full error: {repr(e)}")
-        print("="*50 + "\n")
+        logger.exception("Marketplace chat failed")
         
         # Return helpful error message
         return jsonify({
@@ -160,11 +209,64 @@ Rules:
         }), 500
 
 
+def _sse(data, event=None):
+    """One Server-Sent Event; JSON keeps newlines in the answer from breaking the framing"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+def _event_stream(events, cache_status):
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # proxies (nginx, Render) must not buffer the stream
+    response.headers['X-Cache'] = cache_status
+    return response
+
+def _stream_completion(user_message, chat_request, cache):
+    """
+    Relay the completion as ``data: {"delta": ...}`` events, then an
+    ``event: done``. The full answer is cached once the stream completes.
+    """
+    deltas = get_gateway().stream_chat_completion(**chat_request)
+    # Wait for the first token here, so a failing provider still gets a proper error status
+    first = next(deltas, '')
+    logger.debug("First token received, streaming")
+
+    def events():
+        parts = [first]
+        try:
+            if first:
+                yield _sse({'delta': first})
+            for delta in deltas:
+                parts.append(delta)
+                yield _sse({'delta': delta})
+        except Exception as e:
+            logger.warning("Chat stream interrupted: %s: %s", type(e).__name__, e)
+            yield _sse({'error': str(e), 'response': BUSY_RESPONSE}, 'error')
+            return
+        finally:
+            deltas.close()  # releases the gateway slot if the client went away
+
+        ai_response = ''.join(parts).strip()
+        if cache and ai_response:
+            cache.set(user_message, ai_response)
+        logger.info("Chat stream complete", extra={'response_length': len(ai_response)})
+        yield _sse({'cached': False}, 'done')
+
+    return _event_stream(events(), 'MISS')
+
+
 # Health check endpoint
 @marketplace_bp.route('/chat/health', methods=['GET'])
 def health_check():
+    cache = get_chat_cache()
+    admission = get_admission_controller()
     return jsonify({
         'status': 'healthy',
         'service': 'marketplace',
-        'openai_configured': bool(os.getenv('OPENAI_API_KEY'))
+        'openai_configured': bool(os.getenv('OPENAI_API_KEY')),
+        'ai_circuit': get_gateway().breaker.state,
+        'chat_cache': cache.describe() if cache else None,
+        'catalog_products': len(get_product_index()),
+        'coalescing': get_flight('chat').describe(),
+        'rate_limits': admission.describe() if admission else None
     }), 200
\ No newline at end of file
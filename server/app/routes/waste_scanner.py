@@ -1,25 +1,41 @@
 # server/app/routes/waste_scanner.py
-import os
-from flask import Blueprint, request, jsonify, current_app
+import hmac
+import logging
+from flask import Blueprint, request, jsonify, current_app, send_file, redirect
 from werkzeug.utils import secure_filename
-from app.services.waste_scanner_service import save_waste_analysis_result, get_waste_analysis_by_id, get_all_waste_analyses
+from app.services.waste_scanner_service import (
+    save_waste_analysis_result, get_waste_analysis_by_id, list_waste_analyses, get_recent_waste_analyses
+)
+from app.services.scan_retry_service import record_failed_scan
+from app.services.storage_service import store_upload, get_storage, UploadRejected
+from app.services.image_variants import resolve_image, VARIANT_SIZES
+from app.services.search_service import search_waste_analyses
 from app.models.waste_item import WasteItem
-import uuid
+from app.services.ai_gateway import AIGatewayError
+from app.services.vision_providers import get_vision_client
+from app.utils.singleflight import get_flight
+from app.utils.auth import current_identity, current_user_id
+from app.utils.helpers import rate_limited, user_required
+from datetime import date, datetime, timedelta
 
 waste_scanner_bp = Blueprint('waste_scanner', __name__)
+logger = logging.getLogger(__name__)
 
-# Configure upload folder
-UPLOAD_FOLDER = 'uploads'
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
-
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+IMAGE_CACHE_SECONDS = 365 * 24 * 60 * 60
 
 @waste_scanner_bp.route('/upload', methods=['POST'])
+@rate_limited('upload')
+@user_required(optional=True)
 def upload_image():
     """Handle image upload and AI analysis"""
     try:
+        # Reject oversized bodies before Werkzeug parses (and buffers) the form
+        max_length = current_app.config.get('MAX_CONTENT_LENGTH')
+        if max_length and request.content_length and request.content_length > max_length:
+            return jsonify({'error': 'File too large'}), 413
+
         # Check if the post request has the file part
         if 'image' not in request.files:
             return jsonify({'error': 'No image file provided'}), 400
@@ -30,52 +46,69 @@ def upload_image():
         if file.filename == '':
             return jsonify({'error': 'No selected file'}), 400
         
-        if file and allowed_file(file.filename):
-            # Secure the filename
-            original_filename = secure_filename(file.filename)
-            # Generate unique filename to prevent conflicts
-            unique_filename = f"{str(uuid.uuid4())}_{original_filename}"
-            
-            # Create upload directory if it doesn't exist
-            upload_dir = os.path.join(current_app.root_path, '..', UPLOAD_FOLDER)
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            # Save the file
-            filepath = os.path.join(upload_dir, unique_filename)
-            file.save(filepath)
-            
-            # Get user_id from request if available (optional)
-            user_id = request.form.get('user_id', None)
-            if user_id:
-                user_id = int(user_id)
-            
-            # Process the image with AI and save to database
-            result = save_waste_analysis_result(
-                filename=unique_filename,
-                filepath=filepath,
-                original_name=original_filename,
-                user_id=user_id
-            )
-            
-            # Return the analysis result
+        # Secure the filename
+        original_filename = secure_filename(file.filename)
+
+        # Stream the file into content-addressed storage (identical images are stored once)
+        stored = store_upload(file)
+        
+        # The scan belongs to the caller, if any (checked by user_required)
+        user_id = current_user_id()
+
+        upload_fields = dict(
+            filename=stored.filename,
+            filepath=stored.local_path or stored.key,
+            original_name=original_filename,
+            user_id=user_id,
+            storage_key=stored.key,
+            content_hash=stored.content_hash
+        )
+
+        # Process the image with AI and save to database
+        try:
+            result = save_waste_analysis_result(**upload_fields)
+        except Exception as e:
+            # Keep the scan instead of dropping it: it is retried in the background
+            logger.warning("Analysis failed in upload_image, recording for retry: %s", e)
+            record, queued = record_failed_scan(e, **upload_fields)
+            if not queued:
+                raise
             return jsonify({
-                'success': True,
-                'message': 'Image analyzed successfully',
-                'data': result
-            }), 200
-        else:
-            return jsonify({'error': 'Invalid file type. Allowed types: png, jpg, jpeg, gif, webp'}), 400
+                'success': False,
+                'queued': True,
+                'failed_scan_id': record.id,
+                'message': 'Image analysis is delayed; it will be retried automatically'
+            }), 202
+        
+        # Return the analysis result
+        return jsonify({
+            'success': True,
+            'message': 'Image analyzed successfully',
+            'data': result
+        }), 200
             
+    except UploadRejected as e:
+        return jsonify({'error': e.message}), e.status_code
+    except AIGatewayError as e:
+        logger.warning("AI gateway unavailable in upload_image: %s", e)
+        return jsonify({'error': f'Image analysis is temporarily unavailable: {str(e)}'}), 503
     except Exception as e:
-        print(f"Error in upload_image: {str(e)}")
+        logger.exception("Error in upload_image")
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
 
+def _visible_to_caller(user_id):
+    """Whether the caller may read a scan made by ``user_id``"""
+    identity = current_identity()
+    # Without a token user_required only lets the request through while AUTH_REQUIRED is off
+    return identity is None or user_id == identity.id
+
 @waste_scanner_bp.route('/results/<int:waste_item_id>', methods=['GET'])
+@user_required
 def get_analysis_result(waste_item_id):
-    """Get a specific analysis result by ID"""
+    """Get a specific analysis result by ID (the caller's own scans only)"""
     try:
         result = get_waste_analysis_by_id(waste_item_id)
-        if result:
+        if result and _visible_to_caller(result.get('user_id')):
             return jsonify({
                 'success': True,
                 'data': result
@@ -83,34 +116,116 @@ def get_analysis_result(waste_item_id):
         else:
             return jsonify({'error': 'Analysis result not found'}), 404
     except Exception as e:
-        print(f"Error in get_analysis_result: {str(e)}")
+        logger.exception("Error in get_analysis_result")
         return jsonify({'error': f'Failed to retrieve result: {str(e)}'}), 500
 
+def _parse_date_arg(name, end_of_day=False):
+    """
+    Parse an ISO date/datetime query arg. Raises ValueError with a readable message.
+
+    With ``end_of_day`` a bare date means the end of that day (midnight of the
+    next), so ``to=2025-03-01`` includes the scans made on March 1st.
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid '{name}' date, expected ISO format (YYYY-MM-DD)")
+    if end_of_day and _is_bare_date(value):
+        parsed += timedelta(days=1)
+    return parsed
+
+def _is_bare_date(value):
+    try:
+        date.fromisoformat(value)
+        return True
+    except ValueError:
+        return False
+
 @waste_scanner_bp.route('/results', methods=['GET'])
+@user_required
 def get_all_analysis_results():
-    """Get all analysis results"""
+    """
+    Get the caller's analysis results, newest first, one page at a time.
+
+    Query params: user_id (must be the caller's), waste_type, recyclability, from, to (ISO dates,
+    both inclusive; a date-only ``to`` covers that whole day), limit (max 100) and cursor
+    (``next_cursor`` from the previous page).
+    """
     try:
-        results = get_all_waste_analyses()
+        limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+        try:
+            created_from = _parse_date_arg('from')
+            created_to = _parse_date_arg('to', end_of_day=True)
+            results, next_cursor = list_waste_analyses(
+                user_id=current_user_id(),
+                waste_type=request.args.get('waste_type'),
+                recyclability=request.args.get('recyclability'),
+                created_from=created_from,
+                created_to=created_to,
+                cursor=request.args.get('cursor'),
+                limit=limit
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
         return jsonify({
             'success': True,
             'data': results,
-            'count': len(results)
+            'count': len(results),
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
         }), 200
     except Exception as e:
-        print(f"Error in get_all_analysis_results: {str(e)}")
+        logger.exception("Error in get_all_analysis_results")
         return jsonify({'error': f'Failed to retrieve results: {str(e)}'}), 500
 
+@waste_scanner_bp.route('/search', methods=['GET'])
+@user_required
+def search_analysis_results():
+    """
+    Full-text search over the caller's scans: waste type, materials, instructions and impact.
+
+    Query params: q (required), user_id (must be the caller's), page (from 1), limit (max 100).
+    Results are ordered by relevance and include a 'rank' score.
+    """
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': "Query parameter 'q' is required"}), 400
+
+        page = max(request.args.get('page', 1, type=int), 1)
+        limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+        results, has_more = search_waste_analyses(
+            query,
+            user_id=current_user_id(),
+            page=page,
+            per_page=limit
+        )
+        return jsonify({
+            'success': True,
+            'data': results,
+            'count': len(results),
+            'page': page,
+            'has_more': has_more
+        }), 200
+    except Exception as e:
+        logger.exception("Error in search_analysis_results")
+        return jsonify({'error': f'Search failed: {str(e)}'}), 500
+
 # NEW ENDPOINT: Get recently scanned items
 @waste_scanner_bp.route('/recent', methods=['GET'])
+@user_required
 def get_recently_scanned():
-    """Get the 6 most recently analyzed waste items"""
+    """Get the caller's 6 most recently analyzed waste items"""
     try:
-        # Query the database for the 6 most recent WasteItem entries
-        # Order by created_at in descending order to get the latest first
-        recent_items = WasteItem.query.order_by(WasteItem.created_at.desc()).limit(6).all()
-        
-        # Convert the results to dictionaries
-        recent_items_data = [item.to_dict() for item in recent_items]
+        # Served from the (user_id, created_at) index when filtering by user
+        recent_items_data = get_recent_waste_analyses(
+            user_id=current_user_id(),
+            limit=6
+        )
         
         return jsonify({
             'success': True,
@@ -118,9 +233,68 @@ def get_recently_scanned():
             'count': len(recent_items_data)
         }), 200
     except Exception as e:
-        print(f"Error in get_recently_scanned: {str(e)}")
+        logger.exception("Error in get_recently_scanned")
         return jsonify({'error': f'Failed to retrieve recent scans: {str(e)}'}), 500
 
+@waste_scanner_bp.route('/images/<int:waste_item_id>', defaults={'size': 'original'}, methods=['GET'])
+@waste_scanner_bp.route('/images/<int:waste_item_id>/<size>', methods=['GET'])
+def get_scan_image(waste_item_id, size):
+    """
+    Serve a scanned image: original, or a resized 'thumb' / 'medium' variant.
+
+    Only the signed URLs the API hands out (``WasteItem.image_url``) open an
+    image, so ids can't be walked. Content never changes for a given item
+    and size, so responses carry a strong ETag and a year-long immutable
+    Cache-Control. A size that is gone redirects to the one that is left.
+    Range requests are supported.
+    """
+    if size != 'original' and size not in VARIANT_SIZES:
+        return jsonify({'error': f"Unknown size '{size}'. Use original, {', '.join(VARIANT_SIZES)}"}), 400
+
+    waste_item = WasteItem.query.get(waste_item_id)
+    if not waste_item or not hmac.compare_digest(request.args.get('sig', '').encode(),
+                                                 waste_item.image_signature().encode()):
+        return jsonify({'error': 'Analysis result not found'}), 404
+
+    storage = get_storage()
+    image = resolve_image(storage, waste_item, size)
+    if image is None:
+        return jsonify({'error': 'Image no longer available'}), 404
+    if image.size != size:
+        # e.g. an original the sweeper downsized: the remaining variant has a URL (and cache entry) of its own
+        return redirect(waste_item.image_url(image.size), code=302)
+
+    if image.path:
+        # Legacy upload: Werkzeug derives the ETag from the file's mtime and size
+        return send_file(image.path, mimetype=image.mimetype, conditional=True, max_age=IMAGE_CACHE_SECONDS)
+
+    path = storage.local_path(image.key)
+    if path is None:
+        # Object store: let the client fetch it straight from the bucket
+        return redirect(storage.url(image.key), code=302)
+
+    # send_file hands the open file to the server's wsgi.file_wrapper (sendfile under gunicorn)
+    response = send_file(
+        path,
+        mimetype=image.mimetype,
+        conditional=True,
+        etag=image.etag,
+        max_age=IMAGE_CACHE_SECONDS,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@waste_scanner_bp.route('/health', methods=['GET'])
+def health_check():
+    """Vision backend status, hedging policy, per-backend latency and coalesced scans"""
+    return jsonify({
+        'status': 'healthy',
+        'service': 'waste_scanner',
+        'vision': get_vision_client().describe(),
+        'coalescing': get_flight('vision').describe()
+    }), 200
+
 @waste_scanner_bp.route('/test', methods=['POST'])
 def test_endpoint():
     """Test endpoint to verify the route is working"""
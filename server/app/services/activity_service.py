@@ -1,6 +1,8 @@
 from app import db
 from datetime import datetime, timedelta
 from app.models.activity import Activity
+from app.models.user import User
+from sqlalchemy import case, func, update
 from app.constants import ACTIVITY_CONVERSIONS
 
 class ActivityService:
@@ -169,32 +171,37 @@ class ActivityService:
                 Activity.created_at >= seven_days_ago
             ).all()
             
-            # Calculate statistics
-            total_carbon_saved = sum(a.carbon_saved for a in activities)
-            activity_count = len(activities)
-            
-            # Group by day
-            daily_stats = {}
-            for activity in activities:
-                day = activity.created_at.strftime('%A')
-                if day not in daily_stats:
-                    daily_stats[day] = {
-                        'count': 0,
-                        'carbon_saved': 0
-                    }
-                daily_stats[day]['count'] += 1
-                daily_stats[day]['carbon_saved'] += activity.carbon_saved
-            
-            return {
-                'total_carbon_saved': round(total_carbon_saved, 2),
-                'total_activities': activity_count,
-                'daily_stats': daily_stats,
-                'period': 'last_7_days'
-            }, 200
+            return ActivityService.summarize_week(activities), 200
             
         except Exception as e:
             return {'error': str(e)}, 500
     
+    @staticmethod
+    def summarize_week(activities):
+        """Weekly statistics of already-loaded activities (the caller picks the last 7 days)"""
+        # Calculate statistics
+        total_carbon_saved = sum(a.carbon_saved for a in activities)
+        activity_count = len(activities)
+        
+        # Group by day
+        daily_stats = {}
+        for activity in activities:
+            day = activity.created_at.strftime('%A')
+            if day not in daily_stats:
+                daily_stats[day] = {
+                    'count': 0,
+                    'carbon_saved': 0
+                }
+            daily_stats[day]['count'] += 1
+            daily_stats[day]['carbon_saved'] += activity.carbon_saved
+        
+        return {
+            'total_carbon_saved': round(total_carbon_saved, 2),
+            'total_activities': activity_count,
+            'daily_stats': daily_stats,
+            'period': 'last_7_days'
+        }
+    
     @staticmethod
     def get_category_breakdown(user_id, days=30):
         """
@@ -215,19 +222,7 @@ class ActivityService:
                 Activity.created_at >= date_limit
             ).all()
             
-            breakdown = {
-                'Transport': {'count': 0, 'carbon_saved': 0},
-                'Food': {'count': 0, 'carbon_saved': 0},
-                'Purchases': {'count': 0, 'carbon_saved': 0},
-                'Other': {'count': 0, 'carbon_saved': 0}
-            }
-            
-            for activity in activities:
-                category = activity.category if activity.category in breakdown else 'Other'
-                breakdown[category]['count'] += 1
-                breakdown[category]['carbon_saved'] += activity.carbon_saved
-            
-            return breakdown, 200
+            return ActivityService.summarize_categories(activities), 200
             
         except Exception as e:
             return {'error': str(e)}, 500
@@ -253,15 +248,61 @@ class ActivityService:
             if not activity:
                 return {'error': 'Activity not found'}, 404
             
+            carbon_saved = activity.carbon_saved
             db.session.delete(activity)
             db.session.commit()
             
-            return {'message': 'Activity deleted successfully'}, 200
+            return {'message': 'Activity deleted successfully', 'carbon_saved': carbon_saved}, 200
             
         except Exception as e:
             db.session.rollback()
             return {'error': str(e)}, 500
     
+    @staticmethod
+    def summarize_categories(activities):
+        """Count and carbon saved per category of already-loaded activities"""
+        breakdown = {
+            'Transport': {'count': 0, 'carbon_saved': 0},
+            'Food': {'count': 0, 'carbon_saved': 0},
+            'Purchases': {'count': 0, 'carbon_saved': 0},
+            'Other': {'count': 0, 'carbon_saved': 0}
+        }
+        
+        for activity in activities:
+            category = activity.category if activity.category in breakdown else 'Other'
+            breakdown[category]['count'] += 1
+            breakdown[category]['carbon_saved'] += activity.carbon_saved
+        
+        return breakdown
+
+    @staticmethod
+    def add_carbon_saved(user_id, carbon_saved):
+        """
+        Add a logged activity to the user's totals in one UPDATE; the green
+        score follows the total (5 points per kg, at most 100).
+        """
+        total = func.coalesce(User.total_carbon_saved, 0) + carbon_saved
+        db.session.execute(
+            update(User).where(User.id == user_id).values(
+                total_carbon_saved=total,
+                green_score=case((total * 5 > 100, 100), else_=total * 5),
+            )
+        )
+        db.session.commit()
+
+    @staticmethod
+    def remove_carbon_saved(user_id, carbon_saved):
+        """Take a deleted activity off the user's totals (and 5 points off the score) in one UPDATE."""
+        total = func.coalesce(User.total_carbon_saved, 0) - carbon_saved
+        score = func.coalesce(User.green_score, 0) - 5
+        db.session.execute(
+            update(User).where(User.id == user_id).values(
+                total_carbon_saved=case((total < 0, 0), else_=total),
+                green_score=case((score < 0, 0), else_=score),
+            )
+        )
+        db.session.commit()
+
     @staticmethod
     def get_activity_types():
         """Get all available activity types"""
@@ -0,0 +1,430 @@
+# server/app/services/ai_gateway.py
+"""
+Shared gateway for every OpenAI call made by the server.
+
+One pooled client is kept per process instead of building a new ``OpenAI``
+instance (and connection pool) on each request. Every call goes through the
+same policies:
+
+- a per-call deadline that covers all retry attempts
+- retries with full-jitter exponential backoff on 429, 5xx, timeouts and
+  connection errors (``Retry-After`` is honoured when the provider sends it)
+- a process-wide concurrency cap
+- a circuit breaker that fails fast while the provider is down
+- token usage, latency and outcome of each call reported to
+  ``add_usage_listener`` callbacks (budgets and usage accounting build on it)
+
+Settings are read from the environment so the gateway also works outside the
+Flask app (e.g. ``test_ai.py``):
+
+    OPENAI_API_KEY, OPENAI_BASE_URL (point at a local stub server for testing)
+    AI_TIMEOUT, AI_CONNECT_TIMEOUT, AI_MAX_RETRIES, AI_BACKOFF_BASE, AI_BACKOFF_MAX
+    AI_MAX_CONCURRENCY, AI_ACQUIRE_TIMEOUT, AI_POOL_SIZE
+    AI_CIRCUIT_FAILURES, AI_CIRCUIT_RESET
+    AI_RECORD_MODE, AI_FIXTURES_DIR, AI_REPLAY_* (see ``ai_recorder``)
+"""
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from app.services.ai_recorder import AIRecorder
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+CHARS_PER_TOKEN = 4  # rough estimate for streams, which report no usage
+
+_usage_listeners = []
+
+
+def add_usage_listener(listener):
+    """
+    Call ``listener(model, prompt_tokens, completion_tokens, latency, outcome)``
+    after every call, in the thread that made it. ``latency`` is in seconds,
+    retries included; ``outcome`` is 'ok', 'cancelled' (the caller stopped
+    reading a stream) or the name of the exception the call raised.
+    """
+    if listener not in _usage_listeners:
+        _usage_listeners.append(listener)
+
+
+def _report_usage(model, prompt_tokens, completion_tokens, latency, outcome):
+    for listener in list(_usage_listeners):
+        try:
+            listener(model, prompt_tokens, completion_tokens, latency, outcome)
+        except Exception:
+            logger.exception("AI usage listener failed")
+
+
+def _estimate_tokens(messages):
+    chars = 0
+    for message in messages:
+        content = message.get('content')
+        if isinstance(content, list):
+            content = ' '.join(part.get('text', '') for part in content)
+        chars += len(content or '')
+    return chars // CHARS_PER_TOKEN
+
+
+class AIGatewayError(Exception):
+    """Base class for errors raised by the gateway itself."""
+
+
+class CircuitOpenError(AIGatewayError):
+    """The provider has been failing; calls are rejected without being sent."""
+
+
+class AIGatewayBusy(AIGatewayError):
+    """No concurrency slot became free before the deadline."""
+
+
+class AIGatewayTimeout(AIGatewayError):
+    """The per-call deadline expired before a successful response."""
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    rejects calls for ``reset_timeout`` seconds. It then lets a single trial
+    call through; success closes it again, failure re-opens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self):
+        """Return True if a call may be attempted now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            # Half-open: let exactly one trial call through
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning("AI circuit breaker opened after %d failures", self._failures)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+class AIGateway:
+    """Pooled, rate-limited and fault-tolerant access to the OpenAI API."""
+
+    def __init__(self, api_key=None, base_url=None, timeout=30.0, connect_timeout=5.0,
+                 max_retries=2, backoff_base=0.5, backoff_max=8.0, max_concurrency=8,
+                 acquire_timeout=10.0, pool_size=20, circuit_failures=5, circuit_reset=30.0,
+                 recorder=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency = max_concurrency
+        self.acquire_timeout = acquire_timeout
+        self.pool_size = pool_size
+        self.breaker = CircuitBreaker(circuit_failures, circuit_reset)
+        self.recorder = recorder  # AIRecorder when AI_RECORD_MODE is record/replay
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            base_url=os.getenv('OPENAI_BASE_URL') or None,
+            timeout=_env_float('AI_TIMEOUT', 30.0),
+            connect_timeout=_env_float('AI_CONNECT_TIMEOUT', 5.0),
+            max_retries=_env_int('AI_MAX_RETRIES', 2),
+            backoff_base=_env_float('AI_BACKOFF_BASE', 0.5),
+            backoff_max=_env_float('AI_BACKOFF_MAX', 8.0),
+            max_concurrency=_env_int('AI_MAX_CONCURRENCY', 8),
+            acquire_timeout=_env_float('AI_ACQUIRE_TIMEOUT', 10.0),
+            pool_size=_env_int('AI_POOL_SIZE', 20),
+            circuit_failures=_env_int('AI_CIRCUIT_FAILURES', 5),
+            circuit_reset=_env_float('AI_CIRCUIT_RESET', 30.0),
+            recorder=AIRecorder.from_env(),
+        )
+
+    # ------------------------------------------------------------------
+    # Client
+    # ------------------------------------------------------------------
+    @property
+    def client(self):
+        """The persistent OpenAI client, built on first use."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._build_client()
+        return self._client
+
+    def _build_client(self):
+        import httpx
+        from openai import OpenAI
+
+        http_client = httpx.Client(
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+            ),
+        )
+        # Retries are handled here, not by the SDK, so they share the deadline
+        return OpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            http_client=http_client,
+            max_retries=0,
+        )
+
+    def close(self):
+        with self._client_lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    # ------------------------------------------------------------------
+    # Calls
+    # ------------------------------------------------------------------
+    def _is_retryable(self, error):
+        import openai
+
+        if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code in RETRYABLE_STATUS_CODES
+        return False
+
+    def _backoff(self, attempt, error):
+        """Full-jitter exponential backoff, or the provider's Retry-After."""
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _create(self, timeout, kwargs):
+        """One SDK call, through the recorder when record/replay is on."""
+        if self.recorder is None:
+            return self.client.chat.completions.create(timeout=timeout, **kwargs)
+        # Replay never builds the client, so it needs no API key or network
+        return self.recorder.create(
+            lambda **call: self.client.chat.completions.create(**call), timeout=timeout, **kwargs
+        )
+
+    @contextmanager
+    def _slot(self, budget):
+        """Breaker check plus a concurrency slot, held for the whole call."""
+        # Cheap check first so an open breaker never waits for a slot
+        if self.breaker.state == CircuitBreaker.OPEN:
+            raise CircuitOpenError('AI provider is unavailable, please try again shortly')
+
+        if not self._slots.acquire(timeout=min(budget, self.acquire_timeout)):
+            raise AIGatewayBusy('Too many concurrent AI requests')
+
+        try:
+            if not self.breaker.allow():
+                raise CircuitOpenError('AI provider is unavailable, please try again shortly')
+            yield
+        finally:
+            self._slots.release()
+
+    def _with_retries(self, budget, expires_at, call):
+        """Run ``call(remaining_seconds)`` with the retry, deadline and breaker policies."""
+        attempt = 0
+        while True:
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                self.breaker.record_failure()
+                raise AIGatewayTimeout(f'AI call exceeded its {budget:.1f}s deadline')
+            try:
+                result = call(remaining)
+            except Exception as e:
+                if not self._is_retryable(e):
+                    # Client errors (bad request, auth) say nothing about provider health
+                    self.breaker.record_success()
+                    raise
+                if attempt >= self.max_retries:
+                    self.breaker.record_failure()
+                    raise
+                delay = self._backoff(attempt, e)
+                if time.monotonic() + delay >= expires_at:
+                    self.breaker.record_failure()
+                    raise
+                logger.info("AI call failed (%s), retry %d in %.2fs",
+                            type(e).__name__, attempt + 1, delay)
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    def chat_completion(self, deadline=None, **kwargs):
+        """
+        Call ``chat.completions.create`` with the gateway's policies.
+
+        Args:
+            deadline: Seconds the whole call (including retries) may take.
+                Defaults to ``AI_TIMEOUT``.
+            **kwargs: Passed through to the OpenAI SDK.
+
+        Raises:
+            CircuitOpenError, AIGatewayBusy, AIGatewayTimeout, or the last
+            OpenAI error once retries are exhausted.
+        """
+        budget = deadline if deadline is not None else self.timeout
+        started = time.monotonic()
+        expires_at = started + budget
+
+        try:
+            with self._slot(budget):
+                response = self._with_retries(budget, expires_at, lambda remaining: self._create(remaining, kwargs))
+        except Exception as e:
+            _report_usage(kwargs.get('model'), 0, 0, time.monotonic() - started, type(e).__name__)
+            raise
+
+        usage = getattr(response, 'usage', None)
+        _report_usage(kwargs.get('model'), usage.prompt_tokens if usage else 0,
+                      usage.completion_tokens if usage else 0, time.monotonic() - started, 'ok')
+        return response
+
+    def stream_chat_completion(self, deadline=None, **kwargs):
+        """
+        Like ``chat_completion`` but yields the answer's text deltas as the
+        model produces them.
+
+        ``deadline`` covers getting the first token, retries included; once
+        the stream has started it is not retried. The concurrency slot is
+        held until the stream is exhausted or closed.
+        """
+        budget = deadline if deadline is not None else self.timeout
+        started = time.monotonic()
+        expires_at = started + budget
+
+        def start(remaining):
+            # A stream that fails before its first chunk is retried like any other call
+            chunks = iter(self._create(remaining, dict(kwargs, stream=True)))
+            return chunks, next(chunks, None)
+
+        first, generated, outcome = None, 0, 'ok'
+        try:
+            with self._slot(budget):
+                chunks, first = self._with_retries(budget, expires_at, start)
+                if first is None:
+                    return
+                for chunk in itertools.chain([first], chunks):
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        generated += len(delta)
+                        yield delta
+        except GeneratorExit:
+            outcome = 'cancelled'
+            raise
+        except Exception as e:
+            outcome = type(e).__name__
+            raise
+        finally:
+            # Also when the client hangs up: whatever was generated is billed
+            prompt_tokens = _estimate_tokens(kwargs.get('messages', [])) if first is not None else 0
+            _report_usage(kwargs.get('model'), prompt_tokens, generated // CHARS_PER_TOKEN,
+                          time.monotonic() - started, outcome)
+
+    def vision_completion(self, prompt, base64_image, model='gpt-4o', max_tokens=500,
+                          mime_type='image/jpeg', deadline=None):
+        """Ask a vision model about one image. Returns the raw completion."""
+        return self.chat_completion(
+            deadline=deadline,
+            model=model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {
+                            "type": "image_url",
+                            "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}
+                        }
+                    ]
+                }
+            ],
+            max_tokens=max_tokens,
+        )
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """Return the process-wide gateway, creating it from the environment."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = AIGateway.from_env()
+    return _gateway
+
+
+def reset_gateway():
+    """Drop the process-wide gateway (after a fork, or when settings change)."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is not None:
+            _gateway.close()
+        _gateway = None
@@ -0,0 +1,312 @@
+# server/app/services/ai_recorder.py
+"""
+Record/replay of OpenAI chat completions, for offline and deterministic runs.
+
+Every AI call (the waste-scanner vision call and the marketplace chat) goes
+through ``AIGateway.chat_completion``, which hands the raw SDK call to the
+recorder when ``AI_RECORD_MODE`` is set:
+
+    record   call the provider as usual and save request fingerprint,
+             response and latency to ``AI_FIXTURES_DIR``
+    replay   never touch the network: serve the saved response, after the
+             recorded (or a configured) latency, failing a configured share
+             of calls with a provider-style error
+
+Replay settings:
+
+    AI_REPLAY_MATCH        exact (default): the fingerprint must match;
+                           loose: fall back to a fixture of the same kind and
+                           model, picked by fingerprint, so load tests can
+                           send arbitrary images and prompts
+    AI_REPLAY_LATENCY      'recorded' (default) or a fixed number of seconds
+    AI_REPLAY_LATENCY_SCALE  multiplier for the latency (0 = as fast as possible)
+    AI_REPLAY_ERROR_RATE   0..1 share of calls that fail
+    AI_REPLAY_ERROR_STATUS HTTP status of injected errors (500, 429, 503...)
+                           or 'timeout'
+    AI_REPLAY_SEED         seed for the error injection, for reproducible runs
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MODES = ('off', 'record', 'replay')
+FIRST_TOKEN_SHARE = 0.1  # streamed replays of fixtures recorded without first_token_ms
+DEFAULT_FIXTURES_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'fixtures', 'ai'
+)
+
+
+class FixtureNotFound(LookupError):
+    """Replay mode got a request that was never recorded."""
+
+
+def _image_digest(url):
+    """Replace an inline base64 image by its hash: fixtures stay small, fingerprints stable."""
+    if url.startswith('data:'):
+        header, _, payload = url.partition(',')
+        return f"{header},sha256:{hashlib.sha256(payload.encode()).hexdigest()}"
+    return url
+
+
+def normalize_request(kwargs):
+    """The parts of a chat.completions.create call that decide its answer."""
+    messages = []
+    for message in kwargs.get('messages', []):
+        content = message.get('content')
+        if isinstance(content, list):
+            parts = []
+            for part in content:
+                if part.get('type') == 'image_url':
+                    part = {'type': 'image_url', 'image_url': {'url': _image_digest(part['image_url']['url'])}}
+                parts.append(part)
+            content = parts
+        messages.append({'role': message.get('role'), 'content': content})
+
+    # Streamed and plain calls for the same prompt share a fixture
+    request = {key: value for key, value in kwargs.items() if key not in ('messages', 'timeout', 'stream')}
+    request['messages'] = messages
+    return request
+
+
+def fingerprint(request):
+    return hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def request_kind(request):
+    """'vision' when any message carries an image, else 'chat'."""
+    for message in request['messages']:
+        if isinstance(message['content'], list) and any(p.get('type') == 'image_url' for p in message['content']):
+            return 'vision'
+    return 'chat'
+
+
+class AIRecorder:
+    """Records or replays ``chat.completions.create`` calls."""
+
+    def __init__(self, mode, fixtures_dir=DEFAULT_FIXTURES_DIR, match='exact', latency='recorded',
+                 latency_scale=1.0, error_rate=0.0, error_status='500', seed=None):
+        if mode not in MODES:
+            raise ValueError(f"AI_RECORD_MODE must be one of {', '.join(MODES)}, got '{mode}'")
+        self.mode = mode
+        self.fixtures_dir = fixtures_dir
+        self.match = match
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stats = {'recorded': 0, 'replayed': 0, 'loose_matches': 0, 'injected_errors': 0}
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._fixtures = None  # fingerprint -> fixture, loaded on first replay
+
+    @classmethod
+    def from_env(cls):
+        """Recorder configured from the environment, or None when recording is off."""
+        mode = os.getenv('AI_RECORD_MODE', 'off').lower()
+        if mode == 'off':
+            return None
+        seed = os.getenv('AI_REPLAY_SEED')
+        return cls(
+            mode,
+            fixtures_dir=os.getenv('AI_FIXTURES_DIR') or DEFAULT_FIXTURES_DIR,
+            match=os.getenv('AI_REPLAY_MATCH', 'exact').lower(),
+            latency=os.getenv('AI_REPLAY_LATENCY', 'recorded').lower(),
+            latency_scale=float(os.getenv('AI_REPLAY_LATENCY_SCALE', 1.0)),
+            error_rate=float(os.getenv('AI_REPLAY_ERROR_RATE', 0.0)),
+            error_status=os.getenv('AI_REPLAY_ERROR_STATUS', '500').lower(),
+            seed=int(seed) if seed else None,
+        )
+
+    def create(self, create_fn, timeout=None, **kwargs):
+        """
+        Run one completion. ``create_fn`` performs the real SDK call and is
+        only used in record mode.
+        """
+        request = normalize_request(kwargs)
+        key = fingerprint(request)
+        stream = kwargs.get('stream', False)
+        if self.mode == 'replay':
+            return self._replay(key, request, timeout, stream)
+
+        started = time.monotonic()
+        response = create_fn(timeout=timeout, **kwargs)
+        if stream:
+            return self._record_stream(key, request, response, started)
+        self._save(key, request, response.model_dump(), time.monotonic() - started)
+        return response
+
+    # ------------------------------------------------------------------
+    # Record
+    # ------------------------------------------------------------------
+    def _record_stream(self, key, request, chunks, started):
+        """Pass chunks through, then save them as one completion once the stream is done."""
+        parts, first_token, last = [], None, None
+        for chunk in chunks:
+            if first_token is None:
+                first_token = time.monotonic() - started
+            last = chunk
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+            yield chunk
+
+        if last is None:
+            return
+        response = {
+            'id': last.id,
+            'object': 'chat.completion',
+            'created': last.created,
+            'model': last.model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': ''.join(parts)},
+                'finish_reason': (last.choices[0].finish_reason if last.choices else None) or 'stop',
+            }],
+        }
+        self._save(key, request, response, time.monotonic() - started, first_token)
+
+    def _save(self, key, request, response, elapsed, first_token=None):
+        fixture = {
+            'fingerprint': key,
+            'kind': request_kind(request),
+            'model': request.get('model'),
+            'request': request,
+            'response': response,
+            'latency_ms': round(elapsed * 1000, 1),
+            'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }
+        if first_token is not None:
+            fixture['first_token_ms'] = round(first_token * 1000, 1)
+        os.makedirs(self.fixtures_dir, exist_ok=True)
+        path = os.path.join(self.fixtures_dir, f"{fixture['kind']}-{key[:16]}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as fh:
+            json.dump(fixture, fh, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.stats['recorded'] += 1
+            if self._fixtures is not None:
+                self._fixtures[key] = fixture
+
+    # ------------------------------------------------------------------
+    # Replay
+    # ------------------------------------------------------------------
+    def _load(self):
+        if self._fixtures is None:
+            with self._lock:
+                if self._fixtures is None:
+                    fixtures = {}
+                    if os.path.isdir(self.fixtures_dir):
+                        for name in sorted(os.listdir(self.fixtures_dir)):
+                            if name.endswith('.json'):
+                                with open(os.path.join(self.fixtures_dir, name)) as fh:
+                                    fixture = json.load(fh)
+                                fixtures[fixture['fingerprint']] = fixture
+                    self._fixtures = fixtures
+        return self._fixtures
+
+    def _find(self, key, request):
+        fixtures = self._load()
+        if key in fixtures:
+            return fixtures[key]
+        if self.match == 'loose':
+            kind, model = request_kind(request), request.get('model')
+            candidates = [f for k, f in sorted(fixtures.items()) if f['kind'] == kind and f['model'] == model] \
+                or [f for k, f in sorted(fixtures.items()) if f['kind'] == kind]
+            if candidates:
+                with self._lock:
+                    self.stats['loose_matches'] += 1
+                return candidates[int(key, 16) % len(candidates)]
+        raise FixtureNotFound(
+            f"No recorded AI response for {request_kind(request)} request {key[:16]} in {self.fixtures_dir}"
+        )
+
+    def _delay(self, fixture):
+        if self.latency == 'recorded':
+            seconds = fixture.get('latency_ms', 0) / 1000.0
+        else:
+            seconds = float(self.latency)
+        return seconds * self.latency_scale
+
+    def _replay(self, key, request, timeout, stream=False):
+        from openai.types.chat import ChatCompletion
+
+        fixture = self._find(key, request)
+        delay = self._delay(fixture)
+        if stream:
+            # Only the first token is waited for up front; the rest is spread over the stream
+            first_token = fixture.get('first_token_ms', fixture.get('latency_ms', 0) * FIRST_TOKEN_SHARE)
+            wait = min(delay, delay * first_token / max(fixture.get('latency_ms', 0), 1))
+        else:
+            wait = delay
+        with self._lock:
+            fail = self.error_rate > 0 and self._random.random() < self.error_rate
+
+        if timeout is not None and wait > timeout:
+            time.sleep(timeout)
+            raise self._error('timeout', fixture)
+        time.sleep(wait)
+
+        if fail:
+            with self._lock:
+                self.stats['injected_errors'] += 1
+            raise self._error(self.error_status, fixture)
+
+        with self._lock:
+            self.stats['replayed'] += 1
+        if stream:
+            return self._replay_chunks(fixture, delay - wait)
+        return ChatCompletion.model_validate(fixture['response'])
+
+    def _replay_chunks(self, fixture, remaining_delay):
+        """Yield the recorded answer word by word, paced over ``remaining_delay``."""
+        from openai.types.chat import ChatCompletionChunk
+
+        response = fixture['response']
+        words = re.findall(r'\s*\S+\s*', response['choices'][0]['message']['content'] or '') or ['']
+        pause = remaining_delay / len(words)
+        for index, word in enumerate(words):
+            if index and pause:
+                time.sleep(pause)
+            last = index == len(words) - 1
+            yield ChatCompletionChunk.model_validate({
+                'id': response.get('id', 'replay'),
+                'object': 'chat.completion.chunk',
+                'created': response.get('created', 0),
+                'model': response.get('model', fixture.get('model') or ''),
+                'choices': [{
+                    'index': 0,
+                    'delta': {'role': 'assistant', 'content': word} if index == 0 else {'content': word},
+                    'finish_reason': response['choices'][0].get('finish_reason') if last else None,
+                }],
+            })
+
+    def _error(self, status, fixture):
+        """An exception shaped like the one the OpenAI SDK raises for ``status``."""
+        import httpx
+        import openai
+
+        http_request = httpx.Request('POST', 'https://replay.invalid/v1/chat/completions')
+        if status == 'timeout':
+            return openai.APITimeoutError(request=http_request)
+
+        status = int(status)
+        body = {'error': {'message': f'Injected replay error ({status})', 'type': 'replay'}}
+        response = httpx.Response(status, request=http_request, json=body)
+        error_class = {
+            400: openai.BadRequestError,
+            401: openai.AuthenticationError,
+            429: openai.RateLimitError,
+        }.get(status, openai.InternalServerError if status >= 500 else openai.APIStatusError)
+        return error_class(f"Error code: {status} - {body}", response=response, body=body)
+
+    def describe(self):
+        return {'mode': self.mode, 'fixtures_dir': self.fixtures_dir, 'match': self.match,
+                'error_rate': self.error_rate, 'stats': dict(self.stats)}
@@ -0,0 +1,311 @@
+# server/app/services/ai_usage.py
+"""
+Accounting of OpenAI calls: tokens, cost, latency and outcome.
+
+Every call through the gateway is reported here (``add_usage_listener``) and
+recorded, with the endpoint and client it was made for
+(``attribute_ai_calls``), in an in-memory buffer. A background thread writes
+the buffer to the append-only ``ai_usage_events`` table every
+``AI_USAGE_FLUSH_INTERVAL`` seconds in one bulk insert, so the request path
+never waits on the database.
+
+Once a day is over its events are rolled up into ``ai_usage_daily`` (one row
+per day, endpoint, model and client, with a latency histogram) and deleted,
+which keeps the events table to about a day of rows. ``usage_report``
+combines both tables for the admin endpoint.
+
+Calls that are not attributed (``test_ai.py``, ``bench_ai.py``) are not
+recorded.
+"""
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, g, has_request_context
+
+from app.services.ai_gateway import add_usage_listener
+from app.utils.latency import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_BATCH_SIZE = 5000
+
+# USD per million (prompt, completion) tokens, matched by model name prefix
+MODEL_PRICES = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4-turbo': (10.00, 30.00),
+    'gpt-3.5-turbo': (0.50, 1.50),
+}
+
+# (recorder, endpoint, subject) the current AI calls are made for
+_attribution = contextvars.ContextVar('ai_call_attribution', default=None)
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Cost in USD; models without a known price (self-hosted ones) are free."""
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model and model.startswith(name):
+            prompt_price, completion_price = MODEL_PRICES[name]
+            return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+    return 0.0
+
+
+def _midnight(day):
+    return datetime.combine(day, datetime.min.time())
+
+
+def _is_error(outcome):
+    return outcome not in ('ok', 'cancelled')
+
+
+class UsageRecorder:
+    """Buffers usage events in memory and writes them in batches."""
+
+    def __init__(self, max_buffer=10000):
+        self.max_buffer = max_buffer
+        self.stats = {'recorded': 0, 'flushed': 0, 'dropped': 0, 'rolled_up': 0}
+        self._buffer = deque()
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, subject, model, prompt_tokens, completion_tokens, latency, outcome):
+        event = {
+            'created_at': datetime.utcnow(),
+            'endpoint': endpoint,
+            'model': (model or '')[:50] or None,
+            'subject': subject,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'latency_ms': int(round(latency * 1000)),
+            'outcome': outcome[:40],
+            'cost_usd': estimate_cost(model, prompt_tokens, completion_tokens),
+        }
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self._buffer.popleft()  # the database is unreachable; keep the newest
+                self.stats['dropped'] += 1
+            self._buffer.append(event)
+            self.stats['recorded'] += 1
+
+    def flush(self):
+        """Write buffered events to ``ai_usage_events``. Returns how many were written."""
+        with self._lock:
+            events, self._buffer = list(self._buffer), deque()
+        if not events:
+            return 0
+
+        from app import db
+        from app.models.ai_usage import AIUsageEvent
+
+        try:
+            db.session.execute(db.insert(AIUsageEvent.__table__), events)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                room = max(self.max_buffer - len(self._buffer), 0)  # retried next time, newest first
+                self._buffer.extendleft(reversed(events[len(events) - room:] if room else []))
+            logger.exception("Could not write %d AI usage events", len(events))
+            return 0
+        with self._lock:
+            self.stats['flushed'] += len(events)
+        return len(events)
+
+    def rollup(self, before=None):
+        """
+        Fold the events of days before ``before`` (default: today, UTC) into
+        ``ai_usage_daily`` and delete them. Returns how many were rolled up.
+        """
+        from app import db
+        from app.models.ai_usage import AIUsageDaily, AIUsageEvent
+
+        cutoff = _midnight(before or datetime.now(timezone.utc).date())
+        rolled = 0
+        while True:
+            events = AIUsageEvent.query.filter(AIUsageEvent.created_at < cutoff) \
+                .order_by(AIUsageEvent.id).limit(ROLLUP_BATCH_SIZE).all()
+            if not events:
+                break
+
+            ids = [event.id for event in events]
+            # Deleting first claims the batch: a worker rolling up concurrently deletes fewer rows and backs off
+            deleted = AIUsageEvent.query.filter(AIUsageEvent.id.in_(ids)).delete(synchronize_session=False)
+            if deleted != len(ids):
+                db.session.rollback()
+                logger.info("AI usage rollup raced with another worker, stopping")
+                break
+
+            groups = {}
+            for event in events:
+                key = (event.created_at.date(), event.endpoint, event.model, event.subject)
+                group = groups.setdefault(key, {'events': [], 'histogram': LatencyHistogram()})
+                group['events'].append(event)
+                group['histogram'].observe(event.latency_ms / 1000.0)
+
+            for (day, endpoint, model, subject), group in groups.items():
+                row = AIUsageDaily.query.filter_by(day=day, endpoint=endpoint, model=model, subject=subject).first()
+                if row is None:
+                    row = AIUsageDaily(day=day, endpoint=endpoint, model=model, subject=subject, calls=0, errors=0,
+                                       prompt_tokens=0, completion_tokens=0, cost_usd=0.0,
+                                       latency_counts=[0] * len(group['histogram'].counts), latency_sum=0.0)
+                    db.session.add(row)
+                histogram = group['histogram']
+                histogram.merge(row.latency_counts, row.latency_sum)
+                row.latency_counts = list(histogram.counts)  # reassigned so the JSON column is flagged dirty
+                row.latency_sum = histogram.total
+                row.calls += len(group['events'])
+                row.errors += sum(1 for event in group['events'] if _is_error(event.outcome))
+                row.prompt_tokens += sum(event.prompt_tokens for event in group['events'])
+                row.completion_tokens += sum(event.completion_tokens for event in group['events'])
+                row.cost_usd += sum(event.cost_usd for event in group['events'])
+            db.session.commit()
+            rolled += len(events)
+
+        with self._lock:
+            self.stats['rolled_up'] += rolled
+        return rolled
+
+    def describe(self):
+        with self._lock:
+            return {'buffered': len(self._buffer), 'stats': dict(self.stats)}
+
+
+class _Totals:
+    __slots__ = ('calls', 'errors', 'prompt_tokens', 'completion_tokens', 'cost_usd', 'latency')
+
+    def __init__(self):
+        self.calls = self.errors = self.prompt_tokens = self.completion_tokens = 0
+        self.cost_usd = 0.0
+        self.latency = LatencyHistogram()
+
+    def to_dict(self):
+        summary = self.latency.summary()
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': self.prompt_tokens + self.completion_tokens,
+            'cost_usd': round(self.cost_usd, 6),
+            'latency_ms': {p: round(summary[p] * 1000, 1) if summary[p] is not None else None
+                           for p in ('p50', 'p95', 'p99')},
+        }
+
+
+def usage_report(days=7, user_limit=20):
+    """Tokens, cost and latency percentiles of the last ``days`` days, per endpoint, model and client."""
+    from app import db
+    from app.models.ai_usage import AIUsageDaily, AIUsageEvent
+
+    since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    groups = {'endpoint': {}, 'model': {}, 'subject': {}}
+    overall = _Totals()
+
+    def add(row, calls, errors, latency):
+        for totals in [overall] + [groups[field].setdefault(getattr(row, field) or 'unknown', _Totals())
+                                   for field in groups]:
+            totals.calls += calls
+            totals.errors += errors
+            totals.prompt_tokens += row.prompt_tokens
+            totals.completion_tokens += row.completion_tokens
+            totals.cost_usd += row.cost_usd
+            latency(totals.latency)
+
+    daily = db.session.execute(db.select(
+        AIUsageDaily.endpoint, AIUsageDaily.model, AIUsageDaily.subject, AIUsageDaily.calls, AIUsageDaily.errors,
+        AIUsageDaily.prompt_tokens, AIUsageDaily.completion_tokens, AIUsageDaily.cost_usd,
+        AIUsageDaily.latency_counts, AIUsageDaily.latency_sum,
+    ).where(AIUsageDaily.day >= since))
+    for row in daily:
+        add(row, row.calls, row.errors, lambda h, row=row: h.merge(row.latency_counts, row.latency_sum))
+
+    # Days not rolled up yet (today, at least)
+    events = db.session.execute(db.select(
+        AIUsageEvent.endpoint, AIUsageEvent.model, AIUsageEvent.subject, AIUsageEvent.prompt_tokens,
+        AIUsageEvent.completion_tokens, AIUsageEvent.cost_usd, AIUsageEvent.latency_ms, AIUsageEvent.outcome,
+    ).where(AIUsageEvent.created_at >= _midnight(since)))
+    for row in events:
+        add(row, 1, int(_is_error(row.outcome)), lambda h, row=row: h.observe(row.latency_ms / 1000.0))
+
+    def ranked(field, limit=None):
+        items = sorted(groups[field].items(), key=lambda item: item[1].cost_usd, reverse=True)[:limit]
+        return [dict({field: name}, **totals.to_dict()) for name, totals in items]
+
+    return {
+        'since': since.isoformat(),
+        'days': days,
+        'totals': overall.to_dict(),
+        'by_endpoint': ranked('endpoint'),
+        'by_model': ranked('model'),
+        'by_user': ranked('subject', user_limit),
+    }
+
+
+# ----------------------------------------------------------------------
+# Flask integration
+# ----------------------------------------------------------------------
+def get_usage_recorder(app=None):
+    """Return the app's usage recorder, or None when accounting is disabled."""
+    if app is None:
+        app = current_app._get_current_object()
+    if not app.config.get('AI_USAGE_ENABLED', True):
+        return None
+    recorder = app.extensions.get('ai_usage')
+    if recorder is None:
+        recorder = app.extensions.setdefault('ai_usage', UsageRecorder(app.config.get('AI_USAGE_BUFFER_MAX', 10000)))
+    return recorder
+
+
+def attribute_ai_calls(endpoint, subject=None):
+    """Record the AI calls made from here on (in this request or job) against ``endpoint`` and ``subject``."""
+    recorder = get_usage_recorder()
+    _attribution.set((recorder, endpoint, subject) if recorder else None)
+    if has_request_context():
+        g.ai_attribution = True
+
+
+def _on_call(model, prompt_tokens, completion_tokens, latency, outcome):
+    attribution = _attribution.get()
+    if attribution is not None:
+        recorder, endpoint, subject = attribution
+        recorder.record(endpoint, subject, model, prompt_tokens, completion_tokens, latency, outcome)
+
+
+add_usage_listener(_on_call)
+
+
+def init_usage_accounting(app):
+    """Clear the attribution after each request and start the flush/rollup thread."""
+    @app.teardown_request
+    def _clear_attribution(exc=None):
+        # Runs after streamed responses finish, so their calls are still attributed
+        if g.pop('ai_attribution', None):
+            _attribution.set(None)
+
+    if not app.config.get('AI_USAGE_ENABLED', True):
+        return None
+    interval = max(app.config.get('AI_USAGE_FLUSH_INTERVAL', 5), 1)
+    rollup_interval = app.config.get('AI_USAGE_ROLLUP_INTERVAL', 3600)
+
+    def run():
+        next_rollup = time.monotonic() + min(rollup_interval, 60)  # catch up soon after a restart
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    recorder = get_usage_recorder(app)
+                    recorder.flush()
+                    if rollup_interval and time.monotonic() >= next_rollup:
+                        next_rollup = time.monotonic() + rollup_interval
+                        rolled = recorder.rollup()
+                        if rolled:
+                            logger.info("Rolled up %d AI usage events", rolled)
+            except Exception:
+                logger.exception("AI usage flush failed")
+
+    thread = threading.Thread(target=run, name='ai-usage', daemon=True)
+    thread.start()
+    return thread
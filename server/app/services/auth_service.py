@@ -1,15 +1,81 @@
 # server/app/services/auth_service.py
-from flask import current_app
 from app.models.user import User # Import the User model
 from app import db # Import the db instance from the app package
 from flask_jwt_extended import create_access_token
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from app.utils.passwords import HashingBusy, get_password_hasher
+import csv
+import io
+import json
+import logging
 import re
+import secrets
+
+logger = logging.getLogger(__name__)
+
+USERNAME_MAX_LENGTH = 80  # users.username
+SUFFIX_ROOM = 6  # digits kept free for the uniqueness suffix
+MAX_USERNAME_ATTEMPTS = 3  # allocations tried when a concurrent registration takes the same name
+MAX_PROVISION_BATCH = 5000
+LOOKUP_CHUNK_SIZE = 500
 
 def validate_email(email):
     """Simple email validation using regex."""
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return re.match(pattern, email) is not None
 
+def username_base(name):
+    """Lowercased name with spaces as underscores and anything else dropped."""
+    base = re.sub(r'[^a-zA-Z0-9_]', '', (name or '').replace(' ', '_')).lower()
+    return (base or 'user')[:USERNAME_MAX_LENGTH - SUFFIX_ROOM]
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def allocate_usernames(names):
+    """
+    Unique usernames for ``names``, with one query for all of them.
+
+    A base that is free is used as is; otherwise it gets the next suffix
+    after the highest one in use ("john", "john1", "john2"...). Names in the
+    same batch get consecutive suffixes. Uniqueness is only guaranteed
+    until another transaction commits, so callers retry on IntegrityError.
+    """
+    bases = [username_base(name) for name in names]
+    highest = {}  # base -> highest suffix in use; -1 = only the bare base
+    distinct = sorted(set(bases))
+    for start in range(0, len(distinct), LOOKUP_CHUNK_SIZE):
+        chunk = distinct[start:start + LOOKUP_CHUNK_SIZE]
+        wanted = set(chunk)
+        taken = db.session.execute(
+            db.select(User.username).where(or_(*[User.username.like(_escape_like(base) + '%', escape='\\')
+                                                 for base in chunk]))
+        ).scalars()
+        for username in taken:
+            # "john12" belongs to base "john12" (bare), "john1" (suffix 2) and "john" (suffix 12)
+            cut = len(username)
+            while True:
+                base, suffix = username[:cut], username[cut:]
+                if base in wanted:
+                    highest[base] = max(highest.get(base, -1), int(suffix) if suffix else -1)
+                if cut == 0 or not username[cut - 1].isdigit():
+                    break
+                cut -= 1
+
+    usernames = []
+    for base in bases:
+        if base not in highest:
+            highest[base] = -1
+            usernames.append(base)
+        else:
+            highest[base] = max(highest[base], 0) + 1
+            usernames.append(f"{base}{highest[base]}")
+    return usernames
+
+
 def register_user(name, email, password):
     """
     Handles user registration logic.
@@ -24,37 +90,39 @@ def register_user(name, email, password):
     if not validate_email(email):
         return {"error": "Invalid email format."}, 400
 
-    # --- NEW: Generate a simple username from the name ---
-    # Basic sanitization: remove non-alphanumeric characters and spaces, lowercase
-    # Consider potential duplicates and add a suffix if needed (simplified here)
-    # In a real application, you'd need a more robust method to ensure uniqueness
-    base_username = re.sub(r'[^a-zA-Z0-9_]', '', name.replace(' ', '_')).lower()
-    username = base_username
-    counter = 1
-    # Check for uniqueness in the database
-    while User.query.filter_by(username=username).first():
-        username = f"{base_username}{counter}"
-        counter += 1
-
     # 2. Check if user already exists by email
     existing_user = User.query.filter_by(email=email).first()
     if existing_user:
         return {"error": "A user with this email already exists."}, 409 # Conflict
 
-    # 3. Create new user - now including the generated username
-    new_user = User(name=name, email=email, username=username) # <-- Add username here
-    new_user.set_password(password) # Hash the password
+    # 3. Create new user, hashing the password once for all allocation attempts
+    new_user = User(name=name, email=email)
+    try:
+        new_user.set_password(password) # Hash the password
+    except HashingBusy:
+        return {"error": "The server is busy. Please try again."}, 503
 
-    # 4. Add user to the database session
-    db.session.add(new_user)
     try:
-        # 5. Commit the transaction
-        db.session.commit()
+        # 4. Allocate a unique username (one query) and commit; a concurrent
+        # registration that took the same name makes us allocate again
+        for attempt in range(MAX_USERNAME_ATTEMPTS):
+            new_user.username = allocate_usernames([name])[0]
+            db.session.add(new_user)
+            try:
+                db.session.commit()
+                break
+            except IntegrityError:
+                db.session.rollback()
+                if User.query.filter_by(email=email).first():
+                    return {"error": "A user with this email already exists."}, 409
+                logger.info("Username %s was taken concurrently, allocating again", new_user.username)
+        else:
+            return {"error": "Could not allocate a username. Please try again."}, 503
         
-        # 6. Generate JWT token for the new user
-        access_token = create_access_token(identity=new_user.id) # Use user ID as identity
+        # 5. Generate JWT token for the new user
+        access_token = create_access_token(identity=str(new_user.id)) # User ID as identity (JWT subjects are strings)
         
-        # 7. Return success message, token, and user data
+        # 6. Return success message, token, and user data
         # Include the generated username in the response if needed
         return {
             "message": "User registered successfully.",
@@ -68,9 +136,9 @@ def register_user(name, email, password):
         }, 201 # 201 Created
         
     except Exception as e:
-        # 8. Rollback in case of error
+        # 7. Rollback in case of error
         db.session.rollback()
-        current_app.logger.error(f"Registration error: {str(e)}")
+        logger.error("Registration error: %s", e)
         # Check if the error is related to username or email constraints after potential rollback issues
         # This is a general catch; you might want more specific handling
         return {"error": "An error occurred during registration. Please try again."}, 500
@@ -88,11 +156,23 @@ def login_user(email, password):
     user = User.query.filter_by(email=email).first()
 
     # 3. Check if user exists and password is correct
-    if not user or not user.check_password(password):
-        return {"error": "Invalid email or password."}, 401 # Unauthorized
+    try:
+        if not user or not user.check_password(password):
+            return {"error": "Invalid email or password."}, 401 # Unauthorized
+
+        # Upgrade hashes made with older settings while we have the plain password
+        if user.password_needs_rehash():
+            user.set_password(password)
+            try:
+                db.session.commit()
+            except Exception:
+                db.session.rollback()  # the old hash still works; try again next login
+                logger.exception("Could not store rehashed password for user %s", user.id)
+    except HashingBusy:
+        return {"error": "The server is busy. Please try again."}, 503
 
     # 4. Generate JWT token
-    access_token = create_access_token(identity=user.id) # Use user ID as identity
+    access_token = create_access_token(identity=str(user.id)) # User ID as identity (JWT subjects are strings)
 
     # 5. Return success message and token
     return {
@@ -103,4 +183,104 @@ def login_user(email, password):
             "name": user.name,
             "email": user.email
         }
-    }, 200
\ No newline at end of file
+    }, 200
+
+
+class ProvisioningError(ValueError):
+    """A bulk provisioning batch was rejected; ``errors`` lists the problems per record."""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(errors[:10]))
+        self.errors = errors
+
+
+def parse_user_records(data, filename=''):
+    """Parse a JSON list (or {"users": [...]}) or a CSV file with name,email[,password] columns."""
+    if filename.endswith('.csv'):
+        return list(csv.DictReader(io.StringIO(data)))
+    records = json.loads(data)
+    return records['users'] if isinstance(records, dict) else records
+
+
+def provision_users(records):
+    """
+    Create many users (e.g. a whole organisation) in a single transaction.
+
+    Each record needs ``name`` and ``email``; without a ``password`` the
+    user gets a random temporary one, returned once in the result. Nothing
+    is created if any record is invalid or its email is taken: a
+    ProvisioningError lists every problem instead.
+    """
+    if len(records) > MAX_PROVISION_BATCH:
+        raise ProvisioningError([f"At most {MAX_PROVISION_BATCH} users per batch"])
+
+    errors, rows, seen = [], [], set()
+    for number, record in enumerate(records, 1):
+        name = (record.get('name') or '').strip()
+        email = (record.get('email') or '').strip()
+        password = record.get('password') or None
+        if not name or not email:
+            errors.append(f"Record {number}: 'name' and 'email' are required")
+        elif not validate_email(email):
+            errors.append(f"Record {number}: invalid email {email}")
+        elif password is not None and len(password) < 8:
+            errors.append(f"Record {number}: password must be at least 8 characters long")
+        elif email in seen:
+            errors.append(f"Record {number}: duplicate email {email} in this batch")
+        else:
+            seen.add(email)
+            rows.append({'name': name, 'email': email, 'password': password})
+
+    errors.extend(f"A user with email {email} already exists" for email in _existing_emails(seen))
+    if errors:
+        raise ProvisioningError(errors)
+
+    temporary = {}
+    passwords = []
+    for row in rows:
+        password = row.pop('password')
+        if password is None:
+            password = temporary[row['email']] = secrets.token_urlsafe(12)
+        passwords.append(password)
+    for row, password_hash in zip(rows, get_password_hasher().hash_many(passwords)):
+        row['password_hash'] = password_hash
+
+    for attempt in range(MAX_USERNAME_ATTEMPTS):
+        for row, username in zip(rows, allocate_usernames([row['name'] for row in rows])):
+            row['username'] = username
+        try:
+            # One executemany instead of an INSERT per ORM object
+            db.session.execute(db.insert(User), rows)
+            ids = dict(_lookup([User.email, User.id], seen))
+            db.session.commit()
+            break
+        except IntegrityError:
+            db.session.rollback()
+            taken = _existing_emails(seen)
+            if taken:
+                raise ProvisioningError([f"A user with email {email} already exists" for email in taken])
+            logger.info("Usernames were taken concurrently, allocating again")
+    else:
+        raise RuntimeError("Could not allocate usernames for the batch")
+
+    created = [{'id': ids[row['email']], 'username': row['username'], 'name': row['name'], 'email': row['email']}
+               for row in rows]
+    for entry in created:
+        if entry['email'] in temporary:
+            entry['temporary_password'] = temporary[entry['email']]
+    return created
+
+
+def _lookup(columns, emails):
+    """Rows of ``columns`` for the users with the given emails, in chunked IN queries."""
+    emails = sorted(emails)
+    rows = []
+    for start in range(0, len(emails), LOOKUP_CHUNK_SIZE):
+        rows.extend(db.session.execute(
+            db.select(*columns).where(User.email.in_(emails[start:start + LOOKUP_CHUNK_SIZE]))
+        ).all())
+    return rows
+
+
+def _existing_emails(emails):
+    return sorted(email for email, in _lookup([User.email], emails))
@@ -0,0 +1,290 @@
+# server/app/services/chat_cache.py
+"""
+Response cache for the marketplace chat.
+
+Most chat messages are near-duplicates ("best sustainable water bottles",
+"top eco-friendly water bottle"...). Before calling the model, a message is
+normalized to a set of keywords (``app.utils.text.tokenize``):
+
+- lowercased and tokenized (hyphenated words kept whole)
+- stopwords and intent words ("recommend", "looking"...) dropped, but not
+  price and ranking constraints ("cheap", "under", "best"...)
+- eco synonyms ("eco-friendly", "sustainable", "green") folded into "eco"
+- plurals lemmatized ("bottles" -> "bottle")
+
+The key also records whether ``extract_keywords`` matched, because that
+decides which prompt context the model gets. A lookup first tries the exact
+key, then the most similar cached entry by token-set (Jaccard) similarity
+with the same constraints (price and ranking words, numbers), found through
+a token -> keys inverted index, so lookups stay in memory and take well
+under a millisecond.
+
+Entries expire after ``CHAT_CACHE_TTL`` seconds and the least recently used
+are evicted beyond ``CHAT_CACHE_MAX_ENTRIES``. With
+``CHAT_CACHE_BACKEND=database`` entries are also written to the
+``chat_cache_entries`` table: the cache is warmed from it on first use and
+workers share answers through it.
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from app.utils.text import CACHE_STOPWORDS, CONSTRAINT_WORDS, tokenize
+
+logger = logging.getLogger(__name__)
+
+# The query shape ai_chat tailors its prompt context to
+KEYWORD_PATTERN = re.compile(
+    r'(best|top|recommend)\s+(eco-friendly|sustainable|green|organic)\s+(.+?)(?:\s+2025|$)'
+)
+
+def extract_keywords(message):
+    """
+    Return (eco_type, product) for "best sustainable <product>" style
+    messages, or None.
+    """
+    match = KEYWORD_PATTERN.search(message)
+    if not match:
+        return None
+    return match.group(2), match.group(3)
+
+
+def _constraints(tokens):
+    """Terms a near-duplicate must share exactly: "under 500" is not "under 1000"."""
+    return {token for token in tokens if token in CONSTRAINT_WORDS or token.isdigit()}
+
+
+def normalize_query(message):
+    """
+    Returns (normalized_key, tokens). The key is None when nothing
+    meaningful is left to cache on.
+    """
+    tokens = frozenset(tokenize(message, stopwords=CACHE_STOPWORDS))
+    if not tokens:
+        return None, tokens
+    mode = 'kw' if extract_keywords(message.lower().strip()) else 'q'
+    return f"{mode}:{' '.join(sorted(tokens))}", tokens
+
+
+class _Entry:
+    __slots__ = ('key', 'mode', 'tokens', 'response', 'expires_at')
+
+    def __init__(self, key, tokens, response, expires_at):
+        self.key = key
+        self.mode = key.split(':', 1)[0]
+        self.tokens = tokens
+        self.response = response
+        self.expires_at = expires_at  # time.time() based, so it can be persisted
+
+
+class ChatCache:
+    """In-memory TTL + LRU cache with near-duplicate lookup."""
+
+    def __init__(self, ttl=86400, max_entries=1000, similarity=0.8, persist=False):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.persist = persist
+        self.stats = {'hits': 0, 'near_hits': 0, 'shared_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+        self._entries = OrderedDict()  # key -> _Entry, least recently used first
+        self._index = {}  # token -> set of keys
+        self._lock = threading.Lock()
+        self._warmed = not persist
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            ttl=config.get('CHAT_CACHE_TTL', 86400),
+            max_entries=config.get('CHAT_CACHE_MAX_ENTRIES', 1000),
+            similarity=config.get('CHAT_CACHE_SIMILARITY', 0.8),
+            persist=config.get('CHAT_CACHE_BACKEND', 'memory') == 'database',
+        )
+
+    # ------------------------------------------------------------------
+    # In-memory store (callers hold the lock)
+    # ------------------------------------------------------------------
+    def _put(self, entry):
+        self._drop(entry.key)
+        self._entries[entry.key] = entry
+        for token in entry.tokens:
+            self._index.setdefault(token, set()).add(entry.key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+            self.stats['evictions'] += 1
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for token in entry.tokens:
+            keys = self._index.get(token)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[token]
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _most_similar(self, key, tokens, now):
+        mode = key.split(':', 1)[0]
+        shared = {}
+        for token in tokens:
+            for candidate in self._index.get(token, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        best, best_score = None, self.similarity
+        constraints = _constraints(tokens)
+        for candidate, count in shared.items():
+            entry = self._entries[candidate]
+            if entry.mode != mode or _constraints(entry.tokens) != constraints:
+                continue
+            score = count / (len(tokens) + len(entry.tokens) - count)  # Jaccard
+            if score >= best_score:
+                best, best_score = candidate, score
+        return self._live(best, now) if best else None
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def get(self, message):
+        """Cached answer for ``message`` (or a near-duplicate of it), else None."""
+        key, tokens = normalize_query(message)
+        if key is None:
+            return None
+        self._warm()
+        now = time.time()
+
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is not None:
+                self.stats['hits'] += 1
+                return entry.response
+            entry = self._most_similar(key, tokens, now)
+            if entry is not None:
+                self.stats['near_hits'] += 1
+                return entry.response
+
+        if self.persist:
+            entry = self._load_shared(key, tokens)
+            if entry is not None:
+                with self._lock:
+                    self._put(entry)
+                    self.stats['shared_hits'] += 1
+                return entry.response
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def set(self, message, response):
+        key, tokens = normalize_query(message)
+        if key is None or not response:
+            return
+        entry = _Entry(key, tokens, response, time.time() + self.ttl)
+        with self._lock:
+            self._put(entry)
+            self.stats['stores'] += 1
+        if self.persist:
+            self._save_shared(entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+
+    def describe(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'backend': 'database' if self.persist else 'memory',
+                    'stats': dict(self.stats)}
+
+    # ------------------------------------------------------------------
+    # Persistent backend
+    # ------------------------------------------------------------------
+    def _warm(self):
+        """Load unexpired entries from the database once per process."""
+        if self._warmed:
+            return
+        with self._lock:
+            if self._warmed:
+                return
+            self._warmed = True
+        try:
+            from app import db
+            from app.models.chat_cache import ChatCacheEntry
+
+            now = datetime.utcnow()
+            ChatCacheEntry.query.filter(ChatCacheEntry.expires_at <= now).delete()
+            db.session.commit()
+            rows = ChatCacheEntry.query.order_by(ChatCacheEntry.created_at.desc()).limit(self.max_entries).all()
+            with self._lock:
+                for row in reversed(rows):  # oldest first, so the newest end up most recently used
+                    self._put(self._from_row(row))
+        except Exception:
+            logger.exception("Could not warm the chat cache from the database")
+
+    def _from_row(self, row):
+        key = row.normalized_key
+        tokens = frozenset(key.split(':', 1)[1].split(' '))
+        expires_at = time.time() + (row.expires_at - datetime.utcnow()).total_seconds()
+        return _Entry(key, tokens, row.response, expires_at)
+
+    def _load_shared(self, key, tokens):
+        """Exact-key lookup in the database, for answers cached by another worker."""
+        try:
+            from app.models.chat_cache import ChatCacheEntry
+
+            row = ChatCacheEntry.query.get(_key_hash(key))
+            if row is None or row.expires_at <= datetime.utcnow():
+                return None
+            return self._from_row(row)
+        except Exception:
+            logger.exception("Chat cache database lookup failed")
+            return None
+
+    def _save_shared(self, entry):
+        try:
+            from app import db
+            from app.models.chat_cache import ChatCacheEntry
+
+            db.session.merge(ChatCacheEntry(
+                key_hash=_key_hash(entry.key),
+                normalized_key=entry.key[:500],
+                response=entry.response,
+                created_at=datetime.utcnow(),
+                expires_at=datetime.utcnow() + timedelta(seconds=self.ttl),
+            ))
+            db.session.commit()
+        except Exception:
+            from app import db
+            db.session.rollback()
+            logger.exception("Could not persist chat cache entry")
+
+
+def _key_hash(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def get_chat_cache(app=None):
+    """Return the app's chat cache, or None when caching is disabled."""
+    if app is None:
+        from flask import current_app
+        app = current_app._get_current_object()
+    if not app.config.get('CHAT_CACHE_ENABLED', True):
+        return None
+    cache = app.extensions.get('chat_cache')
+    if cache is None:
+        cache = app.extensions.setdefault('chat_cache', ChatCache.from_config(app.config))
+    return cache
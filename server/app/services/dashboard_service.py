@@ -0,0 +1,151 @@
+# server/app/services/dashboard_service.py
+"""
+Everything the dashboard page shows, in one request.
+
+Sections (``fields=``): user, recent_activities, weekly_stats,
+category_breakdown and recent_scans. They are loaded with at most one
+statement per table:
+
+- users: the user's row
+- activities: the last ``days`` (at least 7) days of activities, newest
+  first; the weekly stats and the category breakdown are computed from
+  them, and so are the recent activities unless the window holds fewer
+  than ``limit`` (then one more, limited query)
+- waste_items: the user's latest scans, from the (user_id, created_at) index
+
+The loads are independent, so on databases that serve several connections
+at once (PostgreSQL) they run concurrently, each on its own pooled
+connection (``DASHBOARD_PARALLEL_QUERIES``), and the page takes as long as
+its slowest query rather than their sum. On SQLite they run one after the
+other in the request's session. Either way they read from the read
+replica when the request is routed there.
+"""
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models.activity import Activity
+from app.models.user import User
+from app.models.waste_item import WasteItem
+from app.services.activity_service import ActivityService
+from app.utils.database import read_engine
+
+logger = logging.getLogger(__name__)
+
+SECTIONS = ('user', 'recent_activities', 'weekly_stats', 'category_breakdown', 'recent_scans')
+ACTIVITY_SECTIONS = ('recent_activities', 'weekly_stats', 'category_breakdown')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def parse_fields(value):
+    """'user,weekly_stats' -> the requested sections in payload order; all of them when empty."""
+    if not value:
+        return SECTIONS
+    fields = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = sorted(fields - set(SECTIONS))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return tuple(section for section in SECTIONS if section in fields)
+
+
+def _load_user(session, user_id):
+    user = session.get(User, user_id)
+    return {'user': user.to_dict() if user else None}
+
+
+def _load_activities(session, user_id, fields, limit, days):
+    result = {}
+    if 'weekly_stats' in fields or 'category_breakdown' in fields:
+        now = datetime.utcnow()
+        activities = session.scalars(
+            select(Activity)
+            .where(Activity.user_id == user_id, Activity.created_at >= now - timedelta(days=max(days, 7)))
+            .order_by(Activity.created_at.desc())
+        ).all()
+        if 'weekly_stats' in fields:
+            week_ago = now - timedelta(days=7)
+            result['weekly_stats'] = ActivityService.summarize_week(
+                [a for a in activities if a.created_at >= week_ago])
+        if 'category_breakdown' in fields:
+            since = now - timedelta(days=days)
+            result['category_breakdown'] = ActivityService.summarize_categories(
+                [a for a in activities if a.created_at >= since])
+        if 'recent_activities' in fields and len(activities) >= limit:
+            result['recent_activities'] = [a.to_dict() for a in activities[:limit]]
+
+    if 'recent_activities' in fields and 'recent_activities' not in result:
+        recent = session.scalars(
+            select(Activity).where(Activity.user_id == user_id).order_by(Activity.created_at.desc()).limit(limit)
+        ).all()
+        result['recent_activities'] = [a.to_dict() for a in recent]
+    return result
+
+
+def _load_scans(session, user_id, limit):
+    scans = session.scalars(
+        select(WasteItem).where(WasteItem.user_id == user_id)
+        .order_by(WasteItem.created_at.desc(), WasteItem.id.desc()).limit(limit)
+    ).all()
+    return {'recent_scans': [scan.to_dict() for scan in scans]}
+
+
+def _in_own_session(engine, loader):
+    with Session(engine) as session:
+        return loader(session)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=current_app.config.get('DASHBOARD_QUERY_THREADS', 4),
+                    thread_name_prefix='dashboard',
+                )
+    return _executor
+
+
+def parallel_queries_enabled():
+    setting = str(current_app.config.get('DASHBOARD_PARALLEL_QUERIES', 'auto')).lower()
+    if setting == 'auto':
+        return db.engine.dialect.name != 'sqlite'  # one writer, in-process: nothing to overlap
+    return setting in ('1', 'true', 'yes')
+
+
+def build_dashboard(user_id, fields=SECTIONS, limit=10, days=30, scans=6):
+    """
+    The requested dashboard sections of ``user_id``. ``user`` is None when
+    the user does not exist.
+    """
+    loaders = []
+    if 'user' in fields:
+        loaders.append(partial(_load_user, user_id=user_id))
+    if any(section in fields for section in ACTIVITY_SECTIONS):
+        loaders.append(partial(_load_activities, user_id=user_id, fields=fields, limit=limit, days=days))
+    if 'recent_scans' in fields:
+        loaders.append(partial(_load_scans, user_id=user_id, limit=scans))
+
+    if len(loaders) > 1 and parallel_queries_enabled():
+        engine = read_engine()  # the replica when this request reads from it
+        # Each in a copy of the request's context, so its SQL is counted for the request
+        futures = [_get_executor().submit(contextvars.copy_context().run, _in_own_session, engine, loader)
+                   for loader in loaders]
+        parts = [future.result() for future in futures]
+    else:
+        parts = [loader(db.session) for loader in loaders]
+
+    payload = {}
+    for part in parts:
+        payload.update(part)
+    return {section: payload[section] for section in fields}
@@ -0,0 +1,106 @@
+# server/app/services/image_variants.py
+"""
+Resized variants (thumbnails) of stored scan images.
+
+Variants live next to the originals in the upload store, keyed by the
+original's content hash: ``variants/<size>/<hh>/<sha256>.jpg``.
+"""
+import io
+import os
+
+from app.services.storage_service import MIME_TYPES, VARIANTS_PREFIX
+
+# Longest edge in pixels
+VARIANT_SIZES = {
+    'thumb': 256,
+    'medium': 1024,
+}
+
+VARIANT_FORMAT = 'JPEG'
+VARIANT_EXTENSION = 'jpg'
+VARIANT_MIME_TYPE = 'image/jpeg'
+
+
+def variant_key(content_hash, size):
+    return f"{VARIANTS_PREFIX}/{size}/{content_hash[:2]}/{content_hash}.{VARIANT_EXTENSION}"
+
+
+def variant_keys(content_hash):
+    return [variant_key(content_hash, size) for size in VARIANT_SIZES]
+
+
+def render_variant(data, size):
+    """Downsize image bytes so the longest edge is at most VARIANT_SIZES[size]."""
+    from PIL import Image, ImageOps  # Pillow is only needed when variants are built
+
+    max_edge = VARIANT_SIZES[size]
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge))
+        if image.mode not in ('RGB', 'L'):
+            # JPEG has no alpha channel: flatten onto white
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.split()[-1])
+            image = background
+        out = io.BytesIO()
+        image.save(out, VARIANT_FORMAT, quality=82, optimize=True, progressive=True)
+        return out.getvalue()
+
+
+def ensure_variant(storage, original_key, content_hash, size):
+    """
+    Return the key of the ``size`` variant, building it from the original
+    if it doesn't exist yet. Returns None when neither exists.
+    """
+    key = variant_key(content_hash, size)
+    if storage.exists(key):
+        return key
+    if not original_key or not storage.exists(original_key):
+        return None
+    storage.put_bytes(key, render_variant(storage.read_bytes(original_key), size), VARIANT_MIME_TYPE)
+    return key
+
+
+class ResolvedImage:
+    """Where to read an image from, plus the metadata needed to serve it."""
+
+    def __init__(self, key, mimetype, etag, size, path=None):
+        self.key = key
+        self.mimetype = mimetype
+        self.etag = etag
+        self.size = size  # 'original' or a variant; may differ from the size asked for
+        self.path = path  # set for legacy uploads stored outside the content-addressed layout
+
+
+def resolve_image(storage, waste_item, size):
+    """
+    Find the best available image for ``waste_item`` at ``size``.
+
+    Variants are built on first request. When the original has been
+    downsized by the sweeper, the largest remaining variant is used instead;
+    the ResolvedImage's ``size`` says which one was found. Returns a
+    ResolvedImage or None.
+    """
+    if not waste_item.storage_key or not waste_item.content_hash:
+        # Uploaded before content addressing: only the original file exists
+        path = waste_item.filepath
+        if not path or not os.path.isfile(path):
+            return None
+        extension = path.rsplit('.', 1)[-1].lower()
+        return ResolvedImage(None, MIME_TYPES.get(extension, 'application/octet-stream'), None, 'original', path=path)
+
+    content_hash = waste_item.content_hash
+    if size == 'original':
+        if storage.exists(waste_item.storage_key):
+            mimetype = MIME_TYPES.get(waste_item.storage_key.rsplit('.', 1)[-1], 'application/octet-stream')
+            return ResolvedImage(waste_item.storage_key, mimetype, f'{content_hash}-original', 'original')
+        fallbacks = ['medium', 'thumb']
+    else:
+        fallbacks = [size] + [name for name in ('medium', 'thumb') if name != size]
+
+    for name in fallbacks:
+        key = ensure_variant(storage, waste_item.storage_key, content_hash, name)
+        if key:
+            return ResolvedImage(key, VARIANT_MIME_TYPE, f'{content_hash}-{name}', name)
+    return None
@@ -0,0 +1,381 @@
+# server/app/services/marketplace_service.py
+"""
+Product catalog search for the marketplace chat.
+
+The catalog (``products`` table) is held in an in-memory inverted index and
+ranked with BM25, so a chat question that the catalog can answer is served
+in a few milliseconds without calling the model.
+
+Keeping the index current:
+
+- changes committed by this process are applied to the index right after
+  the commit (SQLAlchemy session events), one product at a time
+- changes committed by other workers are picked up on the next search once
+  ``MARKETPLACE_INDEX_REFRESH`` seconds have passed: products updated since
+  the newest one indexed are re-read, and a count mismatch (a delete
+  elsewhere) triggers a full rebuild
+"""
+import csv
+import io
+import json
+import logging
+import math
+import re
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models.products import Product
+from app.utils.text import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Field boosts, applied by repeating a field's terms in the indexed document
+FIELD_WEIGHTS = {
+    'name': 3,
+    'category': 2,
+    'certifications': 1,
+    'description': 1,
+}
+
+# Terms that appear in nearly every question and say nothing about the product wanted
+GENERIC_TERMS = frozenset({'eco', 'kenya', 'kenyan'})
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Results scoring below this share of the best one are left out of chat answers
+RELATIVE_SCORE_CUTOFF = 0.5
+
+_build_lock = threading.Lock()
+
+
+class ProductIndex:
+    """Incrementally maintained BM25 index over product documents."""
+
+    def __init__(self, refresh_interval=60):
+        self.refresh_interval = refresh_interval
+        self._postings = {}  # term -> {product_id: term frequency}
+        self._lengths = {}  # product_id -> document length
+        self._terms = {}  # product_id -> set of terms, for removal
+        self._documents = {}  # product_id -> product dict, served without a DB hit
+        self._total_length = 0
+        self._newest = None  # highest updated_at indexed
+        self._last_refresh = 0.0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._documents)
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+    @staticmethod
+    def document_terms(product):
+        terms = []
+        for field, weight in FIELD_WEIGHTS.items():
+            value = product.get(field)
+            if isinstance(value, list):
+                value = ' '.join(value)
+            terms.extend(tokenize(value) * weight)
+        return terms
+
+    def add(self, product):
+        """Index (or re-index) one product dict."""
+        with self._lock:
+            self.remove(product['id'])
+            terms = self.document_terms(product)
+            frequencies = {}
+            for term in terms:
+                frequencies[term] = frequencies.get(term, 0) + 1
+            for term, count in frequencies.items():
+                self._postings.setdefault(term, {})[product['id']] = count
+            self._lengths[product['id']] = len(terms)
+            self._terms[product['id']] = set(frequencies)
+            self._documents[product['id']] = product
+            self._total_length += len(terms)
+
+            updated_at = product.get('updated_at')
+            if updated_at and (self._newest is None or updated_at > self._newest):
+                self._newest = updated_at
+
+    def remove(self, product_id):
+        with self._lock:
+            for term in self._terms.pop(product_id, ()):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(product_id, None)
+                    if not postings:
+                        del self._postings[term]
+            self._total_length -= self._lengths.pop(product_id, 0)
+            self._documents.pop(product_id, None)
+
+    def rebuild(self):
+        """Re-read the whole catalog."""
+        products = [p.to_dict() for p in Product.query.all()]
+        with self._lock:
+            self._postings.clear()
+            self._lengths.clear()
+            self._terms.clear()
+            self._documents.clear()
+            self._total_length = 0
+            self._newest = None
+            for product in products:
+                self.add(product)
+            self._last_refresh = time.monotonic()
+        logger.info("Product index rebuilt: %d products", len(products))
+
+    def refresh(self, force=False):
+        """Pick up changes committed by other processes."""
+        if not force and time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        self._last_refresh = time.monotonic()
+
+        count, newest = db.session.query(func.count(Product.id), func.max(Product.updated_at)).one()
+        newest = newest.isoformat() if newest else None
+        if newest and (self._newest is None or newest > self._newest):
+            since = datetime.fromisoformat(self._newest) if self._newest else datetime.min
+            # >= : a product committed elsewhere in the same instant must not be skipped
+            for product in Product.query.filter(Product.updated_at >= since):
+                self.add(product.to_dict())
+        if count != len(self):
+            self.rebuild()
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+    def search(self, query, limit=3):
+        """
+        Rank products for ``query``.
+
+        Returns (results, coverage): results are (score, product dict) best
+        first; coverage is the share of the query's specific terms that the
+        best result contains.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        specific = [t for t in terms if t not in GENERIC_TERMS] or terms
+        if not terms:
+            return [], 0.0
+
+        with self._lock:
+            total = len(self._documents)
+            if not total:
+                return [], 0.0
+            average_length = self._total_length / total
+            scores = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for product_id, frequency in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[product_id] / average_length)
+                    scores[product_id] = scores.get(product_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+            results = [(score, self._documents[product_id]) for product_id, score in ranked]
+            coverage = 0.0
+            if ranked:
+                best_terms = self._terms[ranked[0][0]]
+                coverage = sum(1 for t in specific if t in best_terms) / len(specific)
+            return results, coverage
+
+
+def get_product_index(app=None):
+    """Return the app's product index, building it from the database on first use."""
+    if app is None:
+        app = current_app._get_current_object()
+    index = app.extensions.get('product_index')
+    if index is None:
+        with _build_lock:
+            index = app.extensions.get('product_index')
+            if index is None:
+                index = ProductIndex(refresh_interval=app.config.get('MARKETPLACE_INDEX_REFRESH', 60))
+                index.rebuild()
+                app.extensions['product_index'] = index
+    return index
+
+
+# ----------------------------------------------------------------------
+# Incremental updates from this process's commits
+# ----------------------------------------------------------------------
+@event.listens_for(Session, 'after_flush')
+def _collect_product_changes(session, flush_context):
+    changes = session.info.setdefault('product_index_changes', {})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Product):
+            changes[obj.id] = obj.to_dict()  # snapshot now: attributes expire on commit
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            changes[obj.id] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_product_changes(session):
+    changes = session.info.pop('product_index_changes', None)
+    if not changes or not has_app_context():
+        return
+    index = current_app.extensions.get('product_index')
+    if index is None:
+        return  # built from the database on first use anyway
+    for product_id, product in changes.items():
+        if product is None:
+            index.remove(product_id)
+        else:
+            index.add(product)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_product_changes(session):
+    session.info.pop('product_index_changes', None)
+
+
+# ----------------------------------------------------------------------
+# Chat answers
+# ----------------------------------------------------------------------
+def _format_price(product):
+    low, high = product.get('price_min_ksh'), product.get('price_max_ksh')
+    if low and high and low != high:
+        return f"Kshs {low:,} - Kshs {high:,}"
+    if low or high:
+        return f"Kshs {(low or high):,}"
+    return "Ask the retailer"
+
+
+def render_catalog_answer(products):
+    """Plain-text answer in the same layout the chat prompt asks the model for."""
+    category = products[0]['category']
+    lines = [
+        f"Hello! 🌿 Here are eco-friendly {category} options available in Kenya.",
+        "",
+        "SUMMARY",
+        f"These picks come from the Green-Nexus catalog, ranked for your question. "
+        f"Choosing durable, certified {category} cuts waste and supports local sustainable retailers.",
+        "",
+        f"TOP {len(products)} RECOMMENDATIONS" if len(products) > 1 else "TOP RECOMMENDATION",
+    ]
+    for number, product in enumerate(products, 1):
+        features = product.get('description') or product['category']
+        lines += [
+            "",
+            f"{number}. {product['name']}",
+            f"Key Features: {features}",
+            f"Eco-Score: {product['eco_score']:g}/10" if product.get('eco_score') is not None else "Eco-Score: not rated",
+            f"Price Range: {_format_price(product)}",
+            f"Where to Buy: {', '.join(product.get('retailers') or []) or 'Local eco-shops and markets'}",
+        ]
+
+    certifications = sorted({c for p in products for c in p.get('certifications') or []})
+    tip = (f"Look for {', '.join(certifications)} labels when you buy."
+           if certifications else "Buy durable products and reuse them for as long as possible.")
+    lines += ["", "PRO TIP", f"{tip} Buying from local shops also cuts transport emissions. 💚"]
+    return "\n".join(lines)
+
+
+def answer_from_catalog(message):
+    """
+    Answer a chat question from the catalog when it has a good match.
+
+    Returns (answer_text, products) or None to fall back to the model.
+    """
+    config = current_app.config
+    index = get_product_index()
+    index.refresh()
+    results, coverage = index.search(message, limit=config.get('MARKETPLACE_CATALOG_RESULTS', 3))
+    if not results or coverage < config.get('MARKETPLACE_CATALOG_MIN_COVERAGE', 0.6):
+        return None
+    if results[0][0] < config.get('MARKETPLACE_CATALOG_MIN_SCORE', 1.0):
+        return None
+    # Drop trailing results that only share a generic word with the question
+    top_score = results[0][0]
+    products = [product for score, product in results if score >= top_score * RELATIVE_SCORE_CUTOFF]
+    return render_catalog_answer(products), products
+
+
+# ----------------------------------------------------------------------
+# Bulk loading
+# ----------------------------------------------------------------------
+def slugify(value):
+    return re.sub(r'[^a-z0-9]+', '-', value.lower()).strip('-')[:120]
+
+
+def _as_list(value):
+    if value is None or value == '':
+        return []
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [part.strip() for part in str(value).split(';') if part.strip()]
+
+
+def _as_number(value, cast):
+    if value is None or value == '':
+        return None
+    return cast(value)
+
+
+def parse_catalog(data, filename=''):
+    """Parse a JSON list or a CSV file (list fields separated by ';') into product dicts."""
+    if filename.endswith('.csv'):
+        return list(csv.DictReader(io.StringIO(data)))
+    records = json.loads(data)
+    return records['products'] if isinstance(records, dict) else records
+
+
+def load_catalog(records, replace=False):
+    """
+    Insert or update products by slug in a single transaction.
+
+    With ``replace`` products missing from ``records`` are deleted.
+    Returns counts of created, updated and deleted products.
+    """
+    rows = []
+    for number, record in enumerate(records, 1):
+        name = (record.get('name') or '').strip()
+        category = (record.get('category') or '').strip()
+        if not name or not category:
+            raise ValueError(f"Catalog record {number}: 'name' and 'category' are required")
+        rows.append({
+            'slug': record.get('slug') or slugify(name),
+            'name': name,
+            'category': category,
+            'description': record.get('description'),
+            'eco_score': _as_number(record.get('eco_score'), float),
+            'price_min_ksh': _as_number(record.get('price_min_ksh'), int),
+            'price_max_ksh': _as_number(record.get('price_max_ksh'), int),
+            'retailers': _as_list(record.get('retailers')),
+            'certifications': _as_list(record.get('certifications')),
+        })
+
+    existing = {p.slug: p for p in Product.query.all()}
+    summary = {'created': 0, 'updated': 0, 'deleted': 0}
+    try:
+        for row in rows:
+            product = existing.get(row['slug'])
+            if product is None:
+                product = Product(**row)
+                db.session.add(product)
+                existing[row['slug']] = product
+                summary['created'] += 1
+            else:
+                changed = False
+                for field, value in row.items():
+                    if getattr(product, field) != value:
+                        setattr(product, field, value)
+                        changed = True
+                summary['updated'] += changed
+        if replace:
+            keep = {row['slug'] for row in rows}
+            for slug, product in existing.items():
+                if slug not in keep:
+                    db.session.delete(product)
+                    summary['deleted'] += 1
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return summary
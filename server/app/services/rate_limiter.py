@@ -0,0 +1,382 @@
+# server/app/services/rate_limiter.py
+"""
+Admission control for the AI endpoints (/api/chat and /api/waste-scanner/upload).
+
+Each request passes two checks before the view reads its body:
+
+- a token bucket per client and endpoint, refilled at
+  ``<ENDPOINT>_RATE_PER_MINUTE`` and holding up to ``<ENDPOINT>_RATE_BURST``
+- a daily AI budget per client: tokens (``AI_DAILY_TOKEN_BUDGET``) and
+  estimated cost in USD (``AI_DAILY_COST_BUDGET``), reset at midnight UTC
+
+A request that fails either check gets a 429 with ``Retry-After``. Clients
+are identified by the user id in their JWT when they send one, else by IP
+address. Token usage is billed to the client whose request made the AI call.
+
+The counters live in process memory, so a check costs no I/O. Every
+``RATE_LIMIT_SYNC_INTERVAL`` seconds a background thread adds this worker's
+new counts to the ``ai_usage_counters`` table and reads back the rows any
+worker changed since its last read. Budgets then see the usage of the whole deployment, and each
+bucket is drained by the requests other workers admitted for the same client
+since the last sync. Between two syncs a client can get past the limits by
+what the other workers admit; that is the price of keeping the database off
+the request path. Rows of past days are deleted once a day; the usage
+history is kept by ``ai_usage_daily``.
+"""
+import contextvars
+import importlib
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, g, request
+
+from app.services.ai_gateway import add_usage_listener
+from app.services.ai_usage import estimate_cost
+from app.utils.auth import current_identity
+
+logger = logging.getLogger(__name__)
+
+ENDPOINTS = ('chat', 'upload')
+IDLE_BUCKET_SECONDS = 3600  # full buckets unused this long are dropped
+SYNC_CHUNK_SIZE = 500
+READ_OVERLAP_SECONDS = 60
+COUNTER_KEEP_DAYS = 1  # past days of counters kept, for workers still flushing yesterday's counts
+
+# (controller, subject, endpoint) of the request being served, for billing
+_current_owner = contextvars.ContextVar('ai_usage_owner', default=None)
+
+
+def _today():
+    return datetime.now(timezone.utc).date()
+
+
+def _seconds_until_midnight():
+    now = datetime.now(timezone.utc)
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+    return max(1, math.ceil((midnight - now).total_seconds()))
+
+
+def _merge(counters, key, row):
+    total = counters.setdefault(key, [0, 0, 0.0])
+    total[0] += row[0]
+    total[1] += row[1]
+    total[2] += row[2]
+
+
+class TokenBucket:
+    """Holds up to ``capacity`` tokens, refilled at ``rate`` tokens per second."""
+
+    __slots__ = ('capacity', 'rate', 'tokens', 'updated')
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self):
+        """Take one token. Returns 0 on success, else the seconds until one is available."""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def drain(self, count):
+        """Remove tokens spent in other workers; the debt is capped at one full bucket."""
+        self._refill(time.monotonic())
+        self.tokens = max(-self.capacity, self.tokens - count)
+
+    def is_idle(self, now):
+        return now - self.updated > IDLE_BUCKET_SECONDS and \
+            self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class AdmissionController:
+    """Per-process rate limits and daily budgets, synced through the database."""
+
+    def __init__(self, limits, token_budget=0, cost_budget=0.0, persist=True):
+        self.limits = limits  # endpoint -> (per_minute, burst); 0 per minute = unlimited
+        self.token_budget = token_budget
+        self.cost_budget = cost_budget
+        self.persist = persist
+        self.stats = {'admitted': 0, 'rate_limited': 0, 'over_budget': 0, 'syncs': 0, 'sync_errors': 0,
+                      'counters_pruned': 0}
+
+        self._buckets = {}  # (endpoint, subject) -> TokenBucket
+        self._pending = {}  # (subject, endpoint, day) -> [requests, tokens, cost] not yet in the database
+        self._synced = {}  # (subject, endpoint, day) -> [requests, tokens, cost] of all workers, as of the last sync
+        self._last_read = None  # utcnow() of the last successful read of the table
+        self._pruned_day = None  # day of the last deletion of old counter rows
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        limits = {}
+        for endpoint in ENDPOINTS:
+            prefix = endpoint.upper()
+            limits[endpoint] = (config.get(f'{prefix}_RATE_PER_MINUTE', 0), config.get(f'{prefix}_RATE_BURST', 0))
+        return cls(
+            limits,
+            token_budget=config.get('AI_DAILY_TOKEN_BUDGET', 0),
+            cost_budget=config.get('AI_DAILY_COST_BUDGET', 0.0),
+            persist=bool(config.get('RATE_LIMIT_SYNC_INTERVAL', 0)),
+        )
+
+    # ------------------------------------------------------------------
+    # Request path (memory only)
+    # ------------------------------------------------------------------
+    def usage_today(self, subject):
+        """(tokens, cost) used today by ``subject`` across endpoints, as far as this worker knows."""
+        day = _today()
+        tokens, cost = 0, 0.0
+        with self._lock:
+            for counters in (self._synced, self._pending):
+                for endpoint in self.limits:
+                    row = counters.get((subject, endpoint, day))
+                    if row:
+                        tokens += row[1]
+                        cost += row[2]
+        return tokens, cost
+
+    def admit(self, endpoint, subject):
+        """None when the request may go ahead, else (message, retry_after_seconds)."""
+        tokens, cost = self.usage_today(subject)
+        if (self.token_budget and tokens >= self.token_budget) or (self.cost_budget and cost >= self.cost_budget):
+            with self._lock:
+                self.stats['over_budget'] += 1
+            return 'Daily AI budget exhausted', _seconds_until_midnight()
+
+        per_minute, burst = self.limits.get(endpoint, (0, 0))
+        with self._lock:
+            if per_minute:
+                bucket = self._buckets.get((endpoint, subject))
+                if bucket is None:
+                    bucket = self._buckets[(endpoint, subject)] = TokenBucket(burst or per_minute, per_minute / 60.0)
+                wait = bucket.take()
+                if wait:
+                    self.stats['rate_limited'] += 1
+                    return 'Too many requests', max(1, math.ceil(wait))
+            _merge(self._pending, (subject, endpoint, _today()), (1, 0, 0.0))
+            self.stats['admitted'] += 1
+        return None
+
+    def record_usage(self, subject, endpoint, tokens, cost):
+        with self._lock:
+            _merge(self._pending, (subject, endpoint, _today()), (0, tokens, cost))
+
+    # ------------------------------------------------------------------
+    # Sync with the other workers
+    # ------------------------------------------------------------------
+    def sync(self):
+        """Add this worker's new counts to the database and read back what changed since the last sync."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        if not self.persist:
+            # Single process: the local counters are the totals
+            with self._lock:
+                for key, row in pending.items():
+                    _merge(self._synced, key, row)
+                self._prune()
+            return True
+
+        from app import db
+        from app.models.usage_counter import UsageCounter
+
+        table = UsageCounter.__table__
+        if pending:
+            try:
+                _increment(db, table, pending)
+            except Exception:
+                db.session.rollback()
+                with self._lock:
+                    for key, row in pending.items():
+                        _merge(self._pending, key, row)  # pushed again next time
+                    self.stats['sync_errors'] += 1
+                logger.exception("Could not save AI usage counters")
+                return False
+            with self._lock:
+                for key, row in pending.items():
+                    _merge(self._synced, key, row)
+
+        day, read_at = _today(), datetime.utcnow()
+        query = db.select(table.c.subject, table.c.endpoint, table.c.requests, table.c.tokens, table.c.cost_usd) \
+            .where(table.c.day == day)
+        if self._last_read is not None:
+            # Only rows changed since the last read; the overlap absorbs clock skew between workers
+            query = query.where(table.c.updated_at >= self._last_read - timedelta(seconds=READ_OVERLAP_SECONDS))
+        try:
+            totals = {(row.subject, row.endpoint, day): [row.requests, row.tokens, row.cost_usd]
+                      for row in db.session.execute(query)}
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                self.stats['sync_errors'] += 1
+            logger.exception("Could not read AI usage counters")
+            return False
+        self._last_read = read_at
+
+        if self._pruned_day != day:
+            self._delete_old_counters(db, table, day)
+
+        with self._lock:
+            for key, row in totals.items():
+                previous = self._synced.get(key)
+                bucket = self._buckets.get((key[1], key[0]))
+                # Only drain against a known baseline, not the whole day's history
+                if previous is not None and bucket is not None and row[0] > previous[0]:
+                    bucket.drain(row[0] - previous[0])
+                self._synced[key] = row
+            self._prune()
+            self.stats['syncs'] += 1
+        return True
+
+    def _delete_old_counters(self, db, table, day):
+        """Delete counter rows older than the budget window; every worker does it at most once a day."""
+        try:
+            deleted = db.session.execute(
+                db.delete(table).where(table.c.day < day - timedelta(days=COUNTER_KEEP_DAYS))
+            ).rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception("Could not delete old AI usage counters")
+            return
+        self._pruned_day = day
+        with self._lock:
+            self.stats['counters_pruned'] += deleted
+
+    def _prune(self):
+        """Forget other days' totals and idle buckets (callers hold the lock)."""
+        day, now = _today(), time.monotonic()
+        for key in [key for key in self._synced if key[2] != day]:
+            del self._synced[key]
+        for key in [key for key, bucket in self._buckets.items() if bucket.is_idle(now)]:
+            del self._buckets[key]
+
+    def describe(self):
+        with self._lock:
+            return {
+                'limits': {endpoint: {'per_minute': per_minute, 'burst': burst or per_minute}
+                           for endpoint, (per_minute, burst) in self.limits.items()},
+                'daily_token_budget': self.token_budget,
+                'daily_cost_budget': self.cost_budget,
+                'shared': self.persist,
+                'clients': len({subject for _, subject in self._buckets}),
+                'stats': dict(self.stats),
+            }
+
+
+def _increment(db, table, pending):
+    """Add ``pending`` to the counters in one upsert per chunk where the database supports it."""
+    now = datetime.utcnow()
+    rows = [
+        dict(subject=subject, endpoint=endpoint, day=day, requests=row[0], tokens=row[1], cost_usd=row[2], updated_at=now)
+        for (subject, endpoint, day), row in pending.items()
+    ]
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = importlib.import_module(f'sqlalchemy.dialects.{dialect}').insert
+        for start in range(0, len(rows), SYNC_CHUNK_SIZE):
+            statement = insert(table).values(rows[start:start + SYNC_CHUNK_SIZE])
+            excluded = statement.excluded
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=['subject', 'endpoint', 'day'],
+                set_={
+                    'requests': table.c.requests + excluded.requests,
+                    'tokens': table.c.tokens + excluded.tokens,
+                    'cost_usd': table.c.cost_usd + excluded.cost_usd,
+                    'updated_at': excluded.updated_at,
+                },
+            ))
+    else:
+        from app.models.usage_counter import UsageCounter
+
+        for row in rows:
+            counter = UsageCounter.query.filter_by(
+                subject=row['subject'], endpoint=row['endpoint'], day=row['day']
+            ).with_for_update().first()
+            if counter is None:
+                db.session.add(UsageCounter(**row))
+            else:
+                counter.requests += row['requests']
+                counter.tokens += row['tokens']
+                counter.cost_usd += row['cost_usd']
+                counter.updated_at = now
+    db.session.commit()
+
+
+# ----------------------------------------------------------------------
+# Flask integration
+# ----------------------------------------------------------------------
+def client_subject():
+    """'user:<id>' for requests with a valid JWT, else 'ip:<address>'."""
+    identity = current_identity()
+    if identity is not None:
+        return f'user:{identity.id}'
+    # ProxyFix (PROXY_FIX_X_FOR) has already set remote_addr to the trusted hop
+    return f'ip:{request.remote_addr or "unknown"}'
+
+
+def get_admission_controller(app=None):
+    """Return the app's admission controller, or None when rate limiting is off."""
+    if app is None:
+        app = current_app._get_current_object()
+    if not app.config.get('RATE_LIMIT_ENABLED', True):
+        return None
+    controller = app.extensions.get('admission')
+    if controller is None:
+        controller = app.extensions.setdefault('admission', AdmissionController.from_config(app.config))
+    return controller
+
+
+def bill_to(controller, subject, endpoint):
+    """Charge AI usage made while serving this request to ``subject``."""
+    _current_owner.set((controller, subject, endpoint))
+    g.ai_usage_owner = True
+
+
+def _charge(model, prompt_tokens, completion_tokens, latency, outcome):
+    owner = _current_owner.get()
+    if owner is not None:
+        controller, subject, endpoint = owner
+        controller.record_usage(subject, endpoint, prompt_tokens + completion_tokens,
+                                estimate_cost(model, prompt_tokens, completion_tokens))
+
+
+add_usage_listener(_charge)
+
+
+def init_rate_limiter(app):
+    """Clear the billing owner after each request and start the sync thread."""
+    @app.teardown_request
+    def _clear_usage_owner(exc=None):
+        # Runs after streamed responses finish, so their tokens are still billed
+        if g.pop('ai_usage_owner', None):
+            _current_owner.set(None)
+
+    interval = app.config.get('RATE_LIMIT_SYNC_INTERVAL', 0)
+    if not app.config.get('RATE_LIMIT_ENABLED', True):
+        return None
+
+    def run():
+        while True:
+            time.sleep(interval or 60)  # per-process only: still prune once a minute
+            try:
+                with app.app_context():
+                    get_admission_controller(app).sync()
+            except Exception:
+                logger.exception("Rate limit sync failed")
+
+    thread = threading.Thread(target=run, name='rate-limit-sync', daemon=True)
+    thread.start()
+    return thread
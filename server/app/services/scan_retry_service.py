@@ -0,0 +1,237 @@
+# server/app/services/scan_retry_service.py
+"""
+Retry queue and dead-letter store for scans whose AI analysis failed.
+
+A failed scan is persisted (``failed_scans``) with its error class and
+attempt count instead of being thrown away. Due scans are retried with
+exponential backoff by ``flask retry-failed-scans`` (from cron or a single
+scheduler), or by a background thread in each process that sets
+``SCAN_RETRY_INTERVAL``. After ``SCAN_RETRY_MAX_ATTEMPTS``, or at once
+for errors that retrying cannot fix, the scan moves to ``dead_letter_scans``,
+where an admin can inspect it and re-drive it.
+
+The worker skips its turn while the AI circuit breaker is open and retries
+only a few scans per tick, so a recovering provider is not hit by the whole
+backlog at once.
+"""
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from app import db
+from app.models.failed_scan import FailedScan, DeadLetterScan
+from app.services.ai_gateway import AIGatewayError, CircuitBreaker, get_gateway
+from app.services.ai_usage import attribute_ai_calls
+from app.services.waste_scanner_service import save_waste_analysis_result, UnparseableAnalysis
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF_BASE = 60  # seconds
+DEFAULT_BACKOFF_MAX = 6 * 60 * 60
+CLAIM_SECONDS = 300  # a claimed scan is invisible to other workers for this long
+
+# Requests the provider rejected as invalid won't succeed on a retry
+PERMANENT_STATUS_CODES = {400, 401, 403, 404, 422}
+
+
+def is_retryable(error):
+    """Whether retrying the analysis later can plausibly succeed."""
+    if isinstance(error, (AIGatewayError, UnparseableAnalysis, TimeoutError, ConnectionError)):
+        return True
+    status_code = getattr(error, 'status_code', None)
+    if status_code is not None:
+        return status_code not in PERMANENT_STATUS_CODES
+    # Anything raised by the OpenAI SDK without a status is a transport problem
+    return type(error).__module__.startswith('openai')
+
+
+def _settings():
+    from flask import current_app
+    config = current_app.config
+    return (
+        config.get('SCAN_RETRY_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS),
+        config.get('SCAN_RETRY_BACKOFF_BASE', DEFAULT_BACKOFF_BASE),
+        config.get('SCAN_RETRY_BACKOFF_MAX', DEFAULT_BACKOFF_MAX),
+    )
+
+
+def _backoff(attempts, base, cap):
+    """Exponential backoff with +/-25% jitter so retries don't line up."""
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return delay * random.uniform(0.75, 1.25)
+
+
+def _bury(scan, error_class, error_message):
+    """Move a scan to the dead-letter table (caller commits)."""
+    dead = DeadLetterScan(
+        error_class=error_class,
+        error_message=error_message,
+        attempts=scan.attempts,
+        created_at=scan.created_at,
+        **scan.upload_fields()
+    )
+    db.session.add(dead)
+    if isinstance(scan, FailedScan) and scan.id is not None:
+        db.session.delete(scan)
+    return dead
+
+
+def record_failed_scan(error, filename, filepath, original_name=None, user_id=None,
+                       storage_key=None, content_hash=None):
+    """
+    Persist a scan whose first analysis attempt failed.
+
+    Returns:
+        (record, queued): the FailedScan (queued=True) or, for permanent
+        errors, the DeadLetterScan (queued=False).
+    """
+    max_attempts, base, cap = _settings()
+    scan = FailedScan(
+        filename=filename,
+        filepath=filepath,
+        original_name=original_name,
+        user_id=user_id,
+        storage_key=storage_key,
+        content_hash=content_hash,
+        error_class=type(error).__name__,
+        error_message=str(error)[:2000],
+        attempts=1,
+        last_attempt_at=datetime.utcnow(),
+        next_attempt_at=datetime.utcnow() + timedelta(seconds=_backoff(1, base, cap)),
+    )
+
+    if not is_retryable(error) or max_attempts <= 1:
+        record = _bury(scan, scan.error_class, scan.error_message)
+        db.session.commit()
+        return record, False
+
+    db.session.add(scan)
+    db.session.commit()
+    return scan, True
+
+
+def _claim_due(batch_size):
+    """
+    Claim up to ``batch_size`` due scans by pushing their next_attempt_at
+    forward, so concurrent workers don't pick the same rows.
+    """
+    now = datetime.utcnow()
+    query = FailedScan.query.with_entities(FailedScan.id).filter(FailedScan.next_attempt_at <= now) \
+        .order_by(FailedScan.next_attempt_at).limit(batch_size)
+    if db.engine.dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True)
+
+    claimed = []
+    for (scan_id,) in query.all():
+        # Only claim rows that are still due: on SQLite the SELECT above takes no
+        # lock, so another worker may have claimed the row since
+        rowcount = FailedScan.query.filter(FailedScan.id == scan_id, FailedScan.next_attempt_at <= now) \
+            .update({'next_attempt_at': now + timedelta(seconds=CLAIM_SECONDS)}, synchronize_session=False)
+        if rowcount:
+            claimed.append(scan_id)
+    db.session.commit()
+    return claimed
+
+
+def retry_scan(scan):
+    """
+    Retry one FailedScan now.
+
+    Returns 'succeeded', 'rescheduled' or 'dead'.
+    """
+    max_attempts, base, cap = _settings()
+    fields = scan.upload_fields()
+    scan_id = scan.id
+    attribute_ai_calls('scan_retry', f'user:{scan.user_id}' if scan.user_id else None)
+
+    try:
+        # The scan and the queue row's removal commit together: a crash in
+        # between must not leave the row claimable for a duplicate scan
+        save_waste_analysis_result(commit=False, **fields)
+        FailedScan.query.filter_by(id=scan_id).delete()
+        db.session.commit()
+    except Exception as e:
+        # Nothing of this attempt is kept; reload the scan in a clean session
+        db.session.rollback()
+        scan = FailedScan.query.get(scan_id)
+        if scan is None:
+            return 'dead'
+        scan.attempts += 1
+        scan.last_attempt_at = datetime.utcnow()
+        scan.error_class = type(e).__name__
+        scan.error_message = str(e)[:2000]
+
+        if not is_retryable(e) or scan.attempts >= max_attempts:
+            _bury(scan, scan.error_class, scan.error_message)
+            db.session.commit()
+            logger.warning("Scan %s dead-lettered after %d attempts: %s", scan_id, scan.attempts, scan.error_class)
+            return 'dead'
+
+        scan.next_attempt_at = datetime.utcnow() + timedelta(seconds=_backoff(scan.attempts, base, cap))
+        db.session.commit()
+        return 'rescheduled'
+
+    return 'succeeded'
+
+
+def process_due_scans(batch_size=5):
+    """Retry scans whose backoff has elapsed. Returns a summary dict."""
+    summary = {'claimed': 0, 'succeeded': 0, 'rescheduled': 0, 'dead': 0, 'skipped': False}
+
+    if get_gateway().breaker.state == CircuitBreaker.OPEN:
+        # Provider still down: leave the queue alone rather than burning attempts
+        summary['skipped'] = True
+        return summary
+
+    for scan_id in _claim_due(batch_size):
+        scan = FailedScan.query.get(scan_id)
+        if scan is None:
+            continue
+        summary['claimed'] += 1
+        summary[retry_scan(scan)] += 1
+    return summary
+
+
+def redrive_dead_letter(dead_letter_id):
+    """Move a dead-lettered scan back onto the retry queue, due immediately."""
+    dead = DeadLetterScan.query.get(dead_letter_id)
+    if dead is None:
+        return None
+    scan = FailedScan(
+        error_class=dead.error_class,
+        error_message=dead.error_message,
+        attempts=0,
+        created_at=dead.created_at,
+        next_attempt_at=datetime.utcnow(),
+        **dead.upload_fields()
+    )
+    db.session.add(scan)
+    db.session.delete(dead)
+    db.session.commit()
+    return scan
+
+
+def start_background_retry_worker(app):
+    """Retry due scans every SCAN_RETRY_INTERVAL seconds in a daemon thread."""
+    interval = app.config.get('SCAN_RETRY_INTERVAL', 0)
+    if not interval:
+        return None
+    batch_size = app.config.get('SCAN_RETRY_BATCH_SIZE', 5)
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    summary = process_due_scans(batch_size)
+                if summary['claimed']:
+                    logger.info("Scan retry: %s", summary)
+            except Exception:
+                logger.exception("Scan retry worker failed")
+
+    thread = threading.Thread(target=run, name='scan-retry', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,184 @@
+# server/app/services/search_service.py
+"""
+Full-text search over waste analyses.
+
+The index lives in the database and is kept in sync by the database itself:
+
+- SQLite: an external-content FTS5 table (``waste_items_fts``) maintained by
+  insert/update/delete triggers, ranked with bm25()
+- PostgreSQL: a generated ``search_vector`` tsvector column with a GIN
+  index, ranked with ts_rank_cd()
+
+Other databases, or a SQLite build without FTS5, fall back to a LIKE scan.
+"""
+import logging
+import re
+
+from sqlalchemy import or_, text
+
+from app import db
+from app.models.waste_item import WasteItem
+
+logger = logging.getLogger(__name__)
+
+SEARCH_COLUMNS = ('waste_type', 'material_composition', 'recycling_instructions', 'environmental_impact')
+
+# Column weights: a match on the waste type matters more than one in the impact notes
+SQLITE_BM25_WEIGHTS = (10.0, 4.0, 2.0, 1.0)
+POSTGRES_WEIGHTS = ('A', 'B', 'C', 'D')
+
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS waste_items_fts USING fts5(
+        waste_type, material_composition, recycling_instructions, environmental_impact,
+        content='waste_items', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS waste_items_fts_ai AFTER INSERT ON waste_items BEGIN
+        INSERT INTO waste_items_fts(rowid, waste_type, material_composition, recycling_instructions, environmental_impact)
+        VALUES (new.id, new.waste_type, new.material_composition, new.recycling_instructions, new.environmental_impact);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS waste_items_fts_ad AFTER DELETE ON waste_items BEGIN
+        INSERT INTO waste_items_fts(waste_items_fts, rowid, waste_type, material_composition, recycling_instructions, environmental_impact)
+        VALUES ('delete', old.id, old.waste_type, old.material_composition, old.recycling_instructions, old.environmental_impact);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS waste_items_fts_au AFTER UPDATE ON waste_items BEGIN
+        INSERT INTO waste_items_fts(waste_items_fts, rowid, waste_type, material_composition, recycling_instructions, environmental_impact)
+        VALUES ('delete', old.id, old.waste_type, old.material_composition, old.recycling_instructions, old.environmental_impact);
+        INSERT INTO waste_items_fts(rowid, waste_type, material_composition, recycling_instructions, environmental_impact)
+        VALUES (new.id, new.waste_type, new.material_composition, new.recycling_instructions, new.environmental_impact);
+    END
+    """,
+]
+
+_pg_vector = " || ".join(
+    f"setweight(to_tsvector('english', coalesce({column}, '')), '{weight}')"
+    for column, weight in zip(SEARCH_COLUMNS, POSTGRES_WEIGHTS)
+)
+
+POSTGRES_DDL = [
+    f"""
+    ALTER TABLE waste_items ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS ({_pg_vector}) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_waste_items_search_vector ON waste_items USING GIN (search_vector)",
+]
+
+
+def create_search_index(connection):
+    """Create the full-text index for the connection's dialect (idempotent)."""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        try:
+            for statement in SQLITE_DDL:
+                connection.exec_driver_sql(statement)
+        except Exception as e:
+            # SQLite compiled without FTS5: search falls back to LIKE
+            logger.warning("FTS5 unavailable, search will use LIKE: %s", e)
+    elif dialect == 'postgresql':
+        for statement in POSTGRES_DDL:
+            connection.exec_driver_sql(statement)
+
+
+def rebuild_search_index():
+    """Create the index if missing and re-index every existing row."""
+    with db.engine.begin() as connection:
+        create_search_index(connection)
+        if connection.dialect.name == 'sqlite' and _sqlite_fts_available(connection):
+            connection.exec_driver_sql("INSERT INTO waste_items_fts(waste_items_fts) VALUES ('rebuild')")
+        # PostgreSQL's generated column is filled in by ALTER TABLE itself
+
+
+def _sqlite_fts_available(connection):
+    return connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'waste_items_fts'"
+    ).first() is not None
+
+
+def _query_terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def _fts5_match_expression(terms):
+    # Each term is quoted (no FTS syntax injection) and prefix-matched; terms are ANDed
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _ranked_ids(connection, terms, raw_query, user_id, limit, offset):
+    """Return [(id, rank), ...] best match first, or None if no index is available."""
+    dialect = connection.dialect.name
+    user_filter = "AND w.user_id = :user_id" if user_id is not None else ""
+    params = {'user_id': user_id, 'limit': limit, 'offset': offset}
+
+    if dialect == 'sqlite' and _sqlite_fts_available(connection):
+        weights = ', '.join(str(w) for w in SQLITE_BM25_WEIGHTS)
+        params['match'] = _fts5_match_expression(terms)
+        # bm25() is lower-is-better; negate so higher rank means more relevant
+        sql = f"""
+            SELECT w.id, -bm25(waste_items_fts, {weights}) AS rank
+            FROM waste_items_fts JOIN waste_items w ON w.id = waste_items_fts.rowid
+            WHERE waste_items_fts MATCH :match {user_filter}
+            ORDER BY rank DESC, w.id DESC
+            LIMIT :limit OFFSET :offset
+        """
+    elif dialect == 'postgresql':
+        params['query'] = raw_query
+        sql = f"""
+            SELECT w.id, ts_rank_cd(w.search_vector, q) AS rank
+            FROM waste_items w, websearch_to_tsquery('english', :query) q
+            WHERE w.search_vector @@ q {user_filter}
+            ORDER BY rank DESC, w.id DESC
+            LIMIT :limit OFFSET :offset
+        """
+    else:
+        return None
+
+    return [(row[0], float(row[1])) for row in connection.execute(text(sql), params)]
+
+
+def search_waste_analyses(query, user_id=None, page=1, per_page=20):
+    """
+    Ranked full-text search over the analysis text of waste items.
+
+    Returns:
+        (list of dicts with a 'rank' key, has_more)
+    """
+    terms = _query_terms(query)
+    if not terms:
+        return [], False
+
+    offset = (page - 1) * per_page
+    ranked = _ranked_ids(db.session.connection(), terms, query, user_id, per_page + 1, offset)
+
+    if ranked is None:
+        return _like_search(terms, user_id, per_page, offset)
+
+    has_more = len(ranked) > per_page
+    ranked = ranked[:per_page]
+    items = {item.id: item for item in WasteItem.query.filter(WasteItem.id.in_([i for i, _ in ranked]))}
+
+    results = []
+    for item_id, rank in ranked:
+        if item_id in items:
+            data = items[item_id].to_dict()
+            data['rank'] = round(rank, 6)
+            results.append(data)
+    return results, has_more
+
+
+def _like_search(terms, user_id, limit, offset):
+    """Unindexed fallback: every term must appear in one of the searched columns."""
+    query = WasteItem.query
+    if user_id is not None:
+        query = query.filter(WasteItem.user_id == user_id)
+    for term in terms:
+        pattern = f'%{term}%'
+        query = query.filter(or_(*[getattr(WasteItem, column).ilike(pattern) for column in SEARCH_COLUMNS]))
+
+    items = query.order_by(WasteItem.created_at.desc(), WasteItem.id.desc()).offset(offset).limit(limit + 1).all()
+    return [dict(item.to_dict(), rank=None) for item in items[:limit]], len(items) > limit
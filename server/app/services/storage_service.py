@@ -0,0 +1,405 @@
+# server/app/services/storage_service.py
+"""
+Content-addressed storage for uploaded scan images.
+
+Uploads are streamed to the backend in fixed-size chunks while a SHA-256 of
+the content is computed, so the whole file is never held in memory. Files
+are stored under their content hash, which means an image uploaded twice is
+only kept once on disk (or in the bucket).
+"""
+import hashlib
+import logging
+import os
+import tempfile
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+ORIGINALS_PREFIX = 'originals'
+VARIANTS_PREFIX = 'variants'
+TMP_PREFIX = 'tmp'
+
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+
+MIME_TYPES = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+}
+
+
+class UploadRejected(Exception):
+    """Raised when an upload fails validation (type, size or content)."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class StoredFile:
+    """Result of storing an upload."""
+
+    def __init__(self, key, content_hash, size, extension, created, local_path=None):
+        self.key = key
+        self.content_hash = content_hash
+        self.size = size
+        self.extension = extension
+        self.created = created  # False when identical content was already stored
+        self.local_path = local_path
+
+    @property
+    def filename(self):
+        return os.path.basename(self.key)
+
+    def __repr__(self):
+        return f'<StoredFile {self.key} ({self.size} bytes)>'
+
+
+class StorageEntry:
+    """One object found while listing a store."""
+
+    def __init__(self, key, size, modified):
+        self.key = key
+        self.size = size
+        self.modified = modified  # POSIX timestamp
+
+    def __repr__(self):
+        return f'<StorageEntry {self.key}>'
+
+
+# ----------------------------------------------------------------------
+# Validation helpers
+# ----------------------------------------------------------------------
+def get_extension(filename):
+    """Return the lower-cased extension of ``filename`` or raise UploadRejected."""
+    if not filename or '.' not in filename:
+        raise UploadRejected('Invalid file type. Allowed types: png, jpg, jpeg, gif, webp')
+    extension = filename.rsplit('.', 1)[1].lower()
+    if extension not in ALLOWED_EXTENSIONS:
+        raise UploadRejected('Invalid file type. Allowed types: png, jpg, jpeg, gif, webp')
+    return extension
+
+
+def sniff_image_type(head):
+    """Identify an image from its first bytes. Returns an extension or None."""
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def content_key(content_hash, extension, prefix=ORIGINALS_PREFIX):
+    """Storage key for a piece of content: ``originals/ab/abcdef....png``."""
+    return f"{prefix}/{content_hash[:2]}/{content_hash}.{extension}"
+
+
+def _format_size(num_bytes):
+    if num_bytes >= 1024 * 1024:
+        return f'{num_bytes / (1024 * 1024):.0f} MB'
+    return f'{num_bytes / 1024:.0f} KB'
+
+
+def _hashing_copy(stream, out, max_bytes):
+    """
+    Copy ``stream`` into ``out`` chunk by chunk.
+
+    The first chunk is checked against known image signatures and the copy is
+    aborted as soon as ``max_bytes`` is exceeded.
+
+    Returns:
+        (sha256 hex digest, size in bytes, extension of the sniffed image type)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    extension = None
+
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if size == 0:
+            extension = sniff_image_type(chunk)
+            if extension is None:
+                raise UploadRejected('File content is not a supported image')
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadRejected(
+                f'File too large. Maximum size is {_format_size(max_bytes)}', 413
+            )
+        digest.update(chunk)
+        out.write(chunk)
+
+    if size == 0:
+        raise UploadRejected('Uploaded file is empty')
+
+    return digest.hexdigest(), size, extension
+
+
+# ----------------------------------------------------------------------
+# Backends
+# ----------------------------------------------------------------------
+class StorageBackend:
+    """
+    Interface shared by all upload stores.
+
+    Keys are '/'-separated strings, so the same layout works for a local
+    directory and for an S3-compatible bucket.
+    """
+
+    def save_stream(self, stream, max_bytes):
+        """
+        Stream an upload into the store. Returns a StoredFile.
+
+        The key's extension (and so the type it is served as) comes from the
+        content, never from the client's filename.
+        """
+        raise NotImplementedError
+
+    def open(self, key):
+        """Open a stored object for binary reading."""
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def put_bytes(self, key, data, content_type='application/octet-stream'):
+        """Write a small derived object (e.g. a thumbnail) under ``key``."""
+        raise NotImplementedError
+
+    def iter_entries(self, prefix='', start_after=None):
+        """
+        Yield StorageEntry objects under ``prefix`` in ascending key order,
+        starting after ``start_after``. Used by the sweeper to resume a walk.
+        """
+        raise NotImplementedError
+
+    def local_path(self, key):
+        """Filesystem path of ``key`` if the backend is disk-based, else None."""
+        return None
+
+    def url(self, key, expires_in=3600):
+        """Direct (e.g. presigned) URL clients can fetch ``key`` from, or None."""
+        return None
+
+    def read_bytes(self, key):
+        with self.open(key) as fh:
+            return fh.read()
+
+
+class LocalStorage(StorageBackend):
+    """Stores uploads in a local directory (``Config.UPLOAD_FOLDER``)."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, *key.split('/')))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f'Invalid storage key: {key}')
+        return path
+
+    def save_stream(self, stream, max_bytes):
+        tmp = tempfile.NamedTemporaryFile(dir=self.tmp_dir, suffix='.part', delete=False)
+        try:
+            with tmp:
+                content_hash, size, extension = _hashing_copy(stream, tmp, max_bytes)
+
+            key = content_key(content_hash, extension)
+            path = self._path(key)
+            if os.path.exists(path):
+                os.remove(tmp.name)
+                os.utime(path)  # re-uploaded content counts as fresh for retention
+                return StoredFile(key, content_hash, size, extension, created=False, local_path=path)
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp.name, path)  # atomic on the same filesystem
+            return StoredFile(key, content_hash, size, extension, created=True, local_path=path)
+        except BaseException:
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+            raise
+
+    def open(self, key):
+        return open(self._path(key), 'rb')
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def delete(self, key):
+        path = self._path(key)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        try:
+            os.rmdir(os.path.dirname(path))  # drop the shard directory once it's empty
+        except OSError:
+            pass
+        return True
+
+    def put_bytes(self, key, data, content_type='application/octet-stream'):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.tmp_dir, suffix='.part', delete=False) as tmp:
+            tmp.write(data)
+        os.replace(tmp.name, path)
+
+    def iter_entries(self, prefix='', start_after=None):
+        base = self._path(prefix) if prefix else self.root
+        yield from self._walk(base, start_after)
+
+    def _walk(self, directory, start_after):
+        try:
+            names = sorted(os.listdir(directory))
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.startswith('.'):
+                continue
+            path = os.path.join(directory, name)
+            key = os.path.relpath(path, self.root).replace(os.sep, '/')
+            if os.path.isdir(path):
+                # Skip whole subtrees that sort entirely before the resume point
+                if start_after and key + '/\uffff' < start_after:
+                    continue
+                yield from self._walk(path, start_after)
+            elif not start_after or key > start_after:
+                stat = os.stat(path)
+                yield StorageEntry(key, stat.st_size, stat.st_mtime)
+
+    def local_path(self, key):
+        return self._path(key)
+
+
+class S3Storage(StorageBackend):
+    """
+    Stores uploads in an S3-compatible bucket (AWS S3, MinIO, R2, ...).
+
+    The upload is spooled to a temporary file while hashing, because the
+    object key depends on the content hash.
+    """
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region_name=None):
+        try:
+            import boto3
+        except ImportError as e:
+            raise RuntimeError("boto3 is required for UPLOAD_STORAGE_BACKEND='s3'") from e
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region_name)
+
+    def _object_key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def save_stream(self, stream, max_bytes):
+        with tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE * 16) as spool:
+            content_hash, size, extension = _hashing_copy(stream, spool, max_bytes)
+            key = content_key(content_hash, extension)
+            if self.exists(key):
+                return StoredFile(key, content_hash, size, extension, created=False)
+
+            spool.seek(0)
+            self.client.upload_fileobj(
+                spool, self.bucket, self._object_key(key),
+                ExtraArgs={'ContentType': MIME_TYPES.get(extension, 'application/octet-stream')}
+            )
+            return StoredFile(key, content_hash, size, extension, created=True)
+
+    def open(self, key):
+        response = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        return response['Body']
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except ClientError:
+            return False
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        return True
+
+    def put_bytes(self, key, data, content_type='application/octet-stream'):
+        self.client.put_object(Bucket=self.bucket, Key=self._object_key(key),
+                               Body=data, ContentType=content_type)
+
+    def url(self, key, expires_in=3600):
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': self._object_key(key)},
+            ExpiresIn=expires_in,
+        )
+
+    def iter_entries(self, prefix='', start_after=None):
+        strip = len(self.prefix) + 1 if self.prefix else 0
+        kwargs = {'Bucket': self.bucket, 'Prefix': self._object_key(prefix) if prefix else self.prefix}
+        if start_after:
+            kwargs['StartAfter'] = self._object_key(start_after)
+        for page in self.client.get_paginator('list_objects_v2').paginate(**kwargs):
+            for obj in page.get('Contents', []):
+                yield StorageEntry(obj['Key'][strip:], obj['Size'], obj['LastModified'].timestamp())
+
+
+# ----------------------------------------------------------------------
+# App integration
+# ----------------------------------------------------------------------
+def _build_storage(config):
+    backend = config.get('UPLOAD_STORAGE_BACKEND', 'local')
+    if backend == 's3':
+        return S3Storage(
+            bucket=config['UPLOAD_S3_BUCKET'],
+            prefix=config.get('UPLOAD_S3_PREFIX', ''),
+            endpoint_url=config.get('UPLOAD_S3_ENDPOINT_URL'),
+            region_name=config.get('UPLOAD_S3_REGION'),
+        )
+    if backend != 'local':
+        raise RuntimeError(f"Unknown UPLOAD_STORAGE_BACKEND: {backend}")
+
+    root = config.get('UPLOAD_FOLDER') or os.path.join(current_app.root_path, '..', 'uploads')
+    return LocalStorage(root)
+
+
+def get_storage(app=None):
+    """Return the storage backend for ``app`` (created once per process)."""
+    app = app or current_app._get_current_object()
+    storage = app.extensions.get('upload_storage')
+    if storage is None:
+        storage = _build_storage(app.config)
+        app.extensions['upload_storage'] = storage
+    return storage
+
+
+def store_upload(file_storage):
+    """
+    Validate and store a werkzeug ``FileStorage`` upload.
+
+    Raises:
+        UploadRejected: bad extension, non-image content, empty or too large.
+    """
+    get_extension(file_storage.filename)  # early, readable rejection of non-image names
+    max_bytes = current_app.config.get('MAX_UPLOAD_BYTES', DEFAULT_MAX_UPLOAD_BYTES)
+
+    # Stored under the sniffed type: a PNG named photo.jpg is kept (and served) as .png
+    stored = get_storage().save_stream(file_storage.stream, max_bytes)
+    if not stored.created:
+        logger.debug("Duplicate upload %s, reusing stored content", stored.key)
+    return stored
@@ -0,0 +1,297 @@
+# server/app/services/upload_sweeper.py
+"""
+Garbage collection and retention for the upload store.
+
+The sweeper walks the store in small batches, remembering where it stopped
+in a state file, so each run does a bounded amount of work. Originals and
+their variants are both walked; a variant belongs to the scans whose content
+hash it carries. For every stored image it decides whether to:
+
+- delete it as an orphan (no WasteItem, queued retry or dead-lettered scan
+  references it) once the file is older than a grace period
+- downsize it: keep only a thumbnail variant and drop the original
+- delete it (and its variants) once it is past the retention period
+
+Retention and downsizing count from the newest scan that uses the image, not
+from the file: uploads are deduplicated by content, so the file of an image
+scanned again today may be years old. Images a queued retry or a
+dead-lettered scan still needs are never expired.
+
+It can run from the CLI (``flask sweep-uploads``) or as a background thread
+started by ``create_app`` when ``UPLOAD_SWEEP_INTERVAL`` is set. A file lock
+makes sure only one gunicorn worker sweeps at a time.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import timezone
+
+from sqlalchemy import func
+
+from app.models.failed_scan import FailedScan, DeadLetterScan
+from app.models.waste_item import WasteItem
+from app.services.image_variants import ensure_variant, variant_keys
+from app.services.storage_service import ORIGINALS_PREFIX, TMP_PREFIX, get_storage
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: no cross-process lock
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+TMP_MAX_AGE = DAY  # abandoned partial uploads
+
+
+class SweepStats:
+    def __init__(self):
+        self.scanned = 0
+        self.orphans_deleted = 0
+        self.expired_deleted = 0
+        self.downsized = 0
+        self.tmp_deleted = 0
+        self.bytes_freed = 0
+        self.pass_complete = False
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+class UploadSweeper:
+    """Incremental sweeper over a StorageBackend."""
+
+    def __init__(self, storage, state_path, batch_size=200, orphan_grace=3600,
+                 retention_days=0, thumbnail_after_days=0, dry_run=False):
+        self.storage = storage
+        self.state_path = state_path
+        self.batch_size = batch_size
+        self.orphan_grace = orphan_grace
+        self.retention = retention_days * DAY if retention_days else None
+        self.thumbnail_after = thumbnail_after_days * DAY if thumbnail_after_days else None
+        self.dry_run = dry_run
+
+    @classmethod
+    def from_config(cls, app, **overrides):
+        config = app.config
+        state_path = config.get('UPLOAD_SWEEP_STATE') or os.path.join(
+            config.get('UPLOAD_FOLDER') or app.instance_path, '.sweeper-state.json'
+        )
+        options = dict(
+            batch_size=config.get('UPLOAD_SWEEP_BATCH_SIZE', 200),
+            orphan_grace=config.get('UPLOAD_ORPHAN_GRACE_SECONDS', 3600),
+            retention_days=config.get('UPLOAD_RETENTION_DAYS', 0),
+            thumbnail_after_days=config.get('UPLOAD_THUMBNAIL_AFTER_DAYS', 0),
+        )
+        options.update({k: v for k, v in overrides.items() if v is not None})
+        return cls(get_storage(app), state_path, **options)
+
+    # ------------------------------------------------------------------
+    # State
+    # ------------------------------------------------------------------
+    def _load_state(self):
+        try:
+            with open(self.state_path) as fh:
+                return json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_state(self, state):
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as fh:
+            json.dump(state, fh)
+        os.replace(tmp_path, self.state_path)
+
+    def _lock(self):
+        """Non-blocking exclusive lock. Returns a handle, or None if another process holds it."""
+        handle = open(self.state_path + '.lock', 'a')
+        if fcntl is None:
+            return handle
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return handle
+        except OSError:
+            handle.close()
+            return None
+
+    # ------------------------------------------------------------------
+    # Sweeping
+    # ------------------------------------------------------------------
+    def _last_used(self, keys, now):
+        """
+        Map each key of ``keys`` that is still referenced by the database to
+        the POSIX time of the newest scan using it (``now`` while a retry or
+        dead-lettered scan needs it, None for scans without a date).
+        """
+        # Originals and variants are matched by content hash, pre content-addressing uploads by name
+        hashes = {key: _content_hash(key) for key in keys if '/' in key}
+        legacy_names = [key for key in keys if '/' not in key]
+        by_hash, by_name = {}, {}
+
+        if hashes:
+            rows = WasteItem.query.with_entities(WasteItem.content_hash, func.max(WasteItem.created_at)).filter(
+                WasteItem.content_hash.in_(set(hashes.values()))
+            ).group_by(WasteItem.content_hash)
+            by_hash.update((content_hash, _timestamp(created_at)) for content_hash, created_at in rows)
+        if legacy_names:
+            rows = WasteItem.query.with_entities(WasteItem.filename, func.max(WasteItem.created_at)).filter(
+                WasteItem.filename.in_(legacy_names)
+            ).group_by(WasteItem.filename)
+            by_name.update((filename, _timestamp(created_at)) for filename, created_at in rows)
+
+        # Scans waiting for a retry (or a re-drive) still need their image
+        for model in (FailedScan, DeadLetterScan):
+            if hashes:
+                rows = model.query.with_entities(model.content_hash).filter(
+                    model.content_hash.in_(set(hashes.values()))
+                ).distinct()
+                by_hash.update((row[0], now) for row in rows)
+            if legacy_names:
+                rows = model.query.with_entities(model.filename).filter(
+                    model.filename.in_(legacy_names)
+                ).distinct()
+                by_name.update((row[0], now) for row in rows)
+
+        last_used = {key: by_hash[content_hash] for key, content_hash in hashes.items() if content_hash in by_hash}
+        last_used.update((name, by_name[name]) for name in legacy_names if name in by_name)
+        return last_used
+
+    def _delete(self, entry, stats, removed, with_variants=True):
+        keys = [entry.key]
+        if with_variants and entry.key.startswith(ORIGINALS_PREFIX + '/'):
+            keys += variant_keys(_content_hash(entry.key))
+        if not self.dry_run:
+            for key in keys:
+                self.storage.delete(key)
+        removed.update(keys)
+        stats.bytes_freed += entry.size
+
+    def _next_batch(self, cursor):
+        batch = []
+        for entry in self.storage.iter_entries(start_after=cursor):
+            if entry.key.split('/', 1)[0] == TMP_PREFIX:
+                continue
+            batch.append(entry)
+            if len(batch) >= self.batch_size:
+                break
+        return batch
+
+    def _sweep_tmp(self, stats, now):
+        for entry in self.storage.iter_entries(prefix=TMP_PREFIX):
+            if now - entry.modified > TMP_MAX_AGE:
+                stats.tmp_deleted += 1
+                self._delete(entry, stats, set(), with_variants=False)
+
+    def sweep_batch(self):
+        """
+        Process the next batch of stored files.
+
+        Returns SweepStats, or None if another process is already sweeping.
+        """
+        lock = self._lock()
+        if lock is None:
+            return None
+        try:
+            state = self._load_state()
+            cursor = state.get('cursor')
+            now = time.time()
+            stats = SweepStats()
+
+            batch = self._next_batch(cursor)
+            last_used = self._last_used([entry.key for entry in batch], now)
+            removed = set()  # variants already deleted with their original
+
+            for entry in batch:
+                if entry.key in removed:
+                    continue
+                stats.scanned += 1
+
+                if entry.key not in last_used:
+                    # The grace period covers uploads whose scan isn't committed yet
+                    if now - entry.modified > self.orphan_grace:
+                        stats.orphans_deleted += 1
+                        self._delete(entry, stats, removed)
+                    continue
+
+                used = last_used[entry.key]
+                age = now - (used if used is not None else entry.modified)
+                if self.retention and age > self.retention:
+                    stats.expired_deleted += 1
+                    self._delete(entry, stats, removed)
+                elif (self.thumbnail_after and age > self.thumbnail_after
+                      and entry.key.startswith(ORIGINALS_PREFIX + '/')):
+                    if not self.dry_run:
+                        ensure_variant(self.storage, entry.key, _content_hash(entry.key), 'thumb')
+                    stats.downsized += 1
+                    self._delete(entry, stats, removed, with_variants=False)
+
+            if len(batch) < self.batch_size:
+                # Reached the end of the store: start over next time
+                stats.pass_complete = True
+                self._sweep_tmp(stats, now)
+                state = {'cursor': None, 'last_full_pass': now}
+            else:
+                state['cursor'] = batch[-1].key
+
+            if not self.dry_run:
+                self._save_state(state)
+            return stats
+        finally:
+            lock.close()
+
+    def sweep_all(self, max_batches=None):
+        """Sweep batches until a full pass completes. Returns aggregate stats."""
+        total = SweepStats()
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            stats = self.sweep_batch()
+            if stats is None:
+                break
+            for name, value in stats.to_dict().items():
+                if name != 'pass_complete':
+                    setattr(total, name, getattr(total, name) + value)
+            batches += 1
+            if stats.pass_complete:
+                total.pass_complete = True
+                break
+            if self.dry_run and stats.scanned:
+                break  # dry runs don't move the cursor
+        return total
+
+
+def _content_hash(key):
+    """``originals/ab/<sha256>.png`` or ``variants/thumb/ab/<sha256>.jpg`` -> ``<sha256>``"""
+    return key.rsplit('/', 1)[-1].split('.', 1)[0]
+
+
+def _timestamp(created_at):
+    """Naive UTC ``created_at`` -> POSIX time"""
+    return created_at.replace(tzinfo=timezone.utc).timestamp() if created_at else None
+
+
+def start_background_sweeper(app):
+    """
+    Run the sweeper in a daemon thread, one batch every UPLOAD_SWEEP_INTERVAL
+    seconds. Request handling never waits on it.
+    """
+    interval = app.config.get('UPLOAD_SWEEP_INTERVAL', 0)
+    if not interval:
+        return None
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    stats = UploadSweeper.from_config(app).sweep_batch()
+                if stats and (stats.orphans_deleted or stats.expired_deleted or stats.downsized):
+                    logger.info("Upload sweep: %s", stats.to_dict())
+            except Exception:
+                logger.exception("Upload sweep failed")
+
+    thread = threading.Thread(target=run, name='upload-sweeper', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,258 @@
+# server/app/services/vision_providers.py
+"""
+Vision backends and the hedged client used by the waste scanner.
+
+A backend is anything that can turn (prompt, base64 image) into the analysis
+text. ``VISION_BACKENDS`` lists them, primary first, as comma-separated specs:
+
+    openai:gpt-4o                              OpenAI through the shared gateway
+    local:llava@http://localhost:11434/v1      any OpenAI-compatible server
+    stub                                       canned answer, no network
+
+Hedging is off by default (``VISION_HEDGE_ENABLED``). When it is on and the
+primary hasn't answered within a percentile of its own observed latency, a
+second request is sent to the next distinct backend and the first answer
+wins. With a single backend there is nothing to hedge to, so requests go to
+the primary only; sending the same paid call twice is not worth the tail.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from app.services.ai_gateway import AIGateway, get_gateway
+from app.utils.latency import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+STUB_RESPONSE = """WASTE_TYPE: plastic
+RECYCLABILITY: Recyclable
+RECYCLING_INSTRUCTIONS: Rinse and place in the plastics recycling bin.
+ENVIRONMENTAL_IMPACT: Plastic takes hundreds of years to break down in landfill.
+MATERIAL_COMPOSITION: PET plastic"""
+
+
+class VisionProvider:
+    """Interface for a vision backend."""
+
+    name = 'base'
+
+    def analyze(self, prompt, base64_image, deadline=None, cancel_event=None):
+        """
+        Return the model's text answer for one image.
+
+        ``cancel_event`` is set when another backend already answered;
+        providers that can stop early should check it.
+        """
+        raise NotImplementedError
+
+
+class OpenAIVisionProvider(VisionProvider):
+    """An OpenAI (or OpenAI-compatible) chat model with image input."""
+
+    def __init__(self, name, model, gateway=None):
+        self.name = name
+        self.model = model
+        self._gateway = gateway
+
+    @property
+    def gateway(self):
+        return self._gateway or get_gateway()
+
+    def analyze(self, prompt, base64_image, deadline=None, cancel_event=None):
+        response = self.gateway.vision_completion(
+            prompt, base64_image, model=self.model, max_tokens=500, deadline=deadline
+        )
+        return response.choices[0].message.content
+
+
+class StubVisionProvider(VisionProvider):
+    """Returns a canned answer after an optional delay. For local runs and benchmarks."""
+
+    def __init__(self, name='stub', response=STUB_RESPONSE, delay=0.0):
+        self.name = name
+        self.response = response
+        self.delay = delay
+
+    def analyze(self, prompt, base64_image, deadline=None, cancel_event=None):
+        if self.delay:
+            if cancel_event is None:
+                time.sleep(self.delay)
+            elif cancel_event.wait(self.delay):
+                raise RuntimeError('Cancelled: another backend answered first')
+        return self.response
+
+
+def build_provider(spec):
+    """Create a provider from one ``VISION_BACKENDS`` entry."""
+    spec = spec.strip()
+    kind, _, rest = spec.partition(':')
+
+    if kind == 'openai':
+        return OpenAIVisionProvider(spec, rest or 'gpt-4o')
+    if kind == 'local':
+        model, _, base_url = rest.partition('@')
+        if not model or not base_url:
+            raise ValueError(f"Local vision backend needs 'local:<model>@<base_url>', got '{spec}'")
+        gateway = AIGateway.from_env()
+        gateway.base_url = base_url
+        gateway.api_key = os.getenv('LOCAL_VISION_API_KEY', 'local')
+        return OpenAIVisionProvider(spec, model, gateway=gateway)
+    if kind == 'stub':
+        return StubVisionProvider(spec, delay=float(rest or 0))
+    raise ValueError(f"Unknown vision backend '{spec}'")
+
+
+class HedgingPolicy:
+    """When (and whether) to send a hedge request."""
+
+    def __init__(self, enabled=False, percentile=95.0, min_delay=1.0, max_delay=10.0,
+                 initial_delay=4.0, min_samples=20):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=os.getenv('VISION_HEDGE_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+            percentile=float(os.getenv('VISION_HEDGE_PERCENTILE', 95)),
+            min_delay=float(os.getenv('VISION_HEDGE_MIN_DELAY', 1.0)),
+            max_delay=float(os.getenv('VISION_HEDGE_MAX_DELAY', 10.0)),
+            initial_delay=float(os.getenv('VISION_HEDGE_INITIAL_DELAY', 4.0)),
+            min_samples=int(os.getenv('VISION_HEDGE_MIN_SAMPLES', 20)),
+        )
+
+    def delay_for(self, histogram):
+        """Hedge delay in seconds, adapted to the primary's latency distribution."""
+        if histogram.count < self.min_samples:
+            return self.initial_delay
+        estimate = histogram.percentile(self.percentile)
+        return min(self.max_delay, max(self.min_delay, estimate))
+
+
+class HedgedVisionClient:
+    """Runs vision requests against the configured backends with hedging."""
+
+    def __init__(self, providers, policy=None, max_workers=16):
+        if not providers:
+            raise ValueError('At least one vision backend is required')
+        self.providers = providers
+        self.policy = policy or HedgingPolicy()
+        self.hedge_target = next((p for p in providers[1:] if p.name != providers[0].name), None)
+        if self.policy.enabled and self.hedge_target is None:
+            logger.warning("Vision hedging needs a second backend in VISION_BACKENDS, requests go to %s only",
+                           providers[0].name)
+        self.histograms = {p.name: LatencyHistogram() for p in providers}
+        self.stats = {'requests': 0, 'hedged': 0, 'hedge_wins': 0}
+        self._stats_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='vision')
+
+    @classmethod
+    def from_env(cls):
+        specs = os.getenv('VISION_BACKENDS', 'openai:gpt-4o').split(',')
+        return cls(
+            [build_provider(spec) for spec in specs if spec.strip()],
+            policy=HedgingPolicy.from_env(),
+            max_workers=int(os.getenv('VISION_MAX_WORKERS', 16)),
+        )
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _submit(self, provider, prompt, base64_image, deadline, cancel_event):
+        def run():
+            started = time.monotonic()
+            result = provider.analyze(prompt, base64_image, deadline=deadline, cancel_event=cancel_event)
+            # Losers that still finish are recorded too, so the histogram sees the real tail
+            self.histograms[provider.name].observe(time.monotonic() - started)
+            return result
+
+        # Carry the caller's context into the pool, so usage is billed to the right client
+        return self._executor.submit(contextvars.copy_context().run, run)
+
+    @property
+    def hedging(self):
+        """True when slow primary requests are hedged to a second backend."""
+        return self.policy.enabled and self.hedge_target is not None
+
+    def analyze(self, prompt, base64_image, deadline=None):
+        """Return the first successful answer from the primary or its hedge."""
+        self._count('requests')
+        primary = self.providers[0]
+
+        if not self.hedging:
+            started = time.monotonic()
+            result = primary.analyze(prompt, base64_image, deadline=deadline)
+            self.histograms[primary.name].observe(time.monotonic() - started)
+            return result
+
+        hedge_target = self.hedge_target
+        cancel_event = threading.Event()
+        hedge_delay = self.policy.delay_for(self.histograms[primary.name])
+
+        pending = {self._submit(primary, prompt, base64_image, deadline, cancel_event)}
+        done, pending = wait(pending, timeout=hedge_delay)
+
+        if done:
+            future = done.pop()
+            if future.exception() is None:
+                return future.result()
+            # Primary failed fast: the hedge becomes a fallback
+            logger.info("Vision backend %s failed (%s), trying %s",
+                        primary.name, future.exception(), hedge_target.name)
+
+        self._count('hedged')
+        hedge_future = self._submit(hedge_target, prompt, base64_image, deadline, cancel_event)
+        pending.add(hedge_future)
+
+        last_error = None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is hedge_future:
+                            self._count('hedge_wins')
+                        return future.result()
+                    last_error = future.exception()
+        finally:
+            # Cancel the loser: not-yet-started work is dropped, running work is told to stop
+            cancel_event.set()
+            for future in pending:
+                future.cancel()
+
+        raise last_error
+
+    def describe(self):
+        return {
+            'backends': [p.name for p in self.providers],
+            'hedging': {
+                'enabled': self.hedging,
+                'target': self.hedge_target.name if self.hedge_target else None,
+                'percentile': self.policy.percentile,
+                'current_delay': self.policy.delay_for(self.histograms[self.providers[0].name]),
+            },
+            'stats': dict(self.stats),
+            'latency': {name: h.summary() for name, h in self.histograms.items()},
+        }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_vision_client():
+    """Return the process-wide hedged vision client."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HedgedVisionClient.from_env()
+    return _client
@@ -1,68 +1,56 @@
-import os
 import base64
+import logging
 from datetime import datetime
+from sqlalchemy import and_, or_
 from app import db
 from app.models.waste_item import WasteItem
-from openai import OpenAI
-from dotenv import load_dotenv
-from werkzeug.utils import secure_filename
-import uuid
+from app.services.storage_service import get_storage
+from app.services.vision_providers import get_vision_client
+from app.utils.singleflight import get_flight
 
-# Load environment variables
-load_dotenv()
+logger = logging.getLogger(__name__)
+
+WASTE_ANALYSIS_PROMPT = """Analyze this image and provide information about the waste item shown. Respond in the following format:
+
+WASTE_TYPE: [type of waste - plastic, paper, glass, metal, organic, etc.]
+RECYCLABILITY: [Recyclable/Non-recyclable/Conditionally recyclable]
+RECYCLING_INSTRUCTIONS: [Brief instructions on how to properly dispose/recycle]
+ENVIRONMENTAL_IMPACT: [Brief note on environmental impact]
+MATERIAL_COMPOSITION: [Main materials in the item]"""
 
 def encode_image_to_base64(image_path):
     """Convert image to base64 string"""
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode('utf-8')
 
-def analyze_waste_image(image_path):
+def load_image_base64(filepath, storage_key=None):
+    """Base64-encode a stored upload, reading through the storage backend when needed"""
+    if storage_key:
+        storage = get_storage()
+        if storage.local_path(storage_key) is None:
+            return base64.b64encode(storage.read_bytes(storage_key)).decode('utf-8')
+    return encode_image_to_base64(filepath)
+
+def analyze_waste_image(image_path, base64_image=None):
     """Analyze waste image using OpenAI Vision API"""
     try:
-        # Initialize OpenAI client
-        client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        
         # Encode image to base64
-        base64_image = encode_image_to_base64(image_path)
-        
-        # Call OpenAI API with updated model name
-        response = client.chat.completions.create(
-            model="gpt-4o",  # Updated to use gpt-4o which supports vision
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": """Analyze this image and provide information about the waste item shown. Respond in the following format:
-                            
-WASTE_TYPE: [type of waste - plastic, paper, glass, metal, organic, etc.]
-RECYCLABILITY: [Recyclable/Non-recyclable/Conditionally recyclable]
-RECYCLING_INSTRUCTIONS: [Brief instructions on how to properly dispose/recycle]
-ENVIRONMENTAL_IMPACT: [Brief note on environmental impact]
-MATERIAL_COMPOSITION: [Main materials in the item]"""
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=500
-        )
+        if base64_image is None:
+            base64_image = encode_image_to_base64(image_path)
         
-        return response.choices[0].message.content
+        # Call the configured vision backends (hedged against slow responses)
+        return get_vision_client().analyze(WASTE_ANALYSIS_PROMPT, base64_image)
         
     except Exception as e:
-        print(f"Error analyzing image: {str(e)}")
+        logger.warning("Error analyzing image: %s", e)
         raise e
 
+class UnparseableAnalysis(ValueError):
+    """The model answered, but not in the WASTE_TYPE/RECYCLABILITY/... format"""
+
 def extract_ai_response_fields(ai_response):
     """Extract individual fields from the AI response string"""
-    lines = ai_response.split('\n')
+    lines = (ai_response or '').split('\n')
     fields = {}
     
     for line in lines:
@@ -77,22 +65,39 @@ def extract_ai_response_fields(ai_response):
         elif line.startswith('MATERIAL_COMPOSITION:'):
             fields['material_composition'] = line.replace('MATERIAL_COMPOSITION:', '').strip()
     
+    if not fields.get('waste_type') and not fields.get('recyclability'):
+        raise UnparseableAnalysis(f"Unrecognised analysis format: {(ai_response or '')[:120]!r}")
+    
     return fields
 
-def save_waste_analysis_result(filename, filepath, original_name=None, user_id=None):
-    """Save the uploaded image info and AI analysis to the database"""
+def save_waste_analysis_result(filename, filepath, original_name=None, user_id=None,
+                               storage_key=None, content_hash=None, commit=True):
+    """
+    Save the uploaded image info and AI analysis to the database.
+
+    With ``commit=False`` the new row is only flushed, so the caller can
+    commit it together with its own changes (the retry queue deletes the
+    FailedScan in the same transaction).
+    """
     try:
-        # Analyze the image using AI
-        ai_response = analyze_waste_image(filepath)
-        
-        # Extract individual fields from AI response
-        fields = extract_ai_response_fields(ai_response)
+        def analyze():
+            # Analyze the image using AI and extract individual fields from its response
+            ai_response = analyze_waste_image(filepath, load_image_base64(filepath, storage_key))
+            return extract_ai_response_fields(ai_response)
+
+        if content_hash:
+            # Simultaneous scans of the same image share one AI call
+            fields, _ = get_flight('vision').do(content_hash, analyze)
+        else:
+            fields = analyze()
         
         # Create a new WasteItem instance
         waste_item = WasteItem(
             filename=filename,
             filepath=filepath,
             original_name=original_name,
+            storage_key=storage_key,
+            content_hash=content_hash,
             waste_type=fields.get('waste_type', ''),
             recyclability=fields.get('recyclability', ''),
             recycling_instructions=fields.get('recycling_instructions', ''),
@@ -103,12 +108,15 @@ def save_waste_analysis_result(filename, filepath, original_name=None, user_id=N
         
         # Add to database
         db.session.add(waste_item)
-        db.session.commit()
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
         
         return waste_item.to_dict()
         
     except Exception as e:
-        print(f"Error saving waste analysis result: {str(e)}")
+        logger.warning("Error saving waste analysis result: %s", e)
         db.session.rollback()
         raise e
 
@@ -120,14 +128,76 @@ def get_waste_analysis_by_id(waste_item_id):
             return waste_item.to_dict()
         return None
     except Exception as e:
-        print(f"Error retrieving waste analysis: {str(e)}")
+        logger.exception("Error retrieving waste analysis")
         return None
 
-def get_all_waste_analyses():
-    """Retrieve all waste analysis results"""
+def encode_cursor(waste_item):
+    """Opaque keyset cursor pointing just after ``waste_item``"""
+    raw = f"{waste_item.created_at.isoformat()}|{waste_item.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Raises ValueError on a malformed cursor"""
     try:
-        waste_items = WasteItem.query.all()
-        return [item.to_dict() for item in waste_items]
-    except Exception as e:
-        print(f"Error retrieving waste analyses: {str(e)}")
-        return []
\ No newline at end of file
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, item_id = raw.split('|', 1)
+        return datetime.fromisoformat(created_at), int(item_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def list_waste_analyses(user_id=None, waste_type=None, recyclability=None,
+                        created_from=None, created_to=None, cursor=None, limit=20):
+    """
+    Retrieve waste analysis results newest-first using keyset pagination
+
+    Args:
+        user_id: Only scans made by this user
+        waste_type: Exact waste type (e.g. 'plastic')
+        recyclability: Exact recyclability value (e.g. 'Recyclable')
+        created_from: Only scans created at or after this datetime
+        created_to: Only scans created before this datetime
+        cursor: Cursor returned as ``next_cursor`` by the previous page
+        limit: Page size
+
+    Returns:
+        (list of dicts, next_cursor or None)
+    """
+    query = WasteItem.query.filter(WasteItem.created_at.isnot(None))
+
+    if user_id is not None:
+        query = query.filter(WasteItem.user_id == user_id)
+    if waste_type:
+        query = query.filter(WasteItem.waste_type == waste_type)
+    if recyclability:
+        query = query.filter(WasteItem.recyclability == recyclability)
+    if created_from:
+        query = query.filter(WasteItem.created_at >= created_from)
+    if created_to:
+        query = query.filter(WasteItem.created_at < created_to)
+
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            WasteItem.created_at < cursor_created_at,
+            and_(WasteItem.created_at == cursor_created_at, WasteItem.id < cursor_id)
+        ))
+
+    # Fetch one extra row to know whether another page exists
+    waste_items = query.order_by(
+        WasteItem.created_at.desc(), WasteItem.id.desc()
+    ).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(waste_items) > limit:
+        waste_items = waste_items[:limit]
+        next_cursor = encode_cursor(waste_items[-1])
+
+    return [item.to_dict() for item in waste_items], next_cursor
+
+def get_recent_waste_analyses(user_id=None, limit=6):
+    """Retrieve the most recent waste analysis results, optionally for one user"""
+    query = WasteItem.query
+    if user_id is not None:
+        query = query.filter(WasteItem.user_id == user_id)
+    waste_items = query.order_by(WasteItem.created_at.desc(), WasteItem.id.desc()).limit(limit).all()
+    return [item.to_dict() for item in waste_items]
@@ -0,0 +1,231 @@
+# server/app/utils/auth.py
+"""
+Request authentication: the verified JWT identity of the caller.
+
+Every request that sends ``Authorization: Bearer <token>`` has the token
+verified before the view runs and its user resolved to an ``Identity``
+(id, username, name, email). Views read it with ``current_identity()``;
+``user_required`` in ``app.utils.helpers`` checks it against the
+``user_id`` a request names, and answers 401 for invalid or expired tokens.
+Other views serve such requests as anonymous.
+
+Identities come from ``IdentityCache``, a per-process LRU with a short TTL
+(``AUTH_IDENTITY_CACHE_TTL``), so an authenticated request costs no user
+query when the cache is warm. Updating or deleting a user's identity fields
+evicts the entry in the process that made the change once the transaction
+commits (evicting at flush would let a concurrent request cache the old row
+again before the commit); other workers see the change within the TTL.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, jsonify
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+
+logger = logging.getLogger(__name__)
+
+IDENTITY_FIELDS = ('username', 'name', 'email')
+EVICTIONS_KEY = 'identity_evictions'  # Session.info: user ids to evict once the transaction commits
+
+
+class Identity:
+    """What a request knows about its caller; safe to share between requests."""
+    __slots__ = ('id', 'username', 'name', 'email')
+
+    def __init__(self, id, username, name, email):
+        self.id = id
+        self.username = username
+        self.name = name
+        self.email = email
+
+    def to_dict(self):
+        return {'id': self.id, 'username': self.username, 'name': self.name, 'email': self.email}
+
+    def __repr__(self):
+        return f'<Identity {self.id} {self.username}>'
+
+
+class IdentityCache:
+    """Thread-safe TTL + LRU cache of user id -> Identity."""
+
+    def __init__(self, ttl=60, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        self._entries = OrderedDict()  # user id -> (Identity, expires_at), least recently used first
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            ttl=config.get('AUTH_IDENTITY_CACHE_TTL', 60),
+            max_entries=config.get('AUTH_IDENTITY_CACHE_SIZE', 1024),
+        )
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                self.stats['hits'] += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[user_id]
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, identity):
+        with self._lock:
+            self._entries[identity.id] = (identity, time.monotonic() + self.ttl)
+            self._entries.move_to_end(identity.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.stats['invalidations'] += 1
+
+    def describe(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'ttl': self.ttl, 'stats': dict(self.stats)}
+
+
+def get_identity_cache(app=None):
+    """Return the app's identity cache, or None when caching is disabled (TTL 0)."""
+    if app is None:
+        app = current_app._get_current_object()
+    if not app.config.get('AUTH_IDENTITY_CACHE_TTL', 60):
+        return None
+    cache = app.extensions.get('identity_cache')
+    if cache is None:
+        cache = app.extensions.setdefault('identity_cache', IdentityCache.from_config(app.config))
+    return cache
+
+
+def load_identity(user_id):
+    """The Identity of ``user_id``, from the cache or one query; None for unknown users."""
+    cache = get_identity_cache()
+    if cache is not None:
+        identity = cache.get(user_id)
+        if identity is not None:
+            return identity
+
+    from app import db
+    from app.models.user import User
+    from app.utils.database import primary, reading_from_replica
+
+    query = db.select(User.id, User.username, User.name, User.email).where(User.id == user_id)
+    row = db.session.execute(query).first()
+    if row is None and reading_from_replica():
+        with primary():  # just registered: the replica may not have the row yet
+            row = db.session.execute(query).first()
+    if row is None:
+        return None
+    identity = Identity(*row)
+    if cache is not None:
+        cache.put(identity)
+    return identity
+
+
+def invalidate_identity(user_id):
+    """Forget the cached identity of ``user_id`` (call after bulk UPDATEs that bypass the ORM)."""
+    from flask import has_app_context
+
+    if has_app_context():
+        cache = get_identity_cache()
+        if cache is not None:
+            cache.invalidate(user_id)
+
+
+def current_identity():
+    """The verified caller of this request, or None for requests without a (valid) token."""
+    return g.get('identity')
+
+
+def current_user_id():
+    """The user a ``user_required`` view acts for (None for anonymous requests)."""
+    return g.get('user_id')
+
+
+def authentication_error():
+    """Why the request's token was rejected, or None."""
+    return g.get('auth_error')
+
+
+def _evict_on_commit(target):
+    session = object_session(target)
+    if session is None:
+        invalidate_identity(target.id)
+    else:
+        session.info.setdefault(EVICTIONS_KEY, set()).add(target.id)
+
+
+def _user_changed(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in IDENTITY_FIELDS):
+        _evict_on_commit(target)
+
+
+def _user_deleted(mapper, connection, target):
+    _evict_on_commit(target)
+
+
+def _session_committed(session):
+    for user_id in session.info.pop(EVICTIONS_KEY, ()):
+        invalidate_identity(user_id)
+
+
+def _session_rolled_back(session):
+    session.info.pop(EVICTIONS_KEY, None)
+
+
+def init_auth(app):
+    """Verify bearer tokens before every request and resolve them through the identity cache."""
+    from flask_jwt_extended import get_current_user, verify_jwt_in_request
+    from flask_jwt_extended.exceptions import JWTExtendedException
+    from jwt import PyJWTError
+
+    from app import db, jwt
+    from app.models.user import User
+
+    @jwt.user_lookup_loader
+    def _lookup_user(jwt_header, jwt_data):
+        try:
+            return load_identity(int(jwt_data[app.config.get('JWT_IDENTITY_CLAIM', 'sub')]))
+        except (TypeError, ValueError):
+            return None
+
+    @jwt.user_lookup_error_loader
+    def _unknown_user(jwt_header, jwt_data):
+        return jsonify({'error': 'User no longer exists'}), 401
+
+    @jwt.invalid_token_loader
+    def _invalid_token(reason):
+        return jsonify({'error': f'Invalid token: {reason}'}), 401
+
+    @jwt.expired_token_loader
+    def _expired_token(jwt_header, jwt_data):
+        return jsonify({'error': 'Token has expired'}), 401
+
+    @jwt.unauthorized_loader
+    def _missing_token(reason):
+        return jsonify({'error': 'Authentication required'}), 401
+
+    @app.before_request
+    def _authenticate():
+        try:
+            if verify_jwt_in_request(optional=True):
+                g.identity = get_current_user()
+        except (JWTExtendedException, PyJWTError) as exc:
+            g.auth_error = exc  # raised by user_required, so JWTManager answers with the 401s above
+
+    if not event.contains(User, 'after_update', _user_changed):
+        event.listen(User, 'after_update', _user_changed)
+        event.listen(User, 'after_delete', _user_deleted)
+        event.listen(db.session, 'after_commit', _session_committed)
+        event.listen(db.session, 'after_rollback', _session_rolled_back)
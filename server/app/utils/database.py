@@ -0,0 +1,294 @@
+# server/app/utils/database.py
+"""
+Database engines: per-connection settings and read-replica routing.
+
+Pool sizing, recycling, pre-ping and PostgreSQL's statement_timeout are
+engine options (``config.engine_options``). SQLite's journal mode,
+synchronous level and lock wait are pragmas, set here on every new
+connection: WAL lets readers run while a write is in progress, so
+concurrent requests no longer fail with "database is locked".
+
+With ``DATABASE_REPLICA_URL`` set, the ``replica`` bind serves the reads
+of GET requests. ``RoutingSession`` (the class of ``db.session``) sends a
+SELECT there when the request allows it; everything else goes to the
+primary:
+
+- writes, and every read after the session's first write (read your own writes)
+- requests from a client that wrote in the last ``REPLICA_STICKY_SECONDS``:
+  the response to a write carries the deadline in ``X-Read-Primary-Until``
+  and clients send it back, so every worker honours it; clients that don't
+  are tracked per worker process, by bearer token or address
+- views marked with ``reads_primary``
+- all requests while the replica is more than ``REPLICA_MAX_LAG_SECONDS``
+  behind or unreachable, checked every ``REPLICA_LAG_CHECK_INTERVAL`` seconds
+"""
+import contextvars
+import hashlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+READ_METHODS = ('GET', 'HEAD')
+PRIMARY_UNTIL_HEADER = 'X-Read-Primary-Until'  # POSIX time until which the client reads from the primary
+
+# Seconds the standby is behind; 0 when it has replayed everything it received (an idle primary)
+POSTGRES_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+# Replica engine the current request may read from (None = primary only)
+_read_engine = contextvars.ContextVar('read_engine', default=None)
+
+JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+SYNCHRONOUS_LEVELS = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+
+def sqlite_pragmas(profile):
+    """The PRAGMA statements for a profile (values are checked: they are not parameters)."""
+    journal_mode = profile['sqlite_journal_mode']
+    synchronous = profile['sqlite_synchronous']
+    if journal_mode not in JOURNAL_MODES:
+        raise ValueError(f'Unknown SQLite journal mode {journal_mode!r}')
+    if synchronous not in SYNCHRONOUS_LEVELS:
+        raise ValueError(f'Unknown SQLite synchronous level {synchronous!r}')
+    return [
+        f"PRAGMA busy_timeout = {int(profile['sqlite_busy_timeout_ms'])}",
+        f'PRAGMA journal_mode = {journal_mode}',
+        f'PRAGMA synchronous = {synchronous}',
+    ]
+
+
+def configure_engines(app):
+    """Apply the profile's per-connection settings to every engine of the app."""
+    from app import db
+
+    profile = app.config.get('DB_ENGINE_PROFILE')
+    if not profile:
+        return
+    with app.app_context():
+        engines = list(db.engines.values())
+
+    for engine in engines:
+        if engine.dialect.name != 'sqlite':
+            continue
+        pragmas = sqlite_pragmas(profile)
+
+        @event.listens_for(engine, 'connect')
+        def _set_pragmas(dbapi_connection, connection_record, pragmas=pragmas):
+            cursor = dbapi_connection.cursor()
+            try:
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+            finally:
+                cursor.close()
+
+    logger.info("Database engine profile %s", app.config.get('DB_PROFILE'),
+                extra={'engine_profile': profile})
+
+
+# ----------------------------------------------------------------------
+# Read replica
+# ----------------------------------------------------------------------
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends plain SELECTs to the replica when the request allows it."""
+
+    wrote = False  # set once anything in this session went to the primary
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = _read_engine.get()
+        if replica is not None and bind is None and not self.wrote and not self._flushing:
+            if getattr(clause, 'is_select', False) and not _has_bind_key(mapper, clause):
+                return replica
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if replica is not None and not getattr(clause, 'is_select', False):
+            self.wrote = True
+        return engine
+
+
+def _has_bind_key(mapper, clause):
+    """True for models and tables that live on a bind of their own."""
+    from sqlalchemy import inspect
+
+    if mapper is not None:
+        table = inspect(mapper).local_table
+        return table.metadata.info.get('bind_key') is not None
+    for table in getattr(clause, 'froms', ()):
+        metadata = getattr(table, 'metadata', None)
+        if metadata is not None and metadata.info.get('bind_key') is not None:
+            return True
+    return False
+
+
+class ReplicaMonitor:
+    """Tracks whether the replica is close enough to the primary to read from."""
+
+    def __init__(self, max_lag=5.0, interval=5.0, sticky_seconds=10.0):
+        self.max_lag = max_lag
+        self.interval = interval
+        self.sticky_seconds = sticky_seconds
+        self.lag = None
+        self.stats = {'checks': 0, 'replica_requests': 0, 'primary_requests': 0, 'lagging': 0, 'errors': 0}
+        self._usable = False
+        self._checked_at = float('-inf')
+        self._check_lock = threading.Lock()
+        self._writers = {}  # client key -> monotonic time until which it reads from the primary
+        self._writers_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            max_lag=config.get('REPLICA_MAX_LAG_SECONDS', 5.0),
+            interval=config.get('REPLICA_LAG_CHECK_INTERVAL', 5.0),
+            sticky_seconds=config.get('REPLICA_STICKY_SECONDS', 10.0),
+        )
+
+    def usable(self, engine):
+        """Whether reads may go to ``engine``; rechecks the lag when the last check is stale."""
+        if time.monotonic() - self._checked_at >= self.interval and self._check_lock.acquire(blocking=False):
+            try:
+                self._check(engine)
+            finally:
+                self._check_lock.release()
+        return self._usable
+
+    def _check(self, engine):
+        self.stats['checks'] += 1
+        try:
+            with engine.connect() as connection:
+                if engine.dialect.name == 'postgresql':
+                    lag = float(connection.execute(POSTGRES_LAG_SQL).scalar() or 0.0)
+                else:
+                    connection.execute(text('SELECT 1'))
+                    lag = 0.0
+        except Exception as exc:
+            self.stats['errors'] += 1
+            if self._usable or self.stats['checks'] == 1:
+                logger.warning("Read replica unreachable, reading from the primary: %s", exc)
+            self._usable, self.lag = False, None
+        else:
+            usable = lag <= self.max_lag
+            if not usable:
+                self.stats['lagging'] += 1
+                if self._usable or self.stats['checks'] == 1:
+                    logger.warning("Read replica %.1fs behind, reading from the primary", lag)
+            elif not self._usable and self.stats['checks'] > 1:
+                logger.info("Read replica back in use (lag %.1fs)", lag)
+            self._usable, self.lag = usable, lag
+        self._checked_at = time.monotonic()
+
+    def wrote(self, client):
+        until = time.monotonic() + self.sticky_seconds
+        with self._writers_lock:
+            self._writers[client] = until
+            if len(self._writers) > 10000:
+                now = time.monotonic()
+                self._writers = {key: value for key, value in self._writers.items() if value > now}
+
+    def is_sticky(self, client):
+        with self._writers_lock:
+            until = self._writers.get(client)
+        return until is not None and until > time.monotonic()
+
+    def describe(self):
+        return {'usable': self._usable, 'lag_seconds': self.lag, 'max_lag_seconds': self.max_lag,
+                'stats': dict(self.stats)}
+
+
+def reads_primary(view):
+    """Serve a GET view from the primary (it must see writes the instant they commit)."""
+    view.reads_primary = True
+    return view
+
+
+@contextmanager
+def primary():
+    """Read from the primary inside the block, e.g. to confirm a row the replica does not have yet."""
+    token = _read_engine.set(None)
+    try:
+        yield
+    finally:
+        _read_engine.reset(token)
+
+
+def reading_from_replica():
+    return _read_engine.get() is not None
+
+
+def read_engine():
+    """The engine this request's reads go to (for sessions made outside ``db.session``)."""
+    from app import db
+
+    return _read_engine.get() or db.engine
+
+
+def get_replica_monitor(app=None):
+    """Return the app's replica monitor, or None without a replica."""
+    if app is None:
+        app = current_app._get_current_object()
+    return app.extensions.get('replica_monitor')
+
+
+def _client_key():
+    # Before authentication runs, so keyed by the bearer token itself (hashed) or the address
+    credential = request.headers.get('Authorization') or request.remote_addr or ''
+    return hashlib.sha1(credential.encode()).hexdigest()
+
+
+def _echoed_write(monitor):
+    """Whether the client sent back a read-your-writes deadline that has not passed."""
+    try:
+        until = float(request.headers.get(PRIMARY_UNTIL_HEADER) or 0)
+    except ValueError:
+        return False
+    # Capped, so a made-up deadline can't keep a client off the replica for good
+    now = time.time()
+    return now < until <= now + monitor.sticky_seconds
+
+
+def init_read_replica(app):
+    """Route the reads of GET requests to the ``replica`` bind, if one is configured."""
+    from app import db
+
+    if REPLICA_BIND not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return None
+    monitor = app.extensions['replica_monitor'] = ReplicaMonitor.from_config(app.config)
+
+    @app.before_request
+    def _choose_read_engine():
+        view = app.view_functions.get(request.endpoint)
+        if request.method not in READ_METHODS or getattr(view, 'reads_primary', False):
+            return
+        if _echoed_write(monitor) or monitor.is_sticky(_client_key()):
+            monitor.stats['primary_requests'] += 1
+            return
+        replica = db.engines[REPLICA_BIND]
+        if monitor.usable(replica):
+            _read_engine.set(replica)
+            g.read_replica = True
+            monitor.stats['replica_requests'] += 1
+        else:
+            monitor.stats['primary_requests'] += 1
+
+    @app.after_request
+    def _remember_writers(response):
+        if request.method not in READ_METHODS or getattr(db.session(), 'wrote', False):
+            monitor.wrote(_client_key())
+            response.headers[PRIMARY_UNTIL_HEADER] = f'{time.time() + monitor.sticky_seconds:.3f}'
+        return response
+
+    @app.teardown_request
+    def _clear_read_engine(exc=None):
+        if g.pop('read_replica', None):
+            _read_engine.set(None)
+
+    logger.info("Read replica enabled for GET requests")
+    return monitor
@@ -0,0 +1,110 @@
+# server/app/utils/helpers.py
+import hmac
+from functools import wraps
+
+from flask import current_app, g, jsonify, request
+
+
+def admin_required(view):
+    """
+    Protect an admin endpoint with the shared ``ADMIN_API_TOKEN``.
+
+    Clients send it in the ``X-Admin-Token`` header. When no token is
+    configured the admin API is disabled altogether.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        expected = current_app.config.get('ADMIN_API_TOKEN')
+        if not expected:
+            return jsonify({'error': 'Admin API is disabled'}), 403
+        supplied = request.headers.get('X-Admin-Token', '')
+        if not hmac.compare_digest(supplied.encode(), expected.encode()):
+            return jsonify({'error': 'Invalid admin token'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def rate_limited(endpoint):
+    """
+    Shed requests over the client's rate limit or daily AI budget with a
+    429 and ``Retry-After``. Runs before the view, so nothing is read from
+    the request body and no AI call is made for rejected requests.
+
+    AI calls made by admitted requests are billed to the client and
+    recorded under ``endpoint`` in the usage accounting.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            from app.services.ai_usage import attribute_ai_calls
+            from app.services.rate_limiter import bill_to, client_subject, get_admission_controller
+
+            subject = client_subject()
+            attribute_ai_calls(endpoint, subject)
+            controller = get_admission_controller()
+            if controller is None:
+                return view(*args, **kwargs)
+            rejected = controller.admit(endpoint, subject)
+            if rejected is not None:
+                message, retry_after = rejected
+                response = jsonify({'error': message, 'retry_after': retry_after})
+                response.headers['Retry-After'] = str(retry_after)
+                return response, 429
+            bill_to(controller, subject, endpoint)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def user_required(view=None, *, optional=False, strict=False):
+    """
+    Tie a view to the caller's verified identity (``app.utils.auth``).
+
+    The ``user_id`` a request names (path argument, query string, JSON body
+    or form field) must be the caller's, else 403; views read the effective
+    id with ``current_user_id()``. An invalid or expired token is a 401.
+
+    Requests without a token need one when ``AUTH_REQUIRED`` is on (unless
+    ``optional``: they are served anonymously). While it is off (local
+    development), they are served for the ``user_id`` they name, as before
+    tokens were checked. ``strict`` views (personal data such as the email
+    address) need a token either way.
+    """
+    if view is None:
+        return lambda view: user_required(view, optional=optional, strict=strict)
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        from app.utils.auth import authentication_error, current_identity
+
+        error = authentication_error()
+        if error is not None:
+            raise error  # answered by the JWT error loaders
+
+        claimed = kwargs.get('user_id')
+        if claimed is None and request.method == 'GET':
+            claimed = request.args.get('user_id')
+        elif claimed is None:
+            body = request.get_json(silent=True) if request.is_json else None
+            claimed = body.get('user_id') if isinstance(body, dict) else request.form.get('user_id')
+        if claimed not in (None, ''):
+            try:
+                claimed = int(claimed)
+            except (TypeError, ValueError):
+                return jsonify({'error': 'user_id must be an integer'}), 400
+        else:
+            claimed = None
+
+        identity = current_identity()
+        if identity is not None:
+            if claimed is not None and claimed != identity.id:
+                return jsonify({'error': 'Not allowed for this user'}), 403
+            g.user_id = identity.id
+        elif strict or current_app.config.get('AUTH_REQUIRED'):
+            if not optional:
+                return jsonify({'error': 'Authentication required'}), 401
+            g.user_id = None
+        else:
+            g.user_id = claimed
+        return view(*args, **kwargs)
+    return wrapper
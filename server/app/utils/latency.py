@@ -0,0 +1,80 @@
+# server/app/utils/latency.py
+"""Small, thread-safe latency histogram with percentile estimates."""
+import bisect
+import threading
+
+# Upper bounds in seconds, roughly log-spaced from 5 ms to 2 min
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.25, 0.35, 0.5, 0.75,
+    1.0, 1.5, 2.0, 2.5, 3.0, 4.0, 5.0, 6.0, 8.0, 10.0, 15.0, 20.0, 30.0,
+    45.0, 60.0, 120.0,
+)
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket histogram of durations (seconds).
+
+    Memory is constant no matter how many observations are recorded, and
+    percentiles are interpolated linearly inside the matching bucket.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+
+    def merge(self, counts, total=0.0):
+        """Add bucket counts recorded elsewhere (a stored snapshot with the same buckets)."""
+        if len(counts) != len(self.counts):
+            raise ValueError('Histogram buckets do not match')
+        with self._lock:
+            for index, bucket_count in enumerate(counts):
+                self.counts[index] += bucket_count
+            self.count += sum(counts)
+            self.total += total
+
+    def percentile(self, p):
+        """Estimated ``p``-th percentile (0-100) in seconds, or None if empty."""
+        with self._lock:
+            if self.count == 0:
+                return None
+            rank = self.count * p / 100.0
+            cumulative = 0
+            for index, bucket_count in enumerate(self.counts):
+                if bucket_count and cumulative + bucket_count >= rank:
+                    lower = self.buckets[index - 1] if index > 0 else 0.0
+                    if index >= len(self.buckets):
+                        return lower  # +Inf bucket: best we can say is "above the last bound"
+                    upper = self.buckets[index]
+                    fraction = (rank - cumulative) / bucket_count
+                    return lower + (upper - lower) * fraction
+                cumulative += bucket_count
+            return self.buckets[-1]
+
+    def snapshot(self):
+        """Plain-dict copy suitable for JSON responses."""
+        with self._lock:
+            return {
+                'buckets': list(self.buckets),
+                'counts': list(self.counts),
+                'count': self.count,
+                'sum': round(self.total, 6),
+            }
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
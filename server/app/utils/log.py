@@ -0,0 +1,203 @@
+# server/app/utils/log.py
+"""
+Logging setup: structured records, written off the request thread.
+
+Loggers hand their records to a ``QueueHandler`` on the root logger, which
+only renders the message and puts the record on a bounded queue. A
+``QueueListener`` thread formats them (as JSON or text) and writes them to
+stdout, so a burst of log lines never blocks a gunicorn worker on stdout.
+When the queue is full, records are dropped and counted instead.
+
+Every request gets an id: the client's ``X-Request-ID`` when it sends a
+sensible one, else a new one. It is returned in the ``X-Request-ID``
+response header and added to every record logged while serving the
+request, including from threads that copy the request's context.
+
+Settings:
+
+    LOG_LEVEL              root level (INFO)
+    LOG_LEVELS             per-logger levels, "app.routes.marketplace=DEBUG,werkzeug=WARNING"
+    LOG_FORMAT             json or text
+    LOG_DEBUG_SAMPLE_RATE  share of requests (0..1) whose DEBUG records are kept
+    LOG_QUEUE_SIZE         records waiting to be written before new ones are dropped
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+
+from flask import g, request
+
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+TEXT_FORMAT = '%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'
+
+# Attributes every LogRecord has; anything else was passed with extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'request_id'}
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+_listener = None
+
+requests_logger = logging.getLogger('app.requests')
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds ``request_id`` ('-' outside requests) to every record."""
+
+    def filter(self, record):
+        record.request_id = _request_id.get() or '-'
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    Keeps DEBUG records for a ``rate`` share of requests. The decision is
+    made per request id, so a sampled request keeps all its debug lines.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        request_id = _request_id.get()
+        if request_id is None:
+            return random.random() < self.rate
+        return zlib.crc32(request_id.encode()) % 10000 < self.rate * 10000
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with any ``extra`` fields of the record."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of raising."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Only render the message here; exceptions and output formatting are left to the listener thread
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_levels(spec):
+    """'a.b=DEBUG,c=WARNING' -> {'a.b': 'DEBUG', 'c': 'WARNING'}"""
+    levels = {}
+    for item in (spec or '').split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(config):
+    """Route all logging through the queue; safe to call again (the old listener is stopped)."""
+    global _listener
+
+    if config.get('LOG_FORMAT', 'text') == 'json':
+        formatter = JSONFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+        formatter.converter = time.gmtime
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(formatter)
+
+    handler = NonBlockingQueueHandler(queue.Queue(config.get('LOG_QUEUE_SIZE', 10000)))
+    handler.addFilter(RequestIdFilter())
+    handler.addFilter(DebugSamplingFilter(config.get('LOG_DEBUG_SAMPLE_RATE', 1.0)))
+
+    if _listener is not None:
+        _listener.stop()
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=False)
+    _listener.start()
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        if isinstance(existing, NonBlockingQueueHandler):
+            root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(config.get('LOG_LEVEL', 'INFO').upper())
+    for name, level in parse_levels(config.get('LOG_LEVELS')).items():
+        logging.getLogger(name).setLevel(level)
+    return handler
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()  # writes out what is still queued
+
+
+atexit.register(_stop_listener)
+
+
+def init_request_logging(app):
+    """Give every request an id and log one line per finished request."""
+    @app.before_request
+    def _assign_request_id():
+        supplied = request.headers.get('X-Request-ID', '')
+        request_id = supplied if REQUEST_ID_PATTERN.match(supplied) else uuid.uuid4().hex
+        _request_id.set(request_id)
+        g.request_id = request_id
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _log_request(response):
+        request_id = g.get('request_id')
+        if request_id:
+            response.headers['X-Request-ID'] = request_id
+            requests_logger.info(
+                '%s %s %s', request.method, request.path, response.status_code,
+                extra={'method': request.method, 'path': request.path, 'status': response.status_code,
+                       'duration_ms': round((time.perf_counter() - g.request_started) * 1000, 1)},
+            )
+        return response
+
+    @app.teardown_request
+    def _clear_request_id(exc=None):
+        # Runs after streamed responses finish, so their log lines keep the id
+        if g.pop('request_id', None):
+            _request_id.set(None)
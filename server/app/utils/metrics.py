@@ -0,0 +1,358 @@
+# server/app/utils/metrics.py
+"""
+Request, SQL and connection-pool metrics, served at ``GET /metrics`` in the
+Prometheus text format.
+
+Recorded per blueprint and route (the URL rule, e.g.
+``/api/activities/<int:user_id>``):
+
+- greennexus_http_requests_total{blueprint, route, method, status}
+- greennexus_http_request_duration_seconds (histogram; streamed responses
+  until their last chunk)
+- greennexus_db_statements_total and greennexus_db_statement_seconds_total
+- greennexus_db_statements_per_request (histogram, spots N+1 queries)
+
+and per database bind, greennexus_db_pool_checkout_wait_seconds: how long
+getting a connection from the pool took (opening one included). SQL run
+outside a request (background threads) is counted under the route
+``(background)``.
+
+Each worker counts in memory and every ``METRICS_FLUSH_INTERVAL`` seconds
+writes its counts to ``<METRICS_DIR>/<pid>.json``. The worker that serves a
+scrape writes its own file and adds up all of them, so the numbers cover
+every gunicorn worker, those that have exited included, with the others'
+counts at most one interval old. ``gunicorn.conf.py`` sets up the directory
+and empties it when the server starts. Without ``METRICS_DIR`` (``flask
+run``) /metrics shows this process only.
+"""
+import atexit
+import contextvars
+import glob
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import Response, current_app, g, request
+from sqlalchemy import event
+
+from app.utils.latency import DEFAULT_BUCKETS, LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'greennexus'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+BACKGROUND_ROUTE = '(background)'
+UNMATCHED_ROUTE = '(unmatched)'
+
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+CHECKOUT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# SQL statements of the current request (None outside requests)
+_request_sql = contextvars.ContextVar('request_sql', default=None)
+
+
+class RequestSQL:
+    """Statements and SQL time of one request; added to from the threads it hands queries to."""
+    __slots__ = ('statements', 'seconds', '_lock')
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.statements += 1
+            self.seconds += seconds
+
+
+class MetricsRegistry:
+    """In-memory counters and histograms of one process, or the sum of several."""
+
+    def __init__(self):
+        self.requests = {}  # (blueprint, route, method, status) -> count
+        self.latency = {}  # (blueprint, route) -> LatencyHistogram
+        self.sql = {}  # (blueprint, route) -> [statements, seconds]
+        self.sql_per_request = {}  # (blueprint, route) -> LatencyHistogram of statement counts
+        self.checkout_wait = {}  # bind -> LatencyHistogram
+        self._lock = threading.Lock()
+
+    def _histogram(self, table, key, buckets):
+        histogram = table.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = table.setdefault(key, LatencyHistogram(buckets))
+        return histogram
+
+    def observe_request(self, blueprint, route, method, status, seconds, sql):
+        key = (blueprint, route)
+        with self._lock:
+            request_key = (blueprint, route, method, str(status))
+            self.requests[request_key] = self.requests.get(request_key, 0) + 1
+            totals = self.sql.setdefault(key, [0, 0.0])
+            totals[0] += sql.statements
+            totals[1] += sql.seconds
+        self._histogram(self.latency, key, DEFAULT_BUCKETS).observe(seconds)
+        self._histogram(self.sql_per_request, key, STATEMENT_BUCKETS).observe(sql.statements)
+
+    def observe_background_statement(self, seconds):
+        with self._lock:
+            totals = self.sql.setdefault(('', BACKGROUND_ROUTE), [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+
+    def observe_checkout(self, bind, seconds):
+        self._histogram(self.checkout_wait, bind, CHECKOUT_BUCKETS).observe(seconds)
+
+    # ------------------------------------------------------------------
+    # Snapshots (one JSON file per worker)
+    # ------------------------------------------------------------------
+    def snapshot(self):
+        with self._lock:
+            requests = [list(key) + [count] for key, count in self.requests.items()]
+            sql = [list(key) + totals for key, totals in self.sql.items()]
+            tables = {'latency': list(self.latency.items()),
+                      'sql_per_request': list(self.sql_per_request.items()),
+                      'checkout_wait': list(self.checkout_wait.items())}
+        snapshot = {'requests': requests, 'sql': sql}
+        for name, items in tables.items():
+            snapshot[name] = []
+            for key, histogram in items:
+                data = histogram.snapshot()
+                labels = list(key) if isinstance(key, tuple) else [key]
+                snapshot[name].append(labels + [data['counts'], data['sum']])
+        return snapshot
+
+    def merge(self, snapshot):
+        """Add another process's ``snapshot()``."""
+        with self._lock:
+            for blueprint, route, method, status, count in snapshot.get('requests', ()):
+                key = (blueprint, route, method, status)
+                self.requests[key] = self.requests.get(key, 0) + count
+            for blueprint, route, statements, seconds in snapshot.get('sql', ()):
+                totals = self.sql.setdefault((blueprint, route), [0, 0.0])
+                totals[0] += statements
+                totals[1] += seconds
+        for blueprint, route, counts, total in snapshot.get('latency', ()):
+            self._histogram(self.latency, (blueprint, route), DEFAULT_BUCKETS).merge(counts, total)
+        for blueprint, route, counts, total in snapshot.get('sql_per_request', ()):
+            self._histogram(self.sql_per_request, (blueprint, route), STATEMENT_BUCKETS).merge(counts, total)
+        for bind, counts, total in snapshot.get('checkout_wait', ()):
+            self._histogram(self.checkout_wait, bind, CHECKOUT_BUCKETS).merge(counts, total)
+
+    # ------------------------------------------------------------------
+    # Prometheus text format
+    # ------------------------------------------------------------------
+    def render(self, workers=1):
+        lines = []
+
+        def header(name, kind, text):
+            lines.append(f'# HELP {PREFIX}_{name} {text}')
+            lines.append(f'# TYPE {PREFIX}_{name} {kind}')
+
+        def histogram(name, table, label_names):
+            for key, item in sorted(table.items()):
+                labels = tuple(zip(label_names, key if isinstance(key, tuple) else (key,)))
+                data = item.snapshot()
+                cumulative = 0
+                for bound, count in zip(data['buckets'] + ['+Inf'], data['counts']):
+                    cumulative += count
+                    lines.append(f"{PREFIX}_{name}_bucket{_labels(labels + (('le', _bound(bound)),))} {cumulative}")
+                lines.append(f"{PREFIX}_{name}_sum{_labels(labels)} {data['sum']}")
+                lines.append(f"{PREFIX}_{name}_count{_labels(labels)} {data['count']}")
+
+        with self._lock:
+            requests = sorted(self.requests.items())
+            sql = sorted(self.sql.items())
+
+        header('http_requests_total', 'counter', 'Requests handled.')
+        for (blueprint, route, method, status), count in requests:
+            labels = (('blueprint', blueprint), ('route', route), ('method', method), ('status', status))
+            lines.append(f'{PREFIX}_http_requests_total{_labels(labels)} {count}')
+
+        header('http_request_duration_seconds', 'histogram', 'Time from the request to the last byte of its response.')
+        histogram('http_request_duration_seconds', self.latency, ('blueprint', 'route'))
+
+        header('db_statements_total', 'counter', 'SQL statements executed.')
+        for (blueprint, route), (statements, _) in sql:
+            lines.append(f"{PREFIX}_db_statements_total{_labels((('blueprint', blueprint), ('route', route)))} {statements}")
+
+        header('db_statement_seconds_total', 'counter', 'Time spent executing SQL statements.')
+        for (blueprint, route), (_, seconds) in sql:
+            lines.append(f"{PREFIX}_db_statement_seconds_total{_labels((('blueprint', blueprint), ('route', route)))} {seconds:.6f}")
+
+        header('db_statements_per_request', 'histogram', 'SQL statements executed by one request.')
+        histogram('db_statements_per_request', self.sql_per_request, ('blueprint', 'route'))
+
+        header('db_pool_checkout_wait_seconds', 'histogram', 'Time to get a connection from the pool.')
+        histogram('db_pool_checkout_wait_seconds', self.checkout_wait, ('bind',))
+
+        header('metrics_workers', 'gauge', 'Worker processes whose counts are included.')
+        lines.append(f'{PREFIX}_metrics_workers {workers}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}' if pairs else ''
+
+
+def _bound(value):
+    return value if isinstance(value, str) else repr(float(value))
+
+
+def get_metrics(app=None):
+    """Return this process's registry."""
+    if app is None:
+        app = current_app._get_current_object()
+    registry = app.extensions.get('metrics')
+    if registry is None:
+        registry = app.extensions.setdefault('metrics', MetricsRegistry())
+    return registry
+
+
+# ----------------------------------------------------------------------
+# Worker snapshots
+# ----------------------------------------------------------------------
+def write_snapshot(registry, directory):
+    """Replace this process's snapshot file (atomically, readers never see half a file)."""
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    temporary = f'{path}.tmp'
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(temporary, 'w') as handle:
+            json.dump(registry.snapshot(), handle, separators=(',', ':'))
+        os.replace(temporary, path)
+    except OSError:
+        logger.warning("Could not write metrics snapshot %s", path, exc_info=True)
+
+
+def collect(registry, directory):
+    """The sum of every worker's snapshot, this one's brought up to date first."""
+    if not directory:
+        return registry, 1
+    write_snapshot(registry, directory)
+    total, workers = MetricsRegistry(), 0
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            with open(path) as handle:
+                total.merge(json.load(handle))
+            workers += 1
+        except (OSError, ValueError):
+            logger.warning("Skipping unreadable metrics snapshot %s", path)
+    return total, workers
+
+
+# ----------------------------------------------------------------------
+# Hooks
+# ----------------------------------------------------------------------
+def _instrument_engine(engine, bind, registry):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _started(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    def _finished(conn):
+        started = conn.info.get('metrics_started')
+        if not started:
+            return
+        seconds = time.perf_counter() - started.pop()
+        sql = _request_sql.get()
+        if sql is not None:
+            sql.add(seconds)
+        else:
+            registry.observe_background_statement(seconds)
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _done(conn, cursor, statement, parameters, context, executemany):
+        _finished(conn)
+
+    @event.listens_for(engine, 'handle_error')
+    def _failed(context):
+        if context.connection is not None:
+            _finished(context.connection)
+
+    # No pool event fires before a checkout starts, so time the engine's way into the pool
+    raw_connection = engine.raw_connection
+
+    def timed_raw_connection():
+        started = time.perf_counter()
+        try:
+            return raw_connection()
+        finally:
+            registry.observe_checkout(bind, time.perf_counter() - started)
+
+    engine.raw_connection = timed_raw_connection
+
+
+def init_metrics(app):
+    """Count requests, SQL and pool waits, and serve them at GET /metrics."""
+    from app import db
+
+    if not app.config.get('METRICS_ENABLED', True):
+        return None
+    registry = get_metrics(app)
+    directory = app.config.get('METRICS_DIR')
+
+    with app.app_context():
+        engines = dict(db.engines)
+    for bind, engine in engines.items():
+        _instrument_engine(engine, bind or 'primary', registry)
+
+    @app.before_request
+    def _start_metrics():
+        g.metrics_started = time.perf_counter()
+        g.metrics_sql = RequestSQL()
+        _request_sql.set(g.metrics_sql)
+
+    @app.after_request
+    def _remember_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _record_metrics(exc=None):
+        # Runs after streamed responses finish, so their duration and SQL are complete
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        sql = g.pop('metrics_sql')
+        _request_sql.set(None)
+        rule = request.url_rule
+        registry.observe_request(
+            request.blueprint or '', rule.rule if rule is not None else UNMATCHED_ROUTE, request.method,
+            g.pop('metrics_status', 500), time.perf_counter() - started, sql,
+        )
+
+    if not app.config.get('METRICS_TOKEN') and app.config.get('METRICS_TOKEN_REQUIRED'):
+        # Public deployments don't expose their routes and traffic to anyone who asks
+        logger.warning("METRICS_TOKEN is not set: GET /metrics is disabled")
+
+    def metrics():
+        token = app.config.get('METRICS_TOKEN')
+        if not token:
+            if app.config.get('METRICS_TOKEN_REQUIRED'):
+                return {'error': 'Not found'}, 404
+        elif not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+            return {'error': 'Unauthorized'}, 401
+        total, workers = collect(registry, directory)
+        return Response(total.render(workers=workers), content_type=CONTENT_TYPE)
+
+    app.add_url_rule('/metrics', 'metrics', metrics, methods=['GET'])
+
+    if directory:
+        interval = app.config.get('METRICS_FLUSH_INTERVAL', 5)
+
+        def run():
+            while True:
+                time.sleep(interval)
+                write_snapshot(registry, directory)
+
+        threading.Thread(target=run, name='metrics-snapshot', daemon=True).start()
+        atexit.register(write_snapshot, registry, directory)
+    return registry
@@ -0,0 +1,197 @@
+# server/app/utils/passwords.py
+"""
+Password hashing in a small process pool.
+
+Werkzeug's KDFs are slow on purpose. In an async worker (gevent, eventlet)
+a hash is one C call that blocks every request the worker is serving, and
+in threaded workers a burst of logins runs as many KDFs at once as there
+are threads, all competing for the same cores. Hashes are computed in
+``PASSWORD_HASH_WORKERS`` child processes instead (0 = in the calling
+thread). At most ``PASSWORD_HASH_MAX_PENDING`` hashes wait for the pool per
+worker process; callers beyond that wait up to ``PASSWORD_HASH_TIMEOUT``
+seconds and then get ``HashingBusy`` (a 503).
+
+``PASSWORD_HASH_METHOD`` and ``PASSWORD_HASH_SALT_LENGTH`` set the KDF and
+its cost in Werkzeug's syntax ("pbkdf2:sha256:600000", "scrypt:32768:8:1").
+Hashes made with other settings still verify, and ``needs_rehash`` tells
+the login to replace them with a current one.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+
+class HashingBusy(RuntimeError):
+    """Too many passwords are being hashed; try again shortly."""
+
+
+def _mp_context():
+    # The children only run Werkzeug's KDF; 'spawn' would re-import the app's
+    # entry module (and build an app) in every one of them
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords with the configured KDF, off the calling thread."""
+
+    def __init__(self, method='pbkdf2', salt_length=16, workers=2, max_pending=None, timeout=10.0):
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = workers
+        self.timeout = timeout
+        self.stats = {'hashed': 0, 'verified': 0, 'busy': 0}
+
+        self._slots = threading.BoundedSemaphore(max_pending or max(workers, 1) * 4)
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self._prefix = None  # "method$" part of a hash made with the current settings
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            method=config.get('PASSWORD_HASH_METHOD', 'pbkdf2'),
+            salt_length=config.get('PASSWORD_HASH_SALT_LENGTH', 16),
+            workers=config.get('PASSWORD_HASH_WORKERS', 2),
+            max_pending=config.get('PASSWORD_HASH_MAX_PENDING') or None,
+            timeout=config.get('PASSWORD_HASH_TIMEOUT', 10.0),
+        )
+
+    # ------------------------------------------------------------------
+    # Pool
+    # ------------------------------------------------------------------
+    def _executor(self):
+        # A pool inherited through fork belongs to the parent process
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_mp_context())
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def _reset_pool(self, broken=None):
+        with self._lock:
+            if broken is not None and self._pool is not broken:
+                return False  # another caller already replaced it
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        return True
+
+    def _start(self, fn, *args):
+        """Take a slot and submit ``fn(*args)``; ``_finish`` waits for it and frees the slot."""
+        if not self._slots.acquire(timeout=self.timeout):
+            self.stats['busy'] += 1
+            raise HashingBusy('Too many password operations in progress')
+        pool = None
+        try:
+            pool = self._executor()
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool as e:
+            future = Future()
+            future.set_exception(e)
+        except BaseException:
+            self._slots.release()
+            raise
+        return pool, future, fn, args
+
+    def _finish(self, task):
+        pool, future, fn, args = task
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            self.stats['busy'] += 1
+            raise HashingBusy('Password hashing timed out')
+        except BrokenProcessPool:
+            # A child died (OOM killer...); start a new pool next time and do this one here
+            if self._reset_pool(pool):
+                logger.warning("Password hashing pool broke, recreating it")
+            return fn(*args)
+        finally:
+            self._slots.release()
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        return self._finish(self._start(fn, *args))
+
+    def close(self):
+        self._reset_pool()
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def hash(self, password):
+        self.stats['hashed'] += 1
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def hash_many(self, passwords):
+        """
+        Hash a batch (bulk provisioning) across all pool workers.
+
+        Each hash holds a slot like ``hash`` does and at most ``workers`` are
+        in flight, so logins still get slots during a large batch; the same
+        timeout and broken-pool fallback apply to every hash.
+        """
+        passwords = list(passwords)
+        self.stats['hashed'] += len(passwords)
+        if not self.workers:
+            return [generate_password_hash(p, self.method, self.salt_length) for p in passwords]
+
+        hashes = []
+        in_flight = deque()
+        try:
+            for password in passwords:
+                if len(in_flight) >= self.workers:
+                    hashes.append(self._finish(in_flight.popleft()))
+                in_flight.append(self._start(generate_password_hash, password, self.method, self.salt_length))
+            while in_flight:
+                hashes.append(self._finish(in_flight.popleft()))
+        finally:
+            # Only left over when a hash failed: drop the rest of the batch
+            for _, future, _, _ in in_flight:
+                future.cancel()
+                self._slots.release()
+        return hashes
+
+    def verify(self, password_hash, password):
+        self.stats['verified'] += 1
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when ``password_hash`` was made with other KDF settings than the current ones."""
+        if self._prefix is None:
+            # Werkzeug fills in defaults ("pbkdf2" -> "pbkdf2:sha256:600000"); hash once to learn them
+            self._prefix = generate_password_hash('', self.method, 1).split('$', 1)[0]
+        method, _, rest = password_hash.partition('$')
+        salt = rest.split('$', 1)[0]
+        return method != self._prefix or len(salt) != self.salt_length
+
+    def describe(self):
+        return {'method': self.method, 'workers': self.workers, 'stats': dict(self.stats)}
+
+
+_hasher_lock = threading.Lock()
+
+
+def get_password_hasher(app=None):
+    """Return the app's password hasher, creating it on first use."""
+    if app is None:
+        from flask import current_app
+        app = current_app._get_current_object()
+    hasher = app.extensions.get('password_hasher')
+    if hasher is None:
+        with _hasher_lock:
+            hasher = app.extensions.get('password_hasher')
+            if hasher is None:
+                hasher = app.extensions['password_hasher'] = PasswordHasher.from_config(app.config)
+    return hasher
@@ -0,0 +1,189 @@
+# server/app/utils/singleflight.py
+"""
+Single-flight: concurrent identical calls share one execution.
+
+The first caller for a key (the leader) runs the function. Callers that
+arrive with the same key while it runs wait for it and get the same result
+(or the same exception) instead of making their own upstream call.
+
+Across gunicorn workers on one host, set ``SINGLEFLIGHT_LOCK_DIR`` to a
+directory they share. Each worker's leader then takes a file lock for the
+key, and the worker that got there first leaves its result in the directory
+for ``SINGLEFLIGHT_RESULT_TTL`` seconds. The other workers pick it up as
+soon as the lock is released, without calling upstream again.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: in-process coalescing only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOCK_POLL_INTERVAL = 0.05
+PRUNE_EVERY = 256  # leader runs between clean-ups of the lock directory
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key."""
+
+    def __init__(self, name, lock_dir=None, result_ttl=10.0, lock_timeout=30.0):
+        self.name = name
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.result_ttl = result_ttl
+        self.lock_timeout = lock_timeout
+        self.stats = {'calls': 0, 'leaders': 0, 'coalesced': 0, 'coalesced_remote': 0}
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def do(self, key, fn):
+        """
+        Run ``fn()`` once for all concurrent callers with ``key``.
+
+        Returns (result, shared): ``shared`` is True when the result came
+        from another caller's execution.
+        """
+        with self._lock:
+            self.stats['calls'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            self._count('coalesced')
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result, shared = self._lead(key, fn)
+            return call.result, shared
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    # ------------------------------------------------------------------
+    # Cross-worker
+    # ------------------------------------------------------------------
+    def _lead(self, key, fn):
+        if not self.lock_dir:
+            self._count('leaders')
+            return fn(), False
+
+        digest = hashlib.sha256(f'{self.name}:{key}'.encode()).hexdigest()
+        base = os.path.join(self.lock_dir, f'{self.name}-{digest[:32]}')
+        os.makedirs(self.lock_dir, exist_ok=True)
+
+        with open(base + '.lock', 'a') as handle:
+            locked = self._acquire(handle)
+            try:
+                found, result = self._read_result(base + '.json')
+                if found:
+                    self._count('coalesced_remote')
+                    return result, True
+                self._count('leaders')
+                result = fn()
+                self._write_result(base + '.json', result)
+                return result, False
+            finally:
+                if locked:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+                if self.stats['leaders'] and self.stats['leaders'] % PRUNE_EVERY == 0:
+                    self._prune()
+
+    def _prune(self):
+        """Delete this group's lock and result files nobody has used for a while."""
+        cutoff = time.time() - 10 * max(self.result_ttl, self.lock_timeout)
+        try:
+            for name in os.listdir(self.lock_dir):
+                path = os.path.join(self.lock_dir, name)
+                # Losing a lock file in a race only costs one duplicate upstream call
+                if name.startswith(self.name + '-') and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+        except OSError:
+            pass
+
+    def _acquire(self, handle):
+        """Wait for the key's file lock; give up (and run anyway) after lock_timeout."""
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except OSError:
+                if time.monotonic() >= deadline:
+                    logger.warning("Single-flight lock for %s timed out, calling upstream anyway", self.name)
+                    return False
+                time.sleep(LOCK_POLL_INTERVAL)
+
+    def _read_result(self, path):
+        try:
+            if time.time() - os.path.getmtime(path) > self.result_ttl:
+                return False, None
+            with open(path) as fh:
+                return True, json.load(fh)
+        except (OSError, ValueError):
+            return False, None
+
+    def _write_result(self, path, result):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w') as fh:
+                json.dump(result, fh)
+            os.replace(tmp_path, path)
+        except (TypeError, ValueError, OSError):
+            # Not JSON-serializable or not writable: other workers just call upstream
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def describe(self):
+        with self._lock:
+            return {'in_flight': len(self._calls), 'cross_worker': bool(self.lock_dir), 'stats': dict(self.stats)}
+
+
+_flights_lock = threading.Lock()
+
+
+def get_flight(name, app=None):
+    """Return the app's single-flight group called ``name``, creating it on first use."""
+    if app is None:
+        from flask import current_app
+        app = current_app._get_current_object()
+    flights = app.extensions.setdefault('singleflight', {})
+    flight = flights.get(name)
+    if flight is None:
+        with _flights_lock:
+            flight = flights.get(name)
+            if flight is None:
+                flight = flights[name] = SingleFlight(
+                    name,
+                    lock_dir=app.config.get('SINGLEFLIGHT_LOCK_DIR'),
+                    result_ttl=app.config.get('SINGLEFLIGHT_RESULT_TTL', 10),
+                    lock_timeout=app.config.get('SINGLEFLIGHT_LOCK_TIMEOUT', 30),
+                )
+    return flight
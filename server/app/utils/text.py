@@ -0,0 +1,63 @@
+# server/app/utils/text.py
+"""
+Text normalization shared by the chat cache and the product search index.
+
+Lowercases, keeps hyphenated words whole, drops stopwords and shopping
+intent words ("best", "top", "recommend"...), folds eco synonyms
+("eco-friendly", "sustainable", "green") into "eco" and lemmatizes plurals.
+
+The chat cache keeps price and ranking constraints ("cheap", "under",
+"best"...): they say nothing about which product is wanted, but "cheapest
+water bottle" needs a different answer than "water bottle".
+"""
+import re
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+(?:-[a-z0-9]+)*')
+
+STOPWORDS = frozenset("""
+a about an and any are as at be can could do does for from get give have how i in is it its
+me my need of on or please should some tell that the their them there these this to under
+was what where which who why will with would you your
+best top recommend recommends recommended recommendation recommendations suggest suggestion
+suggestions good great nice cheap cheapest affordable buy find looking want product products
+option options alternative alternatives item items 2024 2025
+""".split())
+
+CONSTRAINT_WORDS = frozenset({'under', 'best', 'top', 'cheap', 'cheapest', 'affordable'})
+CACHE_STOPWORDS = STOPWORDS - CONSTRAINT_WORDS
+
+ECO_SYNONYMS = frozenset({
+    'eco', 'eco-friendly', 'ecofriendly', 'sustainable', 'sustainably', 'green',
+    'environmentally-friendly', 'earth-friendly', 'planet-friendly',
+})
+
+IRREGULAR_LEMMAS = {
+    'children': 'child', 'men': 'man', 'women': 'woman', 'feet': 'foot', 'teeth': 'tooth',
+    'knives': 'knife', 'leaves': 'leaf', 'shelves': 'shelf', 'lives': 'life', 'mice': 'mouse',
+}
+
+
+def lemmatize(word):
+    """Cheap English plural -> singular, enough to fold query variants together."""
+    if word in IRREGULAR_LEMMAS:
+        return IRREGULAR_LEMMAS[word]
+    if len(word) <= 3 or word.endswith(('ss', 'us', 'is')):
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith(('ches', 'shes', 'sses', 'xes', 'zes')):
+        return word[:-2]
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+
+def tokenize(text, stopwords=STOPWORDS):
+    """Normalized terms of ``text``, in order and with repeats."""
+    terms = []
+    for word in TOKEN_PATTERN.findall((text or '').lower()):
+        if word in ECO_SYNONYMS:
+            terms.append('eco')
+        elif word not in stopwords:
+            terms.append(lemmatize(word))
+    return terms
@@ -0,0 +1,138 @@
+# server/bench_ai.py
+"""
+Offline load test for the waste-scanner and marketplace chat paths.
+
+AI calls are replayed from recorded fixtures (``fixtures/ai``) with their
+recorded latency, so this needs no API key or network and gives the same
+timings on every run. Uses a throwaway SQLite database and upload folder.
+
+    python bench_ai.py --path both --requests 200 --concurrency 16
+    python bench_ai.py --path scan --latency-scale 0 --error-rate 0.1 --seed 1
+
+Record new fixtures by running the server (or test_ai.py) against the real
+API with ``AI_RECORD_MODE=record``.
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+CHAT_MESSAGES = [
+    'recommend sustainable water bottles',
+    'best eco-friendly shopping bags',
+    'top organic cleaning products',
+    'where can i buy solar lamps in nairobi',
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--path', choices=('scan', 'chat', 'both'), default='both')
+    parser.add_argument('--requests', type=int, default=100, help='Requests per path')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency-scale', type=float, default=1.0, help='0 replays instantly')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of AI calls that fail (0..1)')
+    parser.add_argument('--error-status', default='500', help="Status of injected errors, or 'timeout'")
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--fixtures', default=None, help='Fixtures directory (default: fixtures/ai)')
+    return parser.parse_args()
+
+
+def configure_environment(args, workdir):
+    """Must run before the app is imported: settings are read at import time."""
+    os.environ.update({
+        'AI_RECORD_MODE': 'replay',
+        'AI_REPLAY_MATCH': 'loose',
+        'AI_REPLAY_LATENCY_SCALE': str(args.latency_scale),
+        'AI_REPLAY_ERROR_RATE': str(args.error_rate),
+        'AI_REPLAY_ERROR_STATUS': args.error_status,
+        'AI_REPLAY_SEED': str(args.seed),
+        'OPENAI_API_KEY': os.environ.get('OPENAI_API_KEY') or 'replay',
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'VISION_BACKENDS': 'openai:gpt-4o',
+        'SCAN_RETRY_INTERVAL': '0',
+        'UPLOAD_SWEEP_INTERVAL': '0',
+        'RATE_LIMIT_ENABLED': 'false',  # every request comes from one client
+    })
+    if args.fixtures:
+        os.environ['AI_FIXTURES_DIR'] = os.path.abspath(args.fixtures)
+
+
+def fake_image(index):
+    """A unique PNG-signed payload: the scanner sniffs the header, replay ignores the pixels."""
+    return b'\x89PNG\r\n\x1a\n' + index.to_bytes(8, 'big') + os.urandom(2048)
+
+
+def run_path(app, name, count, concurrency):
+    from app.utils.latency import LatencyHistogram
+
+    histogram = LatencyHistogram()
+    statuses = Counter()
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(index):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        started = time.monotonic()
+        if name == 'scan':
+            response = client.post(
+                '/api/waste-scanner/upload',
+                data={'image': (io.BytesIO(fake_image(index)), f'bench-{index}.png')},
+                content_type='multipart/form-data',
+            )
+        else:
+            response = client.post('/api/chat', json={'message': CHAT_MESSAGES[index % len(CHAT_MESSAGES)]})
+        histogram.observe(time.monotonic() - started)
+        with lock:
+            statuses[response.status_code] += 1
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(count)))
+    elapsed = time.monotonic() - started
+
+    summary = histogram.summary()
+    print(f"\n[{name}] {count} requests, concurrency {concurrency}, {elapsed:.2f}s, {count / elapsed:.1f} req/s")
+    print(f"  latency p50 {summary['p50'] * 1000:.0f} ms  p95 {summary['p95'] * 1000:.0f} ms  "
+          f"p99 {summary['p99'] * 1000:.0f} ms")
+    print(f"  status codes: {dict(sorted(statuses.items()))}")
+    return statuses
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='greennexus-bench-')
+    configure_environment(args, workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    from app import create_app, db
+    from app.services.ai_gateway import get_gateway
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+
+    paths = ('scan', 'chat') if args.path == 'both' else (args.path,)
+    unexpected = 0
+    for name in paths:
+        statuses = run_path(app, name, args.requests, args.concurrency)
+        # 202 = scan queued for retry, 503 = gateway shed load; both are handled outcomes
+        unexpected += sum(n for status, n in statuses.items() if status not in (200, 202, 503))
+
+    print(f"\nreplay: {get_gateway().recorder.describe()['stats']}")
+    if unexpected and not args.error_rate:
+        print(f"{unexpected} requests failed unexpectedly")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
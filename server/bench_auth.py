@@ -0,0 +1,128 @@
+# server/bench_auth.py
+"""
+Login throughput at different password hashing settings.
+
+Runs ``login_user`` from concurrent threads, the way a threaded worker
+serves logins, for every combination of hashing method and pool size, on a
+throwaway SQLite database, and reports logins/s and latency percentiles.
+
+    python bench_auth.py
+    python bench_auth.py --methods pbkdf2:sha256:600000,scrypt:32768:8:1 --workers 0,2,4 --concurrency 8
+    python bench_auth.py --stored-method pbkdf2:sha256:260000   # first logins after raising the cost (rehash)
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+PASSWORD = 'bench-password-1'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--methods', default='pbkdf2:sha256:600000,pbkdf2:sha256:260000,scrypt:32768:8:1',
+                        help='Comma-separated werkzeug hash methods')
+    parser.add_argument('--workers', default='0,1,2', help='Comma-separated hashing pool sizes (0 = inline)')
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--logins', type=int, default=48, help='Logins per setting')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--stored-method', default=None,
+                        help='Method the users were stored with (default: the one benchmarked)')
+    return parser.parse_args()
+
+
+def configure_environment(workdir):
+    """Must run before the app is imported: settings are read at import time."""
+    os.environ.update({
+        'OPENAI_API_KEY': os.environ.get('OPENAI_API_KEY') or 'unused',
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'SCAN_RETRY_INTERVAL': '0',
+        'UPLOAD_SWEEP_INTERVAL': '0',
+        'LOG_LEVEL': 'WARNING',
+    })
+
+
+def create_users(app, hasher, count):
+    from app import db
+    from app.models.user import User
+    from app.services.auth_service import provision_users
+
+    with app.app_context():
+        User.query.delete()
+        db.session.commit()
+        app.extensions['password_hasher'] = hasher
+        records = [{'name': f'Bench {i}', 'email': f'bench{i}@example.com', 'password': PASSWORD}
+                   for i in range(count)]
+        return [user['email'] for user in provision_users(records)]
+
+
+def run_setting(app, emails, method, workers, args):
+    from app.services.auth_service import login_user
+    from app.utils.latency import LatencyHistogram
+    from app.utils.passwords import PasswordHasher
+
+    stored = PasswordHasher(args.stored_method or method, workers=workers)
+    create_users(app, stored, len(emails))
+    hasher = app.extensions['password_hasher'] = PasswordHasher(method, workers=workers)
+
+    histogram = LatencyHistogram()
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def one(index):
+        started = time.monotonic()
+        with app.app_context():
+            _, status = login_user(emails[index % len(emails)], PASSWORD)
+        histogram.observe(time.monotonic() - started)
+        with lock:
+            statuses[status] += 1
+
+    hasher.verify(stored.hash(PASSWORD), PASSWORD)  # start the pool outside the timing
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(one, range(args.logins)))
+    elapsed = time.monotonic() - started
+
+    summary = histogram.summary()
+    print(f"{method:<24} {workers:>7} {args.logins / elapsed:>9.1f} {summary['p50'] * 1000:>8.0f} "
+          f"{summary['p95'] * 1000:>8.0f} {summary['p99'] * 1000:>8.0f}  "
+          f"{dict(sorted(statuses.items()))} rehashed={hasher.stats['hashed']}")
+    stored.close()
+    hasher.close()
+    return statuses
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='greennexus-bench-')
+    configure_environment(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    from app import create_app, db
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+
+    emails = [f'bench{i}@example.com' for i in range(args.users)]
+    print(f"{args.logins} logins per setting, concurrency {args.concurrency}, {os.cpu_count()} CPUs")
+    print(f"{'method':<24} {'workers':>7} {'logins/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  statuses")
+    failed = 0
+    for method in args.methods.split(','):
+        for workers in (int(w) for w in args.workers.split(',')):
+            statuses = run_setting(app, emails, method.strip(), workers, args)
+            failed += sum(n for status, n in statuses.items() if status != 200)
+
+    if failed:
+        print(f"{failed} logins failed")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+# server/bench_serving.py
+"""
+Concurrent chat requests served by ONE gunicorn worker, per worker class.
+
+Starts ``gunicorn -c gunicorn.conf.py run:app`` with a single worker of
+each ``--worker-classes`` entry, keeps ``--concurrency`` clients posting
+distinct questions to /api/chat for ``--duration`` seconds, and reports
+throughput and latency. Model calls are replayed from the recorded fixtures
+(``fixtures/ai``) with their recorded latency scaled by
+``--latency-scale``, so no API key or network is needed; the chat cache
+and the catalog shortcut are off so every request waits on the "model".
+
+A sync worker answers one request per model latency, a gthread worker one
+per thread, and a gevent worker as many as are outstanding.
+
+    python bench_serving.py
+    python bench_serving.py --worker-classes sync,gevent --concurrency 100 --stream
+"""
+import argparse
+import http.client
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHAT_MESSAGES = [
+    'recommend sustainable water bottles',
+    'best eco-friendly shopping bags',
+    'top organic cleaning products',
+    'where can i buy solar lamps in nairobi',
+]
+
+INIT_DB = "from app import create_app, db\napp = create_app()\nwith app.app_context(): db.create_all()"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--worker-classes', default='sync,gthread,gevent')
+    parser.add_argument('--concurrency', type=int, default=32, help='Clients with a request in flight')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds each worker class is loaded')
+    parser.add_argument('--threads', type=int, default=8, help='Threads of the gthread worker')
+    parser.add_argument('--connections', type=int, default=100, help='Connections of the gevent worker')
+    parser.add_argument('--latency-scale', type=float, default=0.2, help='Share of the recorded model latency')
+    parser.add_argument('--stream', action='store_true', help='Use /api/chat/stream (SSE) instead of /api/chat')
+    parser.add_argument('--fixtures', default=None, help='Fixtures directory (default: fixtures/ai)')
+    return parser.parse_args()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_environment(args, workdir):
+    env = dict(os.environ)
+    env.update({
+        'AI_RECORD_MODE': 'replay',
+        'AI_REPLAY_MATCH': 'loose',
+        'AI_REPLAY_LATENCY_SCALE': str(args.latency_scale),
+        'OPENAI_API_KEY': env.get('OPENAI_API_KEY') or 'replay',
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'CHAT_CACHE_ENABLED': 'false',
+        'MARKETPLACE_CATALOG_ENABLED': 'false',
+        'RATE_LIMIT_ENABLED': 'false',  # every request comes from one client
+        'SCAN_RETRY_INTERVAL': '0',
+        'UPLOAD_SWEEP_INTERVAL': '0',
+        'LOG_LEVEL': 'WARNING',
+        'WEB_CONCURRENCY': '1',
+        'GUNICORN_THREADS': str(args.threads),
+        'GUNICORN_WORKER_CONNECTIONS': str(args.connections),
+    })
+    if args.fixtures:
+        env['AI_FIXTURES_DIR'] = os.path.abspath(args.fixtures)
+    return env
+
+
+def wait_until_ready(port, process, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/api/chat/health')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('gunicorn did not become ready')
+
+
+def load(port, args):
+    """Closed-loop clients for ``args.duration`` seconds; returns (histogram, statuses, elapsed)."""
+    from app.utils.latency import LatencyHistogram
+
+    histogram = LatencyHistogram()
+    statuses = Counter()
+    lock = threading.Lock()
+    counter = iter(range(10 ** 9))
+    path = '/api/chat/stream' if args.stream else '/api/chat'
+    stop_at = time.monotonic() + args.duration
+
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        while time.monotonic() < stop_at:
+            with lock:
+                index = next(counter)
+            # A distinct question per request: no single-flight coalescing
+            body = json.dumps({'message': f'{CHAT_MESSAGES[index % len(CHAT_MESSAGES)]} {index}'})
+            started = time.monotonic()
+            try:
+                connection.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+                status = 'error'
+            elapsed = time.monotonic() - started
+            with lock:
+                statuses[status] += 1
+                if status == 200:
+                    histogram.observe(elapsed)
+        connection.close()
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for _ in range(args.concurrency):
+            executor.submit(client)
+    return histogram, statuses, time.monotonic() - started
+
+
+def run_worker_class(worker_class, args, env):
+    port = free_port()
+    env = dict(env, PORT=str(port), GUNICORN_WORKER_CLASS=worker_class)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}', 'run:app'],
+        cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    try:
+        wait_until_ready(port, process)
+        return load(port, args)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            _, stderr = process.communicate(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            _, stderr = process.communicate()
+        errors = [line for line in stderr.splitlines() if 'Traceback' in line or 'ERROR' in line]
+        if errors:
+            print(f"  [{worker_class}] server logged {len(errors)} errors, e.g. {errors[0]}")
+
+
+def main():
+    args = parse_args()
+    sys.path.insert(0, SERVER_DIR)
+    workdir = tempfile.mkdtemp(prefix='greennexus-serving-')
+    env = server_environment(args, workdir)
+    subprocess.run([sys.executable, '-c', INIT_DB], cwd=SERVER_DIR, env=env, check=True)
+
+    print(f"1 worker, {args.concurrency} concurrent clients, {args.duration:.0f}s each, "
+          f"{'/api/chat/stream' if args.stream else '/api/chat'}, model latency x{args.latency_scale}")
+    print(f"{'worker':<10}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses")
+    failed = False
+    for worker_class in args.worker_classes.split(','):
+        histogram, statuses, elapsed = run_worker_class(worker_class, args, env)
+        summary = histogram.summary()
+        percentiles = ''.join(f"{summary[p] * 1000:>9.0f}" if summary[p] is not None else f"{'-':>9}"
+                              for p in ('p50', 'p95', 'p99'))
+        print(f"{worker_class:<10}{statuses.get(200, 0) / elapsed:>8.1f}{percentiles}  {dict(statuses)}")
+        failed = failed or any(status != 200 for status in statuses)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
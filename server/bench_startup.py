@@ -0,0 +1,115 @@
+# server/bench_startup.py
+"""
+Cold-start time of the app factory, checked against a budget.
+
+Each run starts a fresh interpreter that imports the app and calls
+``create_app()``, the way a new gunicorn worker or a ``flask`` CLI command
+does. One more run under ``python -X importtime`` shows where the time goes.
+Exits with 1 when the median run exceeds ``--budget-ms``, or when one of
+the ``--forbid`` modules (heavy libraries that must load on first use only)
+was imported at startup.
+
+    python bench_startup.py
+    python bench_startup.py --runs 10 --budget-ms 500 --top 25
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app()
+done = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'create_ms': (done - imported) * 1000,
+                  'modules': sorted(sys.modules)}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('STARTUP_BUDGET_MS', 750)),
+                        help='Median import + create_app() time allowed (default: $STARTUP_BUDGET_MS or 750)')
+    parser.add_argument('--forbid', default='openai,httpx,pydantic,alembic,flask_migrate,PIL,boto3',
+                        help='Comma-separated modules that must not be imported at startup')
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports to list')
+    return parser.parse_args()
+
+
+def child_environment(workdir):
+    env = dict(os.environ)
+    env.update({
+        'OPENAI_API_KEY': env.get('OPENAI_API_KEY') or 'unused',
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'LOG_LEVEL': 'WARNING',
+    })
+    env.pop('PYTHONDONTWRITEBYTECODE', None)  # timed runs should load cached bytecode
+    env.pop('FLASK_RUN_FROM_CLI', None)  # measure the server's startup, not the CLI's
+    return env
+
+
+def run_child(env, importtime=False):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', CHILD]
+    completed = subprocess.run(command, cwd=SERVER_DIR, env=env, capture_output=True, text=True, timeout=120)
+    if completed.returncode != 0:
+        raise RuntimeError(f"create_app() failed:\n{completed.stderr[-2000:]}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return result, completed.stderr
+
+
+def parse_importtime(stderr, max_depth=1):
+    """Imports nested at most ``max_depth`` deep as (cumulative ms, module), slowest first."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2  # two spaces per nesting level
+        if depth <= max_depth:
+            imports.append((int(cumulative) / 1000, name.strip()))
+    return sorted(imports, reverse=True)
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='greennexus-startup-')
+    env = child_environment(workdir)
+
+    run_child(env)  # compile bytecode and create the database file outside the timing
+    runs = [run_child(env)[0] for _ in range(args.runs)]
+    profiled, stderr = run_child(env, importtime=True)
+
+    totals = [run['import_ms'] + run['create_ms'] for run in runs]
+    median = statistics.median(totals)
+    print(f"{args.runs} cold starts: median {median:.0f} ms (import {statistics.median(r['import_ms'] for r in runs):.0f} ms"
+          f" + create_app {statistics.median(r['create_ms'] for r in runs):.0f} ms), "
+          f"min {min(totals):.0f} ms, max {max(totals):.0f} ms, budget {args.budget_ms:.0f} ms")
+
+    print("\nslowest imports (-X importtime, cumulative, app and its direct imports):")
+    for cumulative, name in parse_importtime(stderr)[:args.top]:
+        print(f"  {cumulative:8.1f} ms  {name}")
+
+    failed = False
+    loaded = set(profiled['modules'])
+    forbidden = sorted(name for name in args.forbid.split(',') if name and name in loaded)
+    if forbidden:
+        print(f"\nimported at startup but should load on first use: {', '.join(forbidden)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"\nstartup {median:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,5 @@
 # server/config.py
+import logging
 import os
 from dotenv import load_dotenv
 
@@ -24,11 +25,226 @@ class Config:
             )
         # Local development fallback
         database_url = 'sqlite:///instance/greennexus.db'
-        print("⚠️  WARNING: Using SQLite for local development")
+        logging.getLogger(__name__).warning("Using SQLite for local development")
 
     SQLALCHEMY_DATABASE_URI = database_url
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # === READ REPLICA (optional; GET requests read from it, see app.utils.database) ===
+    replica_url = os.environ.get('DATABASE_REPLICA_URL')
+    if replica_url and replica_url.startswith('postgres://'):
+        replica_url = replica_url.replace('postgres://', 'postgresql://', 1)
+    DATABASE_REPLICA_URL = replica_url or None
+    REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))  # further behind: read from the primary
+    REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('REPLICA_LAG_CHECK_INTERVAL', 5))  # seconds between lag checks, per worker
+    REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', 10))  # a client that wrote reads from the primary this long
+    SQLALCHEMY_BINDS = {}
+
     # === UPLOAD FOLDER ===
-    UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+    # === UPLOAD LIMITS & STORAGE ===
+    # Per-image limit, enforced while streaming the file to storage
+    MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 10 * 1024 * 1024))
+    # Whole-request limit, enforced by Werkzeug before the body is parsed
+    MAX_CONTENT_LENGTH = MAX_UPLOAD_BYTES + 64 * 1024
+    UPLOAD_STORAGE_BACKEND = os.environ.get('UPLOAD_STORAGE_BACKEND', 'local')  # 'local' or 's3'
+    UPLOAD_S3_BUCKET = os.environ.get('UPLOAD_S3_BUCKET')
+    UPLOAD_S3_PREFIX = os.environ.get('UPLOAD_S3_PREFIX', '')
+    UPLOAD_S3_ENDPOINT_URL = os.environ.get('UPLOAD_S3_ENDPOINT_URL')  # MinIO, R2, ...
+    UPLOAD_S3_REGION = os.environ.get('UPLOAD_S3_REGION')
+
+    # === UPLOAD SWEEPER (flask sweep-uploads) ===
+    UPLOAD_SWEEP_INTERVAL = int(os.environ.get('UPLOAD_SWEEP_INTERVAL', 0))  # seconds between background batches, 0 = off
+    UPLOAD_SWEEP_BATCH_SIZE = int(os.environ.get('UPLOAD_SWEEP_BATCH_SIZE', 200))
+    UPLOAD_ORPHAN_GRACE_SECONDS = int(os.environ.get('UPLOAD_ORPHAN_GRACE_SECONDS', 3600))
+    UPLOAD_RETENTION_DAYS = int(os.environ.get('UPLOAD_RETENTION_DAYS', 0))  # days since the image's last scan; 0 = keep forever
+    UPLOAD_THUMBNAIL_AFTER_DAYS = int(os.environ.get('UPLOAD_THUMBNAIL_AFTER_DAYS', 0))  # 0 = keep originals
+
+    # === FAILED SCAN RETRIES (flask retry-failed-scans) ===
+    SCAN_RETRY_INTERVAL = int(os.environ.get('SCAN_RETRY_INTERVAL', 0))  # seconds between background runs, 0 = off (use cron)
+    SCAN_RETRY_BATCH_SIZE = int(os.environ.get('SCAN_RETRY_BATCH_SIZE', 5))  # small, so a recovering provider isn't flooded
+    SCAN_RETRY_MAX_ATTEMPTS = int(os.environ.get('SCAN_RETRY_MAX_ATTEMPTS', 5))  # then the scan is dead-lettered
+    SCAN_RETRY_BACKOFF_BASE = int(os.environ.get('SCAN_RETRY_BACKOFF_BASE', 60))
+    SCAN_RETRY_BACKOFF_MAX = int(os.environ.get('SCAN_RETRY_BACKOFF_MAX', 6 * 60 * 60))
+
+    # === ADMIN API ===
+    ADMIN_API_TOKEN = os.environ.get('ADMIN_API_TOKEN')  # unset = admin endpoints disabled
+    # Users per POST /api/admin/users/bulk: each costs one password hash, and the request must finish
+    # within GUNICORN_TIMEOUT. Larger organisations: flask provision-users <file>
+    ADMIN_PROVISION_MAX_BATCH = int(os.environ.get('ADMIN_PROVISION_MAX_BATCH', 100))
+
+    # === MARKETPLACE CHAT CACHE ===
+    CHAT_CACHE_ENABLED = os.environ.get('CHAT_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    CHAT_CACHE_TTL = int(os.environ.get('CHAT_CACHE_TTL', 24 * 60 * 60))  # seconds
+    CHAT_CACHE_MAX_ENTRIES = int(os.environ.get('CHAT_CACHE_MAX_ENTRIES', 1000))  # LRU beyond this
+    CHAT_CACHE_SIMILARITY = float(os.environ.get('CHAT_CACHE_SIMILARITY', 0.8))  # Jaccard threshold for near-duplicates
+    CHAT_CACHE_BACKEND = os.environ.get('CHAT_CACHE_BACKEND', 'memory')  # 'memory' or 'database' (survives restarts)
+
+    # === MARKETPLACE CATALOG (answers /api/chat before the model is called) ===
+    MARKETPLACE_CATALOG_ENABLED = os.environ.get('MARKETPLACE_CATALOG_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    MARKETPLACE_CATALOG_RESULTS = int(os.environ.get('MARKETPLACE_CATALOG_RESULTS', 3))
+    MARKETPLACE_CATALOG_MIN_COVERAGE = float(os.environ.get('MARKETPLACE_CATALOG_MIN_COVERAGE', 0.6))  # share of query terms the best match must contain
+    MARKETPLACE_CATALOG_MIN_SCORE = float(os.environ.get('MARKETPLACE_CATALOG_MIN_SCORE', 1.0))  # BM25
+    MARKETPLACE_INDEX_REFRESH = int(os.environ.get('MARKETPLACE_INDEX_REFRESH', 60))  # seconds between checks for other workers' changes
+
+    # === SINGLE-FLIGHT (identical concurrent AI calls share one upstream request) ===
+    SINGLEFLIGHT_LOCK_DIR = os.environ.get('SINGLEFLIGHT_LOCK_DIR')  # shared dir to coalesce across workers; unset = per process
+    SINGLEFLIGHT_RESULT_TTL = float(os.environ.get('SINGLEFLIGHT_RESULT_TTL', 10))  # seconds a result stays readable by other workers
+    SINGLEFLIGHT_LOCK_TIMEOUT = float(os.environ.get('SINGLEFLIGHT_LOCK_TIMEOUT', 30))
+
+    # === AI RATE LIMITS & DAILY BUDGETS (/api/chat, /api/waste-scanner/upload) ===
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    CHAT_RATE_PER_MINUTE = int(os.environ.get('CHAT_RATE_PER_MINUTE', 20))  # per client, 0 = unlimited
+    CHAT_RATE_BURST = int(os.environ.get('CHAT_RATE_BURST', 10))
+    UPLOAD_RATE_PER_MINUTE = int(os.environ.get('UPLOAD_RATE_PER_MINUTE', 6))
+    UPLOAD_RATE_BURST = int(os.environ.get('UPLOAD_RATE_BURST', 3))
+    AI_DAILY_TOKEN_BUDGET = int(os.environ.get('AI_DAILY_TOKEN_BUDGET', 100000))  # per client, 0 = unlimited
+    AI_DAILY_COST_BUDGET = float(os.environ.get('AI_DAILY_COST_BUDGET', 0.25))  # USD per client, 0 = unlimited
+    RATE_LIMIT_SYNC_INTERVAL = int(os.environ.get('RATE_LIMIT_SYNC_INTERVAL', 5))  # seconds between syncs with other workers, 0 = per process
+    # Proxies in front of the app that append to X-Forwarded-For (Render: 1). The client address
+    # is the entry that many hops from the right; entries further left are client-supplied
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', 1 if os.environ.get('RENDER') or os.environ.get('RATE_LIMIT_TRUST_PROXY', '').lower() in ('1', 'true', 'yes') else 0))
+
+    # === AI USAGE ACCOUNTING (GET /api/admin/ai-usage, flask rollup-ai-usage) ===
+    AI_USAGE_ENABLED = os.environ.get('AI_USAGE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    AI_USAGE_FLUSH_INTERVAL = int(os.environ.get('AI_USAGE_FLUSH_INTERVAL', 5))  # seconds between bulk inserts of buffered events
+    AI_USAGE_BUFFER_MAX = int(os.environ.get('AI_USAGE_BUFFER_MAX', 10000))  # events kept in memory while the database is unreachable
+    AI_USAGE_ROLLUP_INTERVAL = int(os.environ.get('AI_USAGE_ROLLUP_INTERVAL', 3600))  # seconds between daily rollups, 0 = CLI only
+
+    # === LOGGING (structured, written by a background thread) ===
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_LEVELS = os.environ.get('LOG_LEVELS', 'httpx=WARNING')  # per logger, e.g. "app.routes.marketplace=DEBUG,werkzeug=WARNING"
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json' if os.environ.get('RENDER') else 'text')  # 'json' or 'text'
+    LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 1.0))  # share of requests whose DEBUG lines are kept
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))  # pending records before new ones are dropped
+
+    # === PASSWORD HASHING (login rehashes hashes made with older settings) ===
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')  # werkzeug syntax, e.g. "scrypt:32768:8:1"
+    PASSWORD_HASH_SALT_LENGTH = int(os.environ.get('PASSWORD_HASH_SALT_LENGTH', 16))
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', min(os.cpu_count() or 1, 2)))  # hashing processes per worker, 0 = inline
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 0))  # queued hashes per worker, 0 = 4 per hashing process
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))  # seconds to wait for a slot or a result before a 503
+
+    # === AUTHENTICATION (JWT identity of /api/activities and scan uploads) ===
+    AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED', 'true' if os.environ.get('RENDER') else 'false').lower() in ('1', 'true', 'yes')  # off (local development only): requests without a token act for the user_id they name
+    AUTH_IDENTITY_CACHE_TTL = int(os.environ.get('AUTH_IDENTITY_CACHE_TTL', 60))  # seconds a resolved user is reused, 0 = query every request
+    AUTH_IDENTITY_CACHE_SIZE = int(os.environ.get('AUTH_IDENTITY_CACHE_SIZE', 1024))  # users cached per worker process
+
+    # === DASHBOARD (GET /api/dashboard/<user_id>) ===
+    DASHBOARD_PARALLEL_QUERIES = os.environ.get('DASHBOARD_PARALLEL_QUERIES', 'auto')  # run section queries concurrently; auto = unless SQLite
+    DASHBOARD_QUERY_THREADS = int(os.environ.get('DASHBOARD_QUERY_THREADS', 4))  # per worker; each holds a pooled connection while querying
+
+    # === METRICS (GET /metrics, Prometheus text format) ===
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # when set, scrapes must send "Authorization: Bearer <token>"
+    METRICS_TOKEN_REQUIRED = os.environ.get('METRICS_TOKEN_REQUIRED', 'true' if os.environ.get('RENDER') else 'false').lower() in ('1', 'true', 'yes')  # without a METRICS_TOKEN, /metrics is off
+    METRICS_DIR = os.environ.get('METRICS_DIR')  # shared dir where workers leave their counts (gunicorn.conf.py sets one); unset = per process
+    METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 5))  # seconds between writes of a worker's counts
+
+    # === DATABASE ENGINE PROFILE (subclasses below, chosen by FLASK_CONFIG) ===
+    DB_PROFILE = None  # SQLAlchemy's defaults
+    DB_ENGINE_PROFILE = None
+
+
+# Engine settings per FLASK_CONFIG. Every value can be overridden with the
+# environment variable next to it in ENGINE_PROFILE_ENV.
+ENGINE_PROFILES = {
+    'development': {
+        'pool_size': 5, 'max_overflow': 5, 'pool_timeout': 30, 'pool_recycle': 1800, 'pool_pre_ping': True,
+        'statement_timeout_ms': 30000, 'connect_timeout': 10,
+        'sqlite_journal_mode': 'WAL', 'sqlite_synchronous': 'NORMAL', 'sqlite_busy_timeout_ms': 5000,
+    },
+    'production': {
+        # Render's Postgres drops idle connections; recycle well before that and ping on checkout
+        'pool_size': 10, 'max_overflow': 10, 'pool_timeout': 10, 'pool_recycle': 300, 'pool_pre_ping': True,
+        'statement_timeout_ms': 15000, 'connect_timeout': 5,
+        'sqlite_journal_mode': 'WAL', 'sqlite_synchronous': 'NORMAL', 'sqlite_busy_timeout_ms': 5000,
+    },
+    'testing': {
+        'pool_size': 2, 'max_overflow': 2, 'pool_timeout': 5, 'pool_recycle': -1, 'pool_pre_ping': False,
+        'statement_timeout_ms': 5000, 'connect_timeout': 5,
+        'sqlite_journal_mode': 'WAL', 'sqlite_synchronous': 'OFF', 'sqlite_busy_timeout_ms': 1000,
+    },
+}
+
+ENGINE_PROFILE_ENV = {
+    'pool_size': ('DB_POOL_SIZE', int),
+    'max_overflow': ('DB_MAX_OVERFLOW', int),
+    'pool_timeout': ('DB_POOL_TIMEOUT', float),  # seconds to wait for a free connection
+    'pool_recycle': ('DB_POOL_RECYCLE', int),  # seconds before a connection is replaced, -1 = never
+    'pool_pre_ping': ('DB_POOL_PRE_PING', lambda value: value.lower() in ('1', 'true', 'yes')),
+    'statement_timeout_ms': ('DB_STATEMENT_TIMEOUT_MS', int),  # PostgreSQL only, 0 = none
+    'connect_timeout': ('DB_CONNECT_TIMEOUT', int),  # PostgreSQL only, seconds
+    'sqlite_journal_mode': ('SQLITE_JOURNAL_MODE', str.upper),
+    'sqlite_synchronous': ('SQLITE_SYNCHRONOUS', str.upper),
+    'sqlite_busy_timeout_ms': ('SQLITE_BUSY_TIMEOUT_MS', int),  # how long a write waits for the lock
+}
+
+
+def engine_profile(name):
+    """The named engine profile with environment overrides applied."""
+    profile = dict(ENGINE_PROFILES[name])
+    for key, (variable, cast) in ENGINE_PROFILE_ENV.items():
+        value = os.environ.get(variable)
+        if value not in (None, ''):
+            profile[key] = cast(value)
+    return profile
+
+
+def engine_options(database_url, profile):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for a profile. SQLite pragmas are set on each
+    new connection by app.utils.database.
+    """
+    if database_url.startswith('sqlite'):
+        # Flask-SQLAlchemy picks the pool (StaticPool for :memory:); only the lock wait applies here
+        return {'connect_args': {'timeout': profile['sqlite_busy_timeout_ms'] / 1000}}
+
+    options = {key: profile[key] for key in ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle', 'pool_pre_ping')}
+    if database_url.startswith('postgresql'):
+        connect_args = {'connect_timeout': profile['connect_timeout']}
+        if profile['statement_timeout_ms']:
+            connect_args['options'] = f"-c statement_timeout={profile['statement_timeout_ms']}"
+        options['connect_args'] = connect_args
+    return options
+
+
+def replica_binds(replica_url, profile):
+    """SQLALCHEMY_BINDS with the replica; binds do not inherit SQLALCHEMY_ENGINE_OPTIONS."""
+    if not replica_url:
+        return {}
+    return {'replica': {'url': replica_url, **engine_options(replica_url, profile)}}
+
+
+class DevelopmentConfig(Config):
+    DB_PROFILE = 'development'
+    DB_ENGINE_PROFILE = engine_profile(DB_PROFILE)
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(Config.SQLALCHEMY_DATABASE_URI, DB_ENGINE_PROFILE)
+    SQLALCHEMY_BINDS = replica_binds(Config.DATABASE_REPLICA_URL, DB_ENGINE_PROFILE)
+
+
+class ProductionConfig(Config):
+    AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED', 'true').lower() in ('1', 'true', 'yes')
+    METRICS_TOKEN_REQUIRED = os.environ.get('METRICS_TOKEN_REQUIRED', 'true').lower() in ('1', 'true', 'yes')
+    DB_PROFILE = 'production'
+    DB_ENGINE_PROFILE = engine_profile(DB_PROFILE)
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(Config.SQLALCHEMY_DATABASE_URI, DB_ENGINE_PROFILE)
+    SQLALCHEMY_BINDS = replica_binds(Config.DATABASE_REPLICA_URL, DB_ENGINE_PROFILE)
+
+
+class TestingConfig(Config):
+    TESTING = True
+    DB_PROFILE = 'testing'
+    DB_ENGINE_PROFILE = engine_profile(DB_PROFILE)
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(Config.SQLALCHEMY_DATABASE_URI, DB_ENGINE_PROFILE)
+    SQLALCHEMY_BINDS = replica_binds(Config.DATABASE_REPLICA_URL, DB_ENGINE_PROFILE)
+
+
+# FLASK_CONFIG -> settings class (create_app(config_name))
+config_by_name = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
@@ -0,0 +1,94 @@
+# server/gunicorn.conf.py
+"""
+Gunicorn settings: ``gunicorn -c gunicorn.conf.py run:app``.
+
+/api/chat and /api/waste-scanner/upload spend almost all of their time
+waiting on OpenAI. A sync worker holds a whole process for each of those
+waits, so a handful of slow model calls takes the service offline. The
+default worker class here is gevent: the worker monkey-patches sockets,
+``time.sleep``, locks and threads before the app is imported, so the
+gateway's HTTP calls, retries, concurrency slots, streaming responses and
+the vision hedging pool all yield while they wait, and one worker serves
+up to ``GUNICORN_WORKER_CONNECTIONS`` requests at once. No view changes:
+CPU-bound routes (image variants, search) run as before, but hold their
+worker's event loop while they compute, so keep ``WEB_CONCURRENCY`` at
+about one worker per core. Password hashing already runs in a process
+pool (``PASSWORD_HASH_WORKERS``) and waits for it cooperatively.
+
+Environment:
+
+    PORT                          listen port (default 5000)
+    WEB_CONCURRENCY               worker processes (default 2)
+    GUNICORN_WORKER_CLASS         gevent (default), gthread or sync
+    GUNICORN_WORKER_CONNECTIONS   concurrent requests per gevent worker (default 100)
+    GUNICORN_THREADS              threads per gthread worker (default 8)
+    GUNICORN_TIMEOUT              seconds before a silent worker is restarted (default 60)
+
+Under gevent the per-process AI limits default to the connection count
+instead of their thread-sized defaults (``AI_MAX_CONCURRENCY``,
+``AI_POOL_SIZE``, ``VISION_MAX_WORKERS``; explicit values win), and
+psycopg2 is made cooperative with psycogreen so a slow query does not stall
+the other requests of its worker.
+
+Workers leave their /metrics counts in ``METRICS_DIR`` (default: a
+``greennexus-metrics`` directory under the system temp dir), which the
+master empties when it starts, and any worker serves the sum.
+
+``python bench_serving.py`` compares the worker classes on concurrent chat
+requests.
+"""
+import glob
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger('gunicorn.error')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+threads = int(os.environ.get('GUNICORN_THREADS', 8)) if worker_class == 'gthread' else 1
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+if worker_class == 'gevent':
+    try:
+        import gevent  # noqa: F401
+    except ImportError:
+        logger.warning("gevent is not installed, falling back to the gthread worker")
+        worker_class = 'gthread'
+        threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Workers inherit it; see app.utils.metrics
+metrics_dir = os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'greennexus-metrics'))
+
+if worker_class == 'gevent':
+    # Workers inherit these; the gateway and vision client read them on first use
+    for name in ('AI_MAX_CONCURRENCY', 'AI_POOL_SIZE', 'VISION_MAX_WORKERS'):
+        os.environ.setdefault(name, str(worker_connections))
+
+
+def on_starting(server):
+    """Forget the counts of the previous run; /metrics starts from zero like a restarted process."""
+    for path in glob.glob(os.path.join(metrics_dir, '*.json*')):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def post_fork(server, worker):
+    """Runs in the new worker before gevent patches it."""
+    if worker_class != 'gevent':
+        return
+    # httpcore imports trio when it is installed, and trio needs select.epoll,
+    # which the patch removes; sockets are looked up at call time, so they still yield
+    import httpx  # noqa: F401
+
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        return  # SQLite, or psycopg2 queries block the worker while they run
+    patch_psycopg()
@@ -1,10 +1,9 @@
 # server/manage.py
 from flask.cli import FlaskGroup
-from app import create_app, db
+from app import create_app
 
-app = create_app()
-
-cli = FlaskGroup(app)
+# The app is built by the CLI when a command needs it, so `--help` stays fast
+cli = FlaskGroup(create_app=create_app)
 
 if __name__ == '__main__':
     cli()
@@ -0,0 +1,91 @@
+"""Scan storage columns, scan indexes and the tables added since init_db.py
+
+Databases created by the original ``init_db.py`` have users, activities,
+products and waste_items only. This revision brings any database, empty or
+old, to the current models, and is safe to run against one that
+``db.create_all()`` already built:
+
+* creates the missing tables (failed scans, chat cache, AI usage counters
+  and events), and all of them on an empty database
+* adds ``waste_items.storage_key`` and ``waste_items.content_hash``
+* creates the keyset pagination indexes on waste_items
+* creates the full-text index (FTS5 on SQLite, tsvector + GIN on
+  PostgreSQL) and indexes the existing scans
+
+Revision ID: 3f9c1a7d2b60
+Revises:
+Create Date: 2026-10-19 10:12:41.508213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c1a7d2b60'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+WASTE_ITEM_COLUMNS = (
+    ('storage_key', sa.String(length=255)),
+    ('content_hash', sa.String(length=64)),
+)
+
+WASTE_ITEM_INDEXES = (
+    ('ix_waste_items_created_at_id', ['created_at', 'id']),
+    ('ix_waste_items_user_created_at', ['user_id', 'created_at', 'id']),
+    ('ix_waste_items_waste_type_created_at', ['waste_type', 'created_at']),
+    ('ix_waste_items_recyclability_created_at', ['recyclability', 'created_at']),
+)
+
+
+def upgrade():
+    from app.services.search_service import create_search_index
+
+    bind = op.get_bind()
+    had_waste_items = sa.inspect(bind).has_table('waste_items')
+
+    # New tables come from the models; a new waste_items gets its columns,
+    # indexes and full-text index from its own definition
+    current_app.extensions['migrate'].db.metadata.create_all(bind, checkfirst=True)
+    if not had_waste_items:
+        return
+
+    inspector = sa.inspect(bind)
+    columns = {column['name'] for column in inspector.get_columns('waste_items')}
+    for name, type_ in WASTE_ITEM_COLUMNS:
+        if name not in columns:
+            op.add_column('waste_items', sa.Column(name, type_, nullable=True))
+
+    indexes = {index['name'] for index in inspector.get_indexes('waste_items')}
+    for name, columns in WASTE_ITEM_INDEXES:
+        if name not in indexes:
+            op.create_index(name, 'waste_items', columns)
+
+    had_fts = bind.dialect.name == 'sqlite' and inspector.has_table('waste_items_fts')
+    create_search_index(bind)
+    if bind.dialect.name == 'sqlite' and not had_fts and sa.inspect(bind).has_table('waste_items_fts'):
+        # PostgreSQL's generated column fills itself; the FTS5 table starts empty
+        bind.exec_driver_sql("INSERT INTO waste_items_fts(waste_items_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    # The added tables and the full-text index stay; nothing at the base revision reads them
+    from app.services.search_service import create_search_index
+
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    indexes = {index['name'] for index in inspector.get_indexes('waste_items')}
+    for name, _ in WASTE_ITEM_INDEXES:
+        if name in indexes:
+            op.drop_index(name, table_name='waste_items')
+
+    columns = {column['name'] for column in inspector.get_columns('waste_items')}
+    with op.batch_alter_table('waste_items') as batch_op:
+        for name, _ in WASTE_ITEM_COLUMNS:
+            if name in columns:
+                batch_op.drop_column(name)
+    # SQLite rebuilds the table to drop a column, which drops its full-text triggers
+    create_search_index(bind)
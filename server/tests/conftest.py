@@ -0,0 +1,41 @@
+# server/tests/conftest.py
+"""
+A Flask app on a throwaway SQLite database, with the tables created fresh
+for each test that asks for ``app`` or ``client``.
+"""
+import os
+import tempfile
+
+import pytest
+
+# config.py reads the environment when it is first imported
+_tmp = tempfile.mkdtemp(prefix='greennexus-tests-')
+os.environ['DATABASE_URL'] = f'sqlite:///{_tmp}/test.db'
+os.environ['UPLOAD_FOLDER'] = os.path.join(_tmp, 'uploads')
+os.environ.pop('DATABASE_REPLICA_URL', None)
+os.environ.setdefault('OPENAI_API_KEY', 'sk-test')
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+
+@pytest.fixture(scope='session')
+def _app():
+    from app import create_app
+    return create_app('testing')
+
+
+@pytest.fixture
+def app(_app):
+    from app import db
+
+    with _app.app_context():
+        db.create_all()
+        yield _app
+        db.session.remove()
+        db.drop_all()
+    _app.extensions.pop('admission', None)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,201 @@
+# server/tests/test_ai_gateway.py
+"""
+AIGateway against a local stub of the OpenAI API (``http.server``): retries
+with Retry-After, the per-call deadline, and the circuit breaker.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+import pytest
+
+from app.services import ai_gateway
+from app.services.ai_gateway import AIGateway, AIGatewayTimeout, CircuitBreaker, CircuitOpenError
+
+COMPLETION = {
+    'id': 'chatcmpl-stub',
+    'object': 'chat.completion',
+    'created': 0,
+    'model': 'gpt-4o-mini',
+    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': 'ok'}, 'finish_reason': 'stop'}],
+    'usage': {'prompt_tokens': 3, 'completion_tokens': 1, 'total_tokens': 4},
+}
+
+
+class StubOpenAI:
+    """Answers POST /v1/chat/completions with scripted responses, then 200s."""
+
+    def __init__(self):
+        self.script = []
+        self.requests = []  # monotonic arrival times
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with stub.lock:
+                    stub.requests.append(time.monotonic())
+                    status, headers, delay = stub.script.pop(0) if stub.script else (200, {}, 0)
+                time.sleep(delay)
+                body = COMPLETION if status == 200 else {'error': {'message': f'stub {status}', 'type': 'stub'}}
+                payload = json.dumps(body).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(payload)))
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except OSError:
+                    pass  # the client gave up (deadline tests)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}/v1'
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def respond(self, *responses):
+        """Queue ``(status, headers, delay_seconds)`` tuples for the next requests."""
+        self.script.extend(responses)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubOpenAI()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def make_gateway(stub):
+    gateways = []
+
+    def factory(**options):
+        settings = dict(api_key='sk-test', base_url=stub.base_url, timeout=10.0, max_retries=2,
+                        backoff_base=0.05, backoff_max=5.0)
+        settings.update(options)
+        gateway = AIGateway(**settings)
+        gateways.append(gateway)
+        return gateway
+
+    yield factory
+    for gateway in gateways:
+        gateway.close()
+
+
+def chat(gateway, **kwargs):
+    return gateway.chat_completion(model='gpt-4o-mini', messages=[{'role': 'user', 'content': 'hi'}], **kwargs)
+
+
+def gaps(times):
+    return [later - earlier for earlier, later in zip(times, times[1:])]
+
+
+def test_retries_429_and_5xx_after_retry_after(stub, make_gateway, monkeypatch):
+    # Jittered backoff would wait the full backoff_max; only Retry-After makes this fast
+    monkeypatch.setattr(ai_gateway.random, 'uniform', lambda low, high: high)
+    stub.respond((429, {'Retry-After': '0.3'}, 0), (503, {'Retry-After': '0.2'}, 0))
+    gateway = make_gateway(backoff_base=5.0)
+
+    response = chat(gateway)
+
+    assert response.choices[0].message.content == 'ok'
+    assert len(stub.requests) == 3
+    first, second = gaps(stub.requests)
+    assert 0.3 <= first < 1.0
+    assert 0.2 <= second < 1.0
+    assert gateway.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_retries_stop_after_max_retries(stub, make_gateway):
+    stub.respond(*[(502, {'Retry-After': '0'}, 0)] * 3)
+    gateway = make_gateway(max_retries=1)
+
+    with pytest.raises(openai.APIStatusError) as error:
+        chat(gateway)
+
+    assert error.value.status_code == 502
+    assert len(stub.requests) == 2
+
+
+def test_client_errors_are_not_retried(stub, make_gateway):
+    stub.respond((400, {}, 0))
+    gateway = make_gateway()
+
+    with pytest.raises(openai.BadRequestError):
+        chat(gateway)
+
+    assert len(stub.requests) == 1
+    assert gateway.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_deadline_cuts_a_slow_call_short(stub, make_gateway):
+    stub.respond((200, {}, 3.0))
+    gateway = make_gateway()
+
+    started = time.monotonic()
+    with pytest.raises((AIGatewayTimeout, openai.APITimeoutError)):
+        chat(gateway, deadline=0.5)
+
+    assert time.monotonic() - started < 1.5
+    assert len(stub.requests) == 1
+
+
+def test_retry_after_beyond_the_deadline_is_not_waited_for(stub, make_gateway):
+    stub.respond((503, {'Retry-After': '4'}, 0))
+    gateway = make_gateway()
+
+    started = time.monotonic()
+    with pytest.raises(openai.APIStatusError):
+        chat(gateway, deadline=1.0)
+
+    assert time.monotonic() - started < 0.5
+    assert len(stub.requests) == 1
+
+
+def test_circuit_opens_then_closes_after_a_successful_trial(stub, make_gateway):
+    stub.respond((500, {}, 0), (500, {}, 0))
+    gateway = make_gateway(max_retries=0, circuit_failures=2, circuit_reset=0.3)
+
+    for _ in range(2):
+        with pytest.raises(openai.InternalServerError):
+            chat(gateway)
+    assert gateway.breaker.state == CircuitBreaker.OPEN
+
+    # Open: fail fast without reaching the provider
+    with pytest.raises(CircuitOpenError):
+        chat(gateway)
+    assert len(stub.requests) == 2
+
+    time.sleep(0.35)
+    assert gateway.breaker.state == CircuitBreaker.HALF_OPEN
+    assert chat(gateway).choices[0].message.content == 'ok'
+    assert gateway.breaker.state == CircuitBreaker.CLOSED
+    assert len(stub.requests) == 3
+
+
+def test_failed_trial_reopens_the_circuit(stub, make_gateway):
+    stub.respond((500, {}, 0), (500, {}, 0))
+    gateway = make_gateway(max_retries=0, circuit_failures=1, circuit_reset=0.2)
+
+    with pytest.raises(openai.InternalServerError):
+        chat(gateway)
+    time.sleep(0.25)
+    with pytest.raises(openai.InternalServerError):
+        chat(gateway)
+
+    assert gateway.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        chat(gateway)
+    assert len(stub.requests) == 2
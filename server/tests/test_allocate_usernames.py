@@ -0,0 +1,67 @@
+# server/tests/test_allocate_usernames.py
+"""
+allocate_usernames: which taken usernames count as suffixes of a base, and
+the suffixes handed out to a batch.
+"""
+import pytest
+
+from app.services.auth_service import allocate_usernames
+
+
+@pytest.fixture
+def taken(app):
+    from app import db
+    from app.models.user import User
+
+    def add(*usernames):
+        for username in usernames:
+            db.session.add(User(username=username, email=f'{username}@example.com', password_hash='x'))
+        db.session.commit()
+    return add
+
+
+def test_free_base_is_used_as_is(taken):
+    taken('jane')
+    assert allocate_usernames(['John Doe']) == ['john_doe']
+
+
+def test_next_suffix_after_the_highest_in_use(taken):
+    taken('john', 'john1', 'john7')
+    assert allocate_usernames(['John']) == ['john8']
+
+
+def test_bare_base_taken_starts_at_one(taken):
+    taken('john')
+    assert allocate_usernames(['john']) == ['john1']
+
+
+def test_suffix_without_the_bare_base(taken):
+    taken('john3')
+    assert allocate_usernames(['john']) == ['john4']
+
+
+def test_digits_in_the_base_are_not_a_suffix(taken):
+    # "john12" is base "john" with suffix 12, and base "john1" with suffix 2
+    taken('john12')
+    assert allocate_usernames(['john', 'john1', 'john12']) == ['john13', 'john13', 'john121']
+
+
+def test_other_names_with_the_same_prefix_are_ignored(taken):
+    taken('johnny', 'john_doe', 'johnx5')
+    assert allocate_usernames(['john']) == ['john']
+
+
+def test_like_wildcards_in_the_base_are_literal(taken):
+    # "_" matches any character in LIKE: "a_b" must not see "axb2"
+    taken('axb2', 'a_b')
+    assert allocate_usernames(['a b']) == ['a_b1']
+
+
+def test_leading_zeros_count_as_their_value(taken):
+    taken('john007')
+    assert allocate_usernames(['john']) == ['john8']
+
+
+def test_one_batch_gets_consecutive_suffixes(taken):
+    taken('maria', 'maria2')
+    assert allocate_usernames(['Maria', 'maria', 'Bob', 'bob', '!!!']) == ['maria3', 'maria4', 'bob', 'bob1', 'user']
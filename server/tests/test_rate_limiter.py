@@ -0,0 +1,149 @@
+# server/tests/test_rate_limiter.py
+"""
+AdmissionController: token bucket refill and drain, the daily budget
+rolling over at midnight UTC, the 429 with Retry-After, and the deletion
+of past days' ``ai_usage_counters`` rows.
+"""
+from datetime import date, timedelta
+
+import pytest
+
+from app.services import rate_limiter
+from app.services.rate_limiter import AdmissionController, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def today(monkeypatch):
+    days = [date(2026, 3, 14)]
+    monkeypatch.setattr(rate_limiter, '_today', lambda: days[0])
+    return days
+
+
+def test_bucket_refills_at_its_rate(clock):
+    bucket = TokenBucket(capacity=2, rate=1.0)
+
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    assert bucket.take() == pytest.approx(1.0)
+
+    clock.now += 0.5
+    assert bucket.take() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.take() == 0
+
+    # Never holds more than its capacity
+    clock.now += 60
+    assert [bucket.take() for _ in range(3)][:2] == [0, 0]
+
+
+def test_drain_spends_other_workers_tokens_up_to_one_bucket_of_debt(clock):
+    bucket = TokenBucket(capacity=2, rate=1.0)
+
+    bucket.drain(1)
+    assert bucket.take() == 0
+    assert bucket.take() == pytest.approx(1.0)
+
+    bucket.drain(100)
+    assert bucket.tokens == -2
+    assert bucket.take() == pytest.approx(3.0)
+
+
+def test_rate_limit_is_per_client_and_endpoint(clock, today):
+    controller = AdmissionController({'chat': (60, 1), 'upload': (60, 1)}, persist=False)
+
+    assert controller.admit('chat', 'user:1') is None
+    message, retry_after = controller.admit('chat', 'user:1')
+    assert message == 'Too many requests'
+    assert retry_after == 1
+
+    assert controller.admit('chat', 'user:2') is None
+    assert controller.admit('upload', 'user:1') is None
+    assert controller.stats['rate_limited'] == 1
+
+
+def test_daily_budget_rolls_over_at_midnight(today):
+    controller = AdmissionController({'chat': (0, 0)}, token_budget=100, cost_budget=0.5, persist=False)
+
+    controller.record_usage('user:1', 'chat', 60, 0.01)
+    assert controller.admit('chat', 'user:1') is None
+    controller.record_usage('user:1', 'chat', 40, 0.01)
+    message, retry_after = controller.admit('chat', 'user:1')
+    assert message == 'Daily AI budget exhausted'
+    assert 1 <= retry_after <= 24 * 3600
+    assert controller.admit('chat', 'user:2') is None
+
+    # The cost budget counts too, synced or not
+    controller.record_usage('user:2', 'chat', 0, 0.5)
+    controller.sync()
+    assert controller.admit('chat', 'user:2') is not None
+
+    today[0] += timedelta(days=1)
+    assert controller.admit('chat', 'user:1') is None
+    assert controller.admit('chat', 'user:2') is None
+    controller.sync()
+    assert all(day == today[0] for _, _, day in controller._synced)
+
+
+def test_over_the_limit_gets_429_with_retry_after(client, app, clock):
+    controller = app.extensions['admission'] = AdmissionController({'chat': (2, 1)}, persist=False)
+    assert controller.admit('chat', 'ip:127.0.0.1') is None
+
+    response = client.post('/api/chat', json={'message': 'hi'})
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '30'
+    assert response.get_json() == {'error': 'Too many requests', 'retry_after': 30}
+
+
+def test_over_the_budget_gets_429_until_midnight(client, app, today):
+    controller = app.extensions['admission'] = AdmissionController({'chat': (0, 0)}, token_budget=10, persist=False)
+    controller.record_usage('ip:127.0.0.1', 'chat', 10, 0.0)
+
+    response = client.post('/api/chat', json={'message': 'hi'})
+
+    assert response.status_code == 429
+    assert response.get_json()['error'] == 'Daily AI budget exhausted'
+    assert int(response.headers['Retry-After']) == response.get_json()['retry_after'] > 0
+
+
+def test_sync_shares_counts_and_deletes_past_days(app, today):
+    from app import db
+    from app.models.usage_counter import UsageCounter
+
+    for days_ago in (0, 1, 2, 30):
+        db.session.add(UsageCounter(subject='user:9', endpoint='chat', day=today[0] - timedelta(days=days_ago),
+                                    requests=1, tokens=5, cost_usd=0.0))
+    db.session.commit()
+
+    controller = AdmissionController({'chat': (0, 0)}, token_budget=100)
+    controller.record_usage('user:1', 'chat', 7, 0.0)
+    assert controller.sync()
+
+    rows = UsageCounter.query.order_by(UsageCounter.day).all()
+    assert [(row.subject, today[0] - row.day) for row in rows] == [
+        ('user:9', timedelta(days=1)), ('user:9', timedelta(0)), ('user:1', timedelta(0))
+    ]
+    assert controller.stats['counters_pruned'] == 2
+    assert controller.usage_today('user:9') == (5, 0.0)
+
+    # Once a day per worker
+    db.session.add(UsageCounter(subject='user:9', endpoint='chat', day=today[0] - timedelta(days=5),
+                                requests=1, tokens=5, cost_usd=0.0))
+    db.session.commit()
+    controller.sync()
+    assert UsageCounter.query.count() == 4
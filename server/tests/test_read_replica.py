@@ -0,0 +1,99 @@
+# server/tests/test_read_replica.py
+"""
+RoutingSession.get_bind: which statements of a request that may read from
+the replica go there, and the read-your-writes deadline clients send back.
+"""
+import time
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, delete, insert, select, update
+
+from app.utils import database
+from app.utils.database import ReplicaMonitor, RoutingSession, primary
+
+
+@pytest.fixture
+def replica(app):
+    engine = create_engine('sqlite://')
+    token = database._read_engine.set(engine)
+    yield engine
+    database._read_engine.reset(token)
+    engine.dispose()
+
+
+@pytest.fixture
+def session(app):
+    from app import db
+
+    session = db.session()
+    assert isinstance(session, RoutingSession)
+    return session
+
+
+def users_table():
+    from app.models.user import User
+    return User.__table__
+
+
+def test_without_a_replica_everything_goes_to_the_primary(session):
+    from app import db
+
+    assert session.get_bind(clause=select(users_table())) is db.engine
+    session.get_bind(clause=insert(users_table()))
+    assert not session.wrote
+
+
+def test_selects_go_to_the_replica(session, replica):
+    from app.models.user import User
+
+    assert session.get_bind(clause=select(users_table())) is replica
+    assert session.get_bind(mapper=User, clause=select(User)) is replica
+
+
+def test_writes_go_to_the_primary_and_pin_the_session(session, replica):
+    from app import db
+
+    for statement in (insert(users_table()), update(users_table()), delete(users_table())):
+        assert session.get_bind(clause=statement) is db.engine
+    assert session.wrote
+
+    # Read your own writes
+    assert session.get_bind(clause=select(users_table())) is db.engine
+
+
+def test_a_flush_reads_from_the_primary(session, replica, monkeypatch):
+    from app import db
+
+    monkeypatch.setattr(session, '_flushing', True)
+    assert session.get_bind(clause=select(users_table())) is db.engine
+
+
+def test_explicit_bind_and_tables_of_other_binds_are_not_rerouted(session, replica):
+    from app import db
+
+    assert session.get_bind(clause=select(users_table()), bind=db.engine) is db.engine
+
+    other = Table('audit', MetaData(info={'bind_key': 'audit'}), Column('id', Integer, primary_key=True))
+    assert database._has_bind_key(None, select(other))
+    assert not database._has_bind_key(None, select(users_table()))
+
+
+def test_primary_block_reads_from_the_primary(session, replica):
+    from app import db
+
+    with primary():
+        assert session.get_bind(clause=select(users_table())) is db.engine
+    assert session.get_bind(clause=select(users_table())) is replica
+
+
+@pytest.mark.parametrize('offset, sticky', [(5, True), (-1, False), (60, False)])
+def test_echoed_write_deadline(app, offset, sticky):
+    monitor = ReplicaMonitor(sticky_seconds=10)
+    headers = {database.PRIMARY_UNTIL_HEADER: f'{time.time() + offset:.3f}'}
+    with app.test_request_context('/', headers=headers):
+        assert database._echoed_write(monitor) is sticky
+
+
+def test_unparsable_deadline_is_ignored(app):
+    with app.test_request_context('/', headers={database.PRIMARY_UNTIL_HEADER: 'soon'}):
+        assert not database._echoed_write(ReplicaMonitor())
@@ -0,0 +1,51 @@
+# server/tests/test_scan_history.py
+"""
+GET /api/waste-scanner/results: the from/to date range and the user_id
+the caller may name.
+"""
+from datetime import datetime
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+
+@pytest.fixture
+def scans(app):
+    from app import db
+    from app.models.user import User
+    from app.models.waste_item import WasteItem
+
+    user = User(username='scanner', email='scanner@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    for created_at in ('2025-02-28T23:59:00', '2025-03-01T00:00:00', '2025-03-01T18:30:00', '2025-03-02T00:00:00'):
+        db.session.add(WasteItem(filename='x.png', filepath='x.png', user_id=user.id,
+                                 created_at=datetime.fromisoformat(created_at)))
+    db.session.commit()
+    return {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+
+
+def created(response):
+    assert response.status_code == 200, response.get_json()
+    return sorted(item['created_at'][:16] for item in response.get_json()['data'])
+
+
+def test_date_only_to_includes_the_whole_day(client, scans):
+    response = client.get('/api/waste-scanner/results?from=2025-03-01&to=2025-03-01', headers=scans)
+    assert created(response) == ['2025-03-01T00:00', '2025-03-01T18:30']
+
+
+def test_datetime_to_is_exclusive(client, scans):
+    response = client.get('/api/waste-scanner/results?to=2025-03-01T18:30:00', headers=scans)
+    assert created(response) == ['2025-02-28T23:59', '2025-03-01T00:00']
+
+
+def test_invalid_date_is_a_bad_request(client, scans):
+    assert client.get('/api/waste-scanner/results?to=yesterday', headers=scans).status_code == 400
+
+
+def test_non_integer_user_id_is_a_bad_request(client, scans, app, monkeypatch):
+    # Not read as "no user": that would list every user's scans
+    monkeypatch.setitem(app.config, 'AUTH_REQUIRED', False)
+    assert client.get('/api/waste-scanner/results?user_id=me').status_code == 400
+    assert client.get('/api/waste-scanner/results?user_id=me', headers=scans).status_code == 400
@@ -0,0 +1,78 @@
+# server/tests/test_user_required.py
+"""
+user_required: the user_id a request names (path, query string or JSON
+body) against the caller's verified token, with AUTH_REQUIRED on and off.
+"""
+from datetime import timedelta
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+
+@pytest.fixture
+def users(app):
+    from app import db
+    from app.models.user import User
+
+    users = [User(username=f'user{n}', email=f'user{n}@example.com', password_hash='x') for n in (1, 2)]
+    db.session.add_all(users)
+    db.session.commit()
+    return [user.id for user in users]
+
+
+@pytest.fixture
+def auth_required(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'AUTH_REQUIRED', True)
+
+
+def bearer(user_id, **options):
+    return {'Authorization': f'Bearer {create_access_token(identity=str(user_id), **options)}'}
+
+
+def test_own_user_id_is_served(client, users, auth_required):
+    assert client.get(f'/api/activities/{users[0]}', headers=bearer(users[0])).status_code == 200
+
+
+def test_another_users_id_is_forbidden(client, users):
+    mine, theirs = users
+    assert client.get(f'/api/activities/{theirs}', headers=bearer(mine)).status_code == 403
+    assert client.get(f'/api/waste-scanner/recent?user_id={theirs}', headers=bearer(mine)).status_code == 403
+
+    response = client.post('/api/activities/log', json={'user_id': theirs, 'activity_type': 'cycling'},
+                           headers=bearer(mine))
+    assert response.status_code == 403
+
+
+def test_query_user_id_defaults_to_the_caller(client, users, auth_required):
+    response = client.get('/api/waste-scanner/recent', headers=bearer(users[0]))
+    assert response.status_code == 200
+
+
+def test_non_integer_user_id_is_a_bad_request(client, users):
+    response = client.get('/api/waste-scanner/recent?user_id=abc', headers=bearer(users[0]))
+    assert response.status_code == 400
+    assert client.get('/api/waste-scanner/recent?user_id=abc').status_code == 400
+
+
+def test_invalid_or_expired_token_is_unauthorized(client, users):
+    assert client.get(f'/api/activities/{users[0]}',
+                      headers={'Authorization': 'Bearer not-a-token'}).status_code == 401
+    expired = bearer(users[0], expires_delta=timedelta(seconds=-1))
+    assert client.get(f'/api/activities/{users[0]}', headers=expired).status_code == 401
+
+
+def test_no_token_needs_one_when_auth_is_required(client, users, auth_required):
+    assert client.get(f'/api/activities/{users[0]}').status_code == 401
+    assert client.get(f'/api/waste-scanner/recent?user_id={users[0]}').status_code == 401
+
+
+def test_no_token_is_served_for_the_named_user_while_auth_is_off(client, users, monkeypatch, app):
+    monkeypatch.setitem(app.config, 'AUTH_REQUIRED', False)
+    assert client.get(f'/api/activities/{users[0]}').status_code == 200
+
+
+def test_strict_views_need_a_token_even_while_auth_is_off(client, users, monkeypatch, app):
+    monkeypatch.setitem(app.config, 'AUTH_REQUIRED', False)
+    assert client.get(f'/api/dashboard/{users[0]}').status_code == 401
+    assert client.get(f'/api/dashboard/{users[0]}', headers=bearer(users[0])).status_code == 200
+    assert client.get(f'/api/dashboard/{users[1]}', headers=bearer(users[0])).status_code == 403